@@ -43,6 +43,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'lib_mgmt.middleware.QueryMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -87,6 +88,15 @@ DATABASES = {
     }
 }
 
+# 本地开发和跑测试时可以用 DJANGO_DB=sqlite 切换到 SQLite，不需要 MySQL 服务
+if os.environ.get('DJANGO_DB') == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -107,6 +117,37 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# 密码哈希配置档，由 LIB_HASHER_PROFILE 选择：
+# default 为 Django 默认（PBKDF2-SHA256 390000 轮）；tuned 的迭代次数由 LIB_PBKDF2_ITERATIONS 指定（不低于 Django 默认值）；
+# argon2 需要安装 argon2-cffi。各档都保留其余哈希器用于校验旧密码，登录时按当前档重新哈希
+PASSWORD_HASHER_PROFILES = {
+    'default': [
+        'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+        'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+        'django.contrib.auth.hashers.Argon2PasswordHasher',
+        'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+        'django.contrib.auth.hashers.ScryptPasswordHasher',
+    ],
+    'tuned': [
+        'lib_mgmt.hashers.TunablePBKDF2PasswordHasher',
+        'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+        'django.contrib.auth.hashers.Argon2PasswordHasher',
+        'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+        'django.contrib.auth.hashers.ScryptPasswordHasher',
+    ],
+    'argon2': [
+        'django.contrib.auth.hashers.Argon2PasswordHasher',
+        'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+        'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+        'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+        'django.contrib.auth.hashers.ScryptPasswordHasher',
+    ],
+}
+PASSWORD_HASHER_PROFILE = os.environ.get('LIB_HASHER_PROFILE', 'default')
+PASSWORD_HASHERS = PASSWORD_HASHER_PROFILES[PASSWORD_HASHER_PROFILE]
+PASSWORD_PBKDF2_ITERATIONS = int(os.environ.get('LIB_PBKDF2_ITERATIONS', 0)) or None
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/4.1/topics/i18n/
 
@@ -119,6 +160,36 @@ USE_I18N = True
 USE_TZ = True
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+# 默认使用进程内缓存；多进程部署时设置 LIB_CACHE_BACKEND=file 让各进程共享缓存与版本号
+
+if os.environ.get('LIB_CACHE_BACKEND') == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('LIB_CACHE_DIR', os.path.join(BASE_DIR, '.cache')),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'lib-mgmt',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+# 各接口缓存的超时时间（秒）
+CACHE_TTLS = {
+    'categories': 300,
+    'top_borrowed_books': 60,
+    'user_center': 30,
+    'borrow_inv': 30,
+    'paginate_count': 60,
+}
+
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/4.1/howto/static-files/
 
@@ -129,4 +200,48 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-LOGIN_URL = '/auth/login/'
\ No newline at end of file
+LOGIN_URL = '/auth/login/'
+
+# 操作日志异步批量写入：缓冲满 BATCH_SIZE 条或每隔 FLUSH_INTERVAL 秒落库一次
+OPERATION_LOG_ASYNC = True
+OPERATION_LOG_BATCH_SIZE = 200
+OPERATION_LOG_FLUSH_INTERVAL = 1.0
+
+# 批量导入后台任务：线程数与上传文件暂存目录（None 为系统临时目录）
+IMPORT_JOBS_ASYNC = True
+IMPORT_JOB_WORKERS = 2
+IMPORT_JOB_DIR = None
+# 超过该秒数仍未结束的任务在轮询时标记为失败（进程重启等导致任务中断）
+IMPORT_JOB_TIMEOUT = 3600
+# 批量导入读者时哈希密码的进程数，None 为 CPU 核数
+PASSWORD_HASH_WORKERS = None
+
+# 请求级查询数与耗时统计，最近 QUERY_METRICS_BUFFER 个请求可在 /api/query_metrics/ 查看
+QUERY_METRICS_ENABLED = True
+QUERY_METRICS_BUFFER = 1000
+# 各视图（URL 名）的查询数上限，超出时记警告；QUERY_BUDGETS_STRICT 为 True 时直接抛异常，测试中打开
+QUERY_BUDGETS = {
+    'lib:user_center': 3,
+    'lib:user_borrow_records': 4,
+    'lib:user_borrow_search': 5,
+    'lib:user_borrow_inv': 4,
+    'lib:book_list': 6,
+    'lib:category_list': 4,
+    'lib:reader_list': 5,
+    'lib:inventory_list': 5,
+    'lib:borrow_record_list': 5,
+    'lib:operation_log_list': 5,
+    'lib:user_borrow_stats': 3,
+    'lib:top_borrowed_books': 3,
+    'lib:get_categories': 3,
+    'lib:get_books': 3,
+    'lib:import_job': 3,
+    'lib:autocomplete': 4,
+    'lib:export_data': 3,
+}
+QUERY_BUDGETS_STRICT = False
+
+# 输入联想索引的快照文件，由 build_autocomplete_snapshot 命令生成；None 或文件不存在时首次使用从数据库建立
+AUTOCOMPLETE_SNAPSHOT = os.environ.get('LIB_AUTOCOMPLETE_SNAPSHOT') or None
+# Web 进程（wsgi.py）启动时在后台线程建立输入联想索引，建好之前联想返回空结果
+AUTOCOMPLETE_WARM = True
@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'db_design.settings')
 
 application = get_wsgi_application()
+
+# 进程启动时在后台预热输入联想索引
+from django.conf import settings
+
+if settings.AUTOCOMPLETE_WARM:
+    from lib_mgmt.utils import autocomplete
+    autocomplete.warm()
@@ -0,0 +1 @@
+# 基准测试：data 生成可复现的合成图书馆数据，scenarios 测量各热点路径，由 bench 命令运行并输出 JSON
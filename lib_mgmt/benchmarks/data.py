@@ -0,0 +1,131 @@
+from ..models import Reader, Category, Book, Inventory, BorrowRecord, OperationLog
+from ..utils import rollup, search
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from datetime import date, timedelta
+import itertools
+import random
+
+CHUNK_SIZE = 5000
+LOAN_DAYS = 30
+# 基准测试读者的统一密码
+PASSWORD = 'bench-password'
+
+# 数据规模：分类数、图书数、每本书副本数、读者数、借阅历史年数、借阅记录数
+SCALES = {
+    'tiny': dict(categories=5, books=100, copies=2, readers=20, years=1, borrows=1000),
+    'small': dict(categories=50, books=2000, copies=3, readers=500, years=2, borrows=20000),
+    'medium': dict(categories=200, books=20000, copies=3, readers=5000, years=3, borrows=300000),
+    'large': dict(categories=500, books=200000, copies=3, readers=50000, years=5, borrows=10000000),
+}
+
+SUBJECTS = ['数据库', '操作系统', '计算机网络', '算法', '数据结构', '编译原理', '软件工程', '人工智能', '机器学习',
+            '线性代数', '概率论', '离散数学', '高等数学', '大学物理', '电路', '信号与系统', '经济学', '管理学',
+            'Python', 'Java', 'Linux', 'Web', 'SQL', 'Rust']
+SUFFIXES = ['概论', '原理', '基础', '导论', '实践', '教程', '设计与实现', '从入门到精通', '习题集', '(第3版)']
+SURNAMES = '王李张刘陈杨黄赵吴周徐孙马朱胡郭何高林罗'
+GIVEN_NAMES = ['珊', '伟', '芳', '娜', '敏', '静', '强', '磊', '洋', '勇', '军', '杰', '涛', '明', '超']
+PUBLISHERS = ['高等教育出版社', '清华大学出版社', '机械工业出版社', '人民邮电出版社', '电子工业出版社', "O'Reilly"]
+
+# 近似 Zipf 分布的累计权重：少数热门图书、活跃读者占大部分借阅
+def zipf_weights(n, s=1.1):
+    return list(itertools.accumulate(1 / (rank ** s) for rank in range(1, n + 1)))
+
+def chunks(iterable, size=CHUNK_SIZE):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+# 生成一座合成图书馆，同一 seed 生成的数据完全相同
+# 在借记录只落在最近一个借期内，每个副本至多一条，副本状态、图书计数、借阅日汇总与检索索引都与之一致
+def generate(seed=42, categories=50, books=2000, copies=3, readers=500, years=2, borrows=20000, today=None):
+    rng = random.Random(seed)
+    today = today or date.today()
+
+    Category.objects.bulk_create([Category(category_number=f'C{i:04d}', name=f'{rng.choice(SUBJECTS)}类{i}')
+                                  for i in range(categories)], batch_size=CHUNK_SIZE)
+    category_ids = list(Category.objects.order_by('id').values_list('id', flat=True))
+    category_weights = zipf_weights(len(category_ids), 0.8)
+
+    def book(i):
+        return Book(title=f'{rng.choice(SUBJECTS)}{rng.choice(SUFFIXES)}',
+                    author=rng.choice(SURNAMES) + rng.choice(GIVEN_NAMES),
+                    publisher=rng.choice(PUBLISHERS),
+                    publish_date=str(rng.randint(1990, today.year)),
+                    index_number=f'B{i:07d}',
+                    category_id=rng.choices(category_ids, cum_weights=category_weights)[0],
+                    total_copies=copies, available_copies=copies)
+    for chunk in chunks(book(i) for i in range(books)):
+        Book.objects.bulk_create(chunk)
+    book_ids = list(Book.objects.order_by('id').values_list('id', flat=True))
+    for chunk in chunks(Inventory(book_id=book_id, status=1, location=f'{rng.choice("ABCDEF")}{rng.randint(1, 30)}')
+                        for book_id in book_ids for _ in range(copies)):
+        Inventory.objects.bulk_create(chunk)
+    copy_ids = {}
+    for inv_id, book_id in Inventory.objects.order_by('id').values_list('id', 'book_id').iterator(chunk_size=CHUNK_SIZE):
+        copy_ids.setdefault(book_id, []).append(inv_id)
+
+    # 密码只哈希一次，所有读者共用
+    password = make_password(PASSWORD)
+    for chunk in chunks(User(username=f'reader{i}', password=password, email=f'reader{i}@example.com')
+                        for i in range(readers)):
+        User.objects.bulk_create(chunk)
+    user_ids = list(User.objects.filter(username__startswith='reader').order_by('id').values_list('id', flat=True))
+    for chunk in chunks(Reader(user_id=user_id, max_borrow_limit=5) for user_id in user_ids):
+        Reader.objects.bulk_create(chunk)
+    reader_ids = list(Reader.objects.order_by('id').values_list('id', flat=True))
+
+    # 借阅历史：图书与读者按 Zipf 分布抽样，借阅日在 years 年内均匀分布，工作日略多
+    # 历史记录全部已归还；最近一个借期内的部分记录保留为在借，受副本与读者配额约束
+    book_weights = zipf_weights(len(book_ids))
+    reader_weights = zipf_weights(len(reader_ids), 0.7)
+    rng.shuffle(book_ids)
+    span = years * 365
+    lent = set()
+    quota = {}
+
+    def record(i):
+        book_id = rng.choices(book_ids, cum_weights=book_weights)[0]
+        inv_id = rng.choice(copy_ids[book_id])
+        reader_id = rng.choices(reader_ids, cum_weights=reader_weights)[0]
+        borrow_date = today - timedelta(days=rng.randrange(span))
+        if borrow_date.weekday() >= 5 and rng.random() < 0.3:
+            borrow_date -= timedelta(days=2)
+        status = 0
+        if (today - borrow_date).days < LOAN_DAYS and inv_id not in lent and quota.get(reader_id, 0) < 5:
+            lent.add(inv_id)
+            quota[reader_id] = quota.get(reader_id, 0) + 1
+            status = 1
+        return BorrowRecord(reader_id=reader_id, inventory_id=inv_id, borrow_date=borrow_date,
+                            return_date=borrow_date + timedelta(days=LOAN_DAYS), status=status)
+    for chunk in chunks(record(i) for i in range(borrows)):
+        BorrowRecord.objects.bulk_create(chunk)
+    for chunk in chunks(lent):
+        Inventory.objects.filter(id__in=chunk).update(status=2)
+
+    on_loan = Inventory.objects.filter(book=OuterRef('pk'), status=1).order_by().values('book') \
+                               .annotate(count=Count('id')).values('count')
+    Book.objects.update(available_copies=Coalesce(Subquery(on_loan, output_field=IntegerField()), 0))
+    rollup.rebuild()
+    search.index_books(Book.objects.all())
+
+    for chunk in chunks(OperationLog(operation_type=rng.choice(['create', 'update', 'delete']),
+                                     content=f'update a Inventory instance: #{rng.randint(1, len(book_ids) * copies)}',
+                                     operator_id=rng.choice(user_ids))
+                        for i in range(max(borrows // 10, 100))):
+        OperationLog.objects.bulk_create(chunk)
+
+    return {
+        'categories': Category.objects.count(),
+        'books': Book.objects.count(),
+        'inventories': Inventory.objects.count(),
+        'readers': Reader.objects.count(),
+        'borrow_records': BorrowRecord.objects.count(),
+        'active_loans': len(lent),
+        'operation_logs': OperationLog.objects.count(),
+    }
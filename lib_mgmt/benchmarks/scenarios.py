@@ -0,0 +1,236 @@
+from ..models import Reader, Book, Inventory, BorrowRecord
+from ..utils import autocomplete, circulation, importer, metrics
+from ..utils.pagination import encode_cursor
+from . import data
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import Client, override_settings
+from datetime import date, timedelta
+import statistics
+import time
+
+# 场景注册表：名称 -> 函数(ctx, repeat)，返回 {用例名: 测量结果}
+SCENARIOS = {}
+
+def scenario(name):
+    def register(fn):
+        SCENARIOS[name] = fn
+        return fn
+    return register
+
+# 重复执行 op(i) 并统计耗时与查询数；每次执行前清空缓存，测的是实际的数据库开销
+# setup(i) 在计时之外执行，用于把数据恢复到执行前的状态
+def measure(op, repeat, setup=None, items=1):
+    times, queries = [], []
+    for i in range(repeat):
+        if setup:
+            setup(i)
+        cache.clear()
+        recorder = metrics.QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            started = time.perf_counter()
+            op(i)
+            times.append((time.perf_counter() - started) * 1000)
+        queries.append(recorder.count)
+    times.sort()
+    result = {
+        'runs': repeat,
+        'ms_min': round(times[0], 3),
+        'ms_median': round(statistics.median(times), 3),
+        'ms_p95': round(times[min(len(times) - 1, int(len(times) * 0.95))], 3),
+        'ms_max': round(times[-1], 3),
+        'queries_avg': round(sum(queries) / len(queries), 2),
+    }
+    # 批量操作额外给出每秒处理条数
+    if items > 1:
+        result['items_per_second'] = round(items / (statistics.median(times) / 1000), 1)
+    return result
+
+def make_context():
+    admin, created = User.objects.get_or_create(username='bench-admin', defaults={'is_staff': True})
+    Reader.objects.get_or_create(user=admin, defaults={'max_borrow_limit': 1000000})
+    admin_client = Client()
+    admin_client.force_login(admin)
+    reader = Reader.objects.select_related('user').order_by('id').first()
+    reader_client = Client()
+    reader_client.force_login(reader.user)
+    return {'admin': admin, 'admin_reader': admin.reader, 'admin_client': admin_client,
+            'reader': reader, 'reader_client': reader_client}
+
+def run(names, repeat=5):
+    ctx = make_context()
+    return {name: SCENARIOS[name](ctx, repeat) for name in names}
+
+@scenario('search')
+def search_scenario(ctx, repeat):
+    client = ctx['reader_client']
+    def post(data):
+        return lambda i: client.post('/user/search/', data)
+    return {
+        'single_term': measure(post({'books_keyword': '数据库'}), repeat),
+        'multi_term': measure(post({'books_keyword': '操作系统 原理 王'}), repeat),
+        'english_term': measure(post({'books_keyword': 'Python'}), repeat),
+        'index_number': measure(post({'books_keyword': 'B0000042'}), repeat),
+        'available_sorted': measure(post({'books_keyword': '数据库', 'sort': 'available', 'available_only': '1'}), repeat),
+    }
+
+@scenario('pagination')
+def pagination_scenario(ctx, repeat):
+    client = ctx['admin_client']
+    count = Book.objects.count()
+    last_page = max((count - 1) // 10 + 1, 1)
+    # 深处的游标直接由第 count-20 行构造，与一路翻过去得到的游标相同
+    deep = Book.objects.order_by('id').values_list('id', flat=True)[max(count - 20, 0)]
+    cursor = encode_cursor(deep, deep)
+    def post(data):
+        return lambda i: client.post('/admin/books/', dict({'books_keyword': ''}, **data))
+    return {
+        'offset_first_page': measure(post({'page': 1}), repeat),
+        'offset_middle_page': measure(post({'page': last_page // 2}), repeat),
+        'offset_last_page': measure(post({'page': last_page}), repeat),
+        'cursor_first_page': measure(post({'cursor': ''}), repeat),
+        'cursor_deep_page': measure(post({'cursor': cursor, 'with_count': '0'}), repeat),
+    }
+
+@scenario('bulk_import')
+def bulk_import_scenario(ctx, repeat, rows=1000):
+    def upload(i):
+        lines = ''.join(f'导入测试{i}-{n},作者{n},出版社,2020,IMP{i:03d}{n:06d},C0000,\n' for n in range(rows))
+        return SimpleUploadedFile('books.csv', lines.encode())
+    def categories(i):
+        lines = ''.join(f'IMP{i:03d}{n:06d},导入分类{n}\n' for n in range(rows))
+        return SimpleUploadedFile('categories.csv', lines.encode())
+    # 读者密码要做完整的 PBKDF2 哈希，行数取小一些
+    reader_rows = 20
+    def readers(i):
+        lines = ''.join(f'imp{i:03d}r{n:05d},名{n},姓,imp{i:03d}r{n:05d}@example.com,password{n},0,5\n' for n in range(reader_rows))
+        return SimpleUploadedFile('readers.csv', lines.encode())
+    uploads = {}
+    def prepare(kind, make):
+        return lambda i: uploads.__setitem__(kind, make(i))
+    return {
+        f'books_{rows}_rows': measure(lambda i: importer.BookImporter(ctx['admin']).run(uploads['books']), repeat,
+                                      setup=prepare('books', upload), items=rows),
+        f'categories_{rows}_rows': measure(lambda i: importer.CategoryImporter(ctx['admin']).run(uploads['categories']), repeat,
+                                           setup=prepare('categories', categories), items=rows),
+        f'readers_{reader_rows}_rows': measure(lambda i: importer.ReaderImporter(ctx['admin']).run(uploads['readers']), repeat,
+                                               setup=prepare('readers', readers), items=reader_rows),
+    }
+
+@scenario('borrow_return')
+def borrow_return_scenario(ctx, repeat, batch=20):
+    reader = ctx['admin_reader']
+    copies = list(Inventory.objects.filter(status=1).order_by('id').values_list('id', flat=True)[:max(repeat, batch)])
+    records = []
+    def return_all(i=None):
+        circulation.return_many(BorrowRecord.objects.filter(reader=reader, status=1).values_list('id', flat=True))
+    def borrow_batch(i):
+        circulation.borrow_many(reader.id, copies[:batch])
+        records[:] = BorrowRecord.objects.filter(reader=reader, status=1).values_list('id', flat=True)
+    results = {
+        # 单本借出的记录留给下一个用例逐本归还
+        'borrow': measure(lambda i: records.append(circulation.borrow(reader.id, copies[i]).id), repeat),
+        'return': measure(lambda i: circulation.return_record(records[i]), repeat),
+        f'batch_borrow_{batch}': measure(lambda i: circulation.borrow_many(reader.id, copies[:batch]), repeat,
+                                         setup=return_all, items=batch),
+        f'batch_return_{batch}': measure(lambda i: circulation.return_many(records), repeat,
+                                         setup=lambda i: (return_all(), borrow_batch(i)), items=batch),
+    }
+    return_all()
+    return results
+
+@scenario('dashboard')
+def dashboard_scenario(ctx, repeat):
+    reader_client = ctx['reader_client']
+    admin_client = ctx['admin_client']
+    def get(client, url, data=None):
+        return lambda i: client.get(url, data or {})
+    return {
+        'user_center': measure(get(reader_client, '/user/'), repeat),
+        'user_borrow_stats_30d': measure(get(reader_client, '/api/user_borrow_stats/', {'days': 30}), repeat),
+        'user_borrow_stats_year_by_month': measure(get(reader_client, '/api/user_borrow_stats/', {'days': 365, 'bucket': 'month'}), repeat),
+        'library_stats_by_category': measure(get(admin_client, '/api/user_borrow_stats/', {'days': 365, 'bucket': 'week', 'scope': 'library', 'by': 'category'}), repeat),
+        'top_borrowed_books': measure(get(reader_client, '/api/top_borrowed_books/'), repeat),
+    }
+
+@scenario('lists')
+def lists_scenario(ctx, repeat):
+    client = ctx['admin_client']
+    def post(url, data):
+        return lambda i: client.post(url, data)
+    return {
+        'reader_list': measure(post('/admin/readers/', {'readers_keyword': '', 'page': 1}), repeat),
+        'category_list': measure(post('/admin/categories/', {'categories_keyword': '', 'page': 1}), repeat),
+        'inventory_list': measure(post('/admin/inventory/', {'inventories_keyword': '', 'page': 1}), repeat),
+        'inventory_list_keyword': measure(post('/admin/inventory/', {'inventories_keyword': '数据库', 'page': 1}), repeat),
+        'borrow_record_list': measure(post('/admin/borrow_records/', {'keyword': '', 'page': 1}), repeat),
+        'operation_log_list': measure(post('/admin/operation_logs/', {'keyword': 'update', 'page': 1}), repeat),
+        'user_borrow_records': measure(lambda i: ctx['reader_client'].get('/user/borrowed/'), repeat),
+    }
+
+@scenario('autocomplete')
+def autocomplete_scenario(ctx, repeat):
+    client = ctx['admin_client']
+    def complete(field, q):
+        return lambda i: autocomplete.complete(field, q)
+    return {
+        # 冷启动：从数据库全量建立索引
+        'build': measure(lambda i: autocomplete.indexes(), repeat, setup=lambda i: autocomplete.reset()),
+        'title_prefix_1_char': measure(complete('title', '数'), repeat),
+        'title_prefix': measure(complete('title', '数据库'), repeat),
+        'title_infix': measure(complete('title', '设计与实'), repeat),
+        'author_prefix': measure(complete('author', '王'), repeat),
+        'reader_prefix': measure(complete('username', 'reader1'), repeat),
+        'api_title': measure(lambda i: client.get('/api/autocomplete/', {'q': '数据', 'field': 'title'}), repeat),
+    }
+
+@scenario('export')
+def export_scenario(ctx, repeat):
+    client = ctx['admin_client']
+    def download(kind, data=None):
+        return lambda i: b''.join(client.get(f'/admin/export/{kind}/', data or {}).streaming_content)
+    return {
+        'books_csv': measure(download('books'), repeat, items=Book.objects.count()),
+        'borrow_records_csv': measure(download('borrow_records'), repeat, items=BorrowRecord.objects.count()),
+        'borrow_records_ndjson_gzip': measure(download('borrow_records', {'format': 'ndjson', 'gzip': '1'}), repeat,
+                                              items=BorrowRecord.objects.count()),
+    }
+
+@scenario('login')
+def login_scenario(ctx, repeat):
+    username = ctx['reader'].user.username
+    def post(password, name=username):
+        return lambda i: Client().post('/auth/login/', {'username': name, 'password': password})
+    results = {
+        'login_success': measure(post(data.PASSWORD), repeat),
+        'login_wrong_password': measure(post('wrong-password'), repeat),
+        'login_unknown_user': measure(post(data.PASSWORD, 'no-such-reader'), repeat),
+    }
+    # 各哈希配置档下单个密码的哈希耗时，未安装依赖库的配置档跳过
+    for profile, hashers in settings.PASSWORD_HASHER_PROFILES.items():
+        with override_settings(PASSWORD_HASHERS=hashers):
+            try:
+                make_password(data.PASSWORD)
+            except ValueError:
+                continue
+            results[f'hash_{profile}'] = measure(lambda i: make_password(data.PASSWORD), repeat)
+    return results
+
+@scenario('sweep_overdue')
+def sweep_overdue_scenario(ctx, repeat):
+    # 每次执行前把逾期记录恢复为在借，再把“今天”往后推一个借期，使全部在借记录都到期
+    day = date.today() + timedelta(days=data.LOAN_DAYS + 1)
+    def reset(i):
+        BorrowRecord.objects.filter(status=-1).update(status=1)
+    results = {
+        'flip_all_active': measure(lambda i: circulation.sweep_overdue(day), repeat, setup=reset,
+                                   items=BorrowRecord.objects.filter(status__in=BorrowRecord.ACTIVE_STATUSES).count()),
+        # 没有新到期记录时的重复执行
+        'idempotent_rerun': measure(lambda i: circulation.sweep_overdue(day), repeat),
+    }
+    reset(0)
+    return results
@@ -0,0 +1,12 @@
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+# 迭代次数可配置的 PBKDF2-SHA256，用于 settings 中的 tuned 哈希配置档
+# 算法名与 Django 默认的 PBKDF2 相同，库中已有的哈希照常校验（迭代次数记录在哈希值里）；
+# 迭代次数与配置不同的哈希在登录成功时按新配置重新哈希
+# 配置只能调高迭代次数：低于 Django 默认值的按默认值算，避免误配后登录时把哈希降级
+# 这个模块也会在哈希子进程里加载，不能导入模型
+class TunablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        return max(getattr(settings, 'PASSWORD_PBKDF2_ITERATIONS', None) or 0, PBKDF2PasswordHasher.iterations)
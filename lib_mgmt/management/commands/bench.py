@@ -0,0 +1,76 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from ...benchmarks import data, scenarios
+from datetime import datetime
+import django
+import json
+import platform
+import time
+
+# 在一个临时的测试库里生成合成数据并运行基准场景，结果写成 JSON 便于前后对比
+# 不会碰到正式库；DJANGO_DB=sqlite 时完全不需要 MySQL 服务
+class Command(BaseCommand):
+    help = 'Seed a throwaway database with synthetic library data and benchmark the hot paths'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=sorted(data.SCALES), default='small')
+        parser.add_argument('--seed', type=int, default=42)
+        for name in data.SCALES['small']:
+            parser.add_argument(f'--{name}', type=int, help=f'Override the number of {name} of the chosen scale')
+        parser.add_argument('--scenarios', default=','.join(scenarios.SCENARIOS),
+                            help='Comma separated scenarios: ' + ', '.join(scenarios.SCENARIOS))
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--output', default='bench_results.json')
+
+    def handle(self, *args, **options):
+        names = [name for name in options['scenarios'].split(',') if name]
+        unknown = set(names) - set(scenarios.SCENARIOS)
+        if unknown:
+            raise CommandError('Unknown scenarios: ' + ', '.join(sorted(unknown)))
+        scale = dict(data.SCALES[options['scale']])
+        for name in scale:
+            if options[name] is not None:
+                scale[name] = options[name]
+
+        setup_test_environment()
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        old_config = runner.setup_databases()
+        try:
+            # 日志同步写入、导入同步执行，测到的是请求内的全部开销
+            with override_settings(OPERATION_LOG_ASYNC=False, IMPORT_JOBS_ASYNC=False, QUERY_BUDGETS_STRICT=False):
+                started = time.perf_counter()
+                counts = data.generate(seed=options['seed'], **scale)
+                seed_seconds = time.perf_counter() - started
+                self.stdout.write(f'Seeded {counts} in {seed_seconds:.1f}s')
+                results = {}
+                for name in names:
+                    started = time.perf_counter()
+                    results.update(scenarios.run([name], options['repeat']))
+                    self.stdout.write(f'{name}: {time.perf_counter() - started:.1f}s')
+                vendor = connection.vendor
+        finally:
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+
+        report = {
+            'meta': {
+                'timestamp': datetime.now().isoformat(timespec='seconds'),
+                'scale': options['scale'],
+                'seed': options['seed'],
+                'repeat': options['repeat'],
+                'database': vendor,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+            },
+            'data': dict(counts, **{f'requested_{name}': value for name, value in scale.items()}),
+            'seed_seconds': round(seed_seconds, 3),
+            'results': results,
+        }
+        with open(options['output'], 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        for name, cases in results.items():
+            for case, result in cases.items():
+                self.stdout.write(f"{name}.{case}: median {result['ms_median']} ms, {result['queries_avg']} queries")
+        self.stdout.write(self.style.SUCCESS(f'Wrote {options["output"]}'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from ...utils import autocomplete
+
+# 生成输入联想索引的快照，进程启动后首次使用时直接载入，不必逐行读库建立
+# 建议在批量导入后或每天定时执行一次
+class Command(BaseCommand):
+    help = 'Build the autocomplete index and save it as a snapshot file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='Snapshot path, defaults to settings.AUTOCOMPLETE_SNAPSHOT')
+
+    def handle(self, *args, **options):
+        path = options['output'] or autocomplete.snapshot_path()
+        if not path:
+            raise CommandError('Set AUTOCOMPLETE_SNAPSHOT (LIB_AUTOCOMPLETE_SNAPSHOT) or pass --output')
+        state = autocomplete.save_snapshot(path)
+        self.stdout.write(self.style.SUCCESS(
+            f"Saved {len(state['indexes']['title'].keys)} titles, {len(state['indexes']['author'].keys)} authors, "
+            f"{state['readers']} readers to {path}"
+        ))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from ...models import Book, Inventory
+
+# 按库存表重算图书上的冗余副本计数；--check 只报告不一致的图书，不写库
+class Command(BaseCommand):
+    help = 'Rebuild or check Book.total_copies / Book.available_copies'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Only report books whose counters are wrong')
+
+    def handle(self, *args, **options):
+        def copies(**filters):
+            rows = Inventory.objects.filter(book=OuterRef('pk'), **filters) \
+                                    .order_by() \
+                                    .values('book') \
+                                    .annotate(count=Count('id')) \
+                                    .values('count')
+            return Coalesce(Subquery(rows, output_field=IntegerField()), 0)
+
+        if options['check']:
+            mismatched = list(Book.objects.annotate(actual_total=copies(), actual_available=copies(status=1))
+                                          .filter(~Q(total_copies=F('actual_total')) | ~Q(available_copies=F('actual_available')))
+                                          .order_by('id')
+                                          .values_list('id', 'total_copies', 'actual_total', 'available_copies', 'actual_available'))
+            for book_id, total, actual_total, available, actual_available in mismatched:
+                self.stdout.write(f'Book #{book_id}: total {total} != {actual_total} or available {available} != {actual_available}')
+            if mismatched:
+                self.stdout.write(self.style.ERROR(f'{len(mismatched)} books have wrong counters'))
+            else:
+                self.stdout.write(self.style.SUCCESS('All book counters are correct'))
+            return
+
+        updated = Book.objects.update(total_copies=copies(), available_copies=copies(status=1))
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt counters for {updated} books'))
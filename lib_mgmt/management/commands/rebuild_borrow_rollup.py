@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from ...utils import rollup
+from datetime import date
+
+# 从借阅记录重建借阅日汇总表，用于首次上线或汇总与记录不一致时
+class Command(BaseCommand):
+    help = 'Rebuild the daily borrow rollup table from borrow records'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=date.fromisoformat, help='Only rebuild from this date (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        total = rollup.rebuild(options['since'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {total} rollup rows'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from ...models import Book, SearchTerm
+from ...utils import search
+
+# 全量重建图书检索索引，用于首次上线或索引与数据不一致时
+class Command(BaseCommand):
+    help = 'Rebuild the book full-text search index'
+
+    def handle(self, *args, **options):
+        search.index_books(Book.objects.all())
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {Book.objects.count()} books, {SearchTerm.objects.count()} terms'
+        ))
@@ -0,0 +1,42 @@
+from .utils import metrics
+from django.db import connection
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# 记录每个请求的总耗时、数据库耗时、查询数和重复查询指纹，按 URL 名写入 utils.metrics 的环形缓冲区
+# 查询数超过 settings.QUERY_BUDGETS 中该视图的预算时记警告，严格模式（测试）下直接抛异常
+class QueryMetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not metrics.is_enabled():
+            return self.get_response(request)
+        recorder = metrics.QueryRecorder()
+        started = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        wall = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else request.path
+        budget = metrics.budget(view)
+        over_budget = budget is not None and recorder.count > budget
+        metrics.record({
+            'view': view,
+            'method': request.method,
+            'status': response.status_code,
+            'wall_ms': round(wall * 1000, 2),
+            'db_ms': round(recorder.db_time * 1000, 2),
+            'queries': recorder.count,
+            'over_budget': over_budget,
+            'duplicates': recorder.duplicates(),
+        })
+        if over_budget:
+            message = f'{view} ran {recorder.count} queries, budget is {budget}'
+            if metrics.is_strict():
+                raise metrics.QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 # Create your models here.
 
 # 读者模型
@@ -9,7 +10,8 @@ class Reader(models.Model):
 
 # 分类模型
 class Category(models.Model):
-    category_number = models.CharField(max_length=50)
+    # 分类号唯一，添加图书时 get_or_create 按它查找
+    category_number = models.CharField(max_length=50, unique=True)
     name = models.CharField(max_length=100)
 
 # 图书模型
@@ -18,9 +20,27 @@ class Book(models.Model):
     author = models.CharField(max_length=100)
     publisher = models.CharField(max_length=100)
     publish_date = models.CharField(max_length=100)
-    index_number = models.CharField(max_length=50)
+    # 索书号唯一，同一种书的多个副本记在库存表里
+    index_number = models.CharField(max_length=50, unique=True)
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
     description = models.TextField(null=True, blank=True)
+    # 冗余的副本计数：全部副本数、在馆可借副本数（status=1）
+    # 由入库、编辑、删除库存及借还路径在同一事务内用 F() 维护，可用 rebuild_book_counters 校验重建
+    total_copies = models.IntegerField(default=0)
+    available_copies = models.IntegerField(default=0)
+
+    # 普通编辑保存时排除计数字段，避免用旧值覆盖并发维护的计数
+    EDITABLE_FIELDS = ('title', 'author', 'publisher', 'publish_date', 'index_number', 'category', 'description')
+
+    @classmethod
+    def adjust_copies(cls, book_id, total=0, available=0):
+        cls.objects.filter(id=book_id).update(
+            total_copies=models.F('total_copies') + total,
+            available_copies=models.F('available_copies') + available,
+        )
+        # UPDATE 不触发 signal，按可借数过滤的缓存需要随之失效
+        from .utils import caching
+        caching.bump(cls)
 
 # 库存记录模型
 class Inventory(models.Model):
@@ -37,7 +57,16 @@ class Inventory(models.Model):
         (2, "Borrowed"),
     )
     def get_status_display(self):
-        return dict(self.STATUS_CHOICES).get(self.status, "Unknown")
+        return INVENTORY_STATUS_LABELS.get(self.status, "Unknown")
+
+    class Meta:
+        indexes = [
+            # 某本书的可借副本、按状态统计副本数
+            models.Index(fields=['book', 'status'], name='inventory_book_status_idx'),
+        ]
+
+# 状态码到显示名的映射，只构建一次
+INVENTORY_STATUS_LABELS = dict(Inventory.STATUS_CHOICES)
 
 # 借阅记录模型
 class BorrowRecord(models.Model):
@@ -52,17 +81,80 @@ class BorrowRecord(models.Model):
         (0, "Returned"),
         (1, "Borrowed"),
     )
+    # 未归还的借阅（在借和逾期），逾期状态由 sweep_overdue 定时翻转
+    ACTIVE_STATUSES = (1, -1)
     def get_status_display(self):
-        return dict(self.STATUS_CHOICES).get(self.status, "Unknown")
+        return BORROW_STATUS_LABELS.get(self.status, "Unknown")
+
+    class Meta:
+        indexes = [
+            # 读者的在借、逾期记录（个人中心、借阅额度检查）
+            models.Index(fields=['reader', 'status'], name='borrow_reader_status_idx'),
+            # 按应还日期找在借记录（逾期扫描、即将到期提醒）
+            models.Index(fields=['status', 'return_date'], name='borrow_status_return_idx'),
+            # 按借阅日期区间统计、重建借阅日汇总
+            models.Index(fields=['borrow_date'], name='borrow_date_idx'),
+        ]
+
+BORROW_STATUS_LABELS = dict(BorrowRecord.STATUS_CHOICES)
     
 # 操作日志模型
 class OperationLog(models.Model):
     operation_type = models.CharField(max_length=50)
     content = models.TextField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # 日志异步落库，时间取记录产生的时刻而不是写入时刻
+    # 日志列表按时间倒序翻页
+    timestamp = models.DateTimeField(default=timezone.now, db_index=True)
     operator = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True)
 
+    # 不在请求内 INSERT，交给 utils.oplog 在事务提交后批量写入
+    # operator 可以直接传 User，也可以只传 operator_id 省去一次查询
     @classmethod
-    def log(cls, operation_type, content, operator):
-        log = cls(operation_type=operation_type, content=content, operator=operator)
-        log.save()
\ No newline at end of file
+    def log(cls, operation_type, content, operator=None, operator_id=None):
+        from .utils import oplog
+        if operator is not None:
+            operator_id = operator.id
+        oplog.enqueue(cls(operation_type=operation_type, content=content, operator_id=operator_id))
+
+# 借阅日汇总表，每个 (日期, 图书, 分类, 读者) 一行，借出时增量累加
+# 看板的排行与趋势统计只读这张表，可用 rebuild_borrow_rollup 从借阅记录重建
+class DailyBorrowStat(models.Model):
+    date = models.DateField()
+    book = models.ForeignKey(Book, on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+    reader = models.ForeignKey(Reader, on_delete=models.CASCADE)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('date', 'book', 'category', 'reader')
+
+# 图书检索倒排索引，每个 (词项, 图书) 一行，weight 为该词项在各字段上的权重之和
+class SearchTerm(models.Model):
+    term = models.CharField(max_length=50)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE)
+    weight = models.IntegerField(default=1)
+
+    class Meta:
+        unique_together = ('term', 'book')
+
+# 后台导入任务，批量上传先落盘再由 utils.jobs 在后台线程中导入
+class ImportJob(models.Model):
+    kind = models.CharField(max_length=20)
+    file_path = models.CharField(max_length=255)
+    status = models.IntegerField(default=0)
+    rows = models.IntegerField(default=0)
+    created = models.IntegerField(default=0)
+    errors = models.TextField(blank=True, default='')
+    operator = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    STATUS_CHOICES = (
+        (-1, "Failed"),
+        (0, "Pending"),
+        (1, "Running"),
+        (2, "Succeeded"),
+    )
+    def get_status_display(self):
+        return dict(self.STATUS_CHOICES).get(self.status, "Unknown")
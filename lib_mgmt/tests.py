@@ -1,3 +1,919 @@
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, Client, override_settings
+from django.conf import settings
+from django.contrib.auth import HASH_SESSION_KEY
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, check_password, make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, connection, connections
+from django.db.models.query import QuerySet
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from unittest import mock, skipUnless
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+import csv
+import gzip
+import io
+import json
+import os
+import random
+import tempfile
+import threading
+from .hashers import TunablePBKDF2PasswordHasher
+from .models import Reader, Category, Book, Inventory, BorrowRecord, OperationLog, ImportJob, DailyBorrowStat
+from .utils import importer, rollup, circulation, metrics, upload_validator, autocomplete, export, passwords, search, pagination, stats, jobs
+from .benchmarks import data, scenarios
 
 # Create your tests here.
+
+# 热点查询的执行计划回归测试：每个热点视图的主查询都要走索引，不能退化成全表扫描
+# 执行计划用 SQLite 的 EXPLAIN QUERY PLAN 检查，运行方式：DJANGO_DB=sqlite python manage.py test lib_mgmt
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN is SQLite only')
+@override_settings(OPERATION_LOG_ASYNC=False, IMPORT_JOBS_ASYNC=False)
+class QueryPlanTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user('admin', password='admin', is_staff=True)
+        self.reader = Reader.objects.create(user=self.admin)
+        self.category = Category.objects.create(category_number='TP', name='计算机')
+        self.book = Book.objects.create(title='数据库系统概论', author='王珊', publisher='高等教育出版社',
+                                        publish_date='2014', index_number='TP311.13', category=self.category)
+        self.inventory = Inventory.objects.create(book=self.book, status=2, location='A1')
+        today = timezone.now().date()
+        BorrowRecord.objects.create(reader=self.reader, inventory=self.inventory,
+                                    borrow_date=today, return_date=today + timedelta(days=30))
+        OperationLog.objects.create(operation_type='create', content='create a Book instance', operator=self.admin)
+        self.client = Client()
+        self.client.force_login(self.admin)
+
+    def plan(self, sql, params=()):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    # 执行 fn 并返回 FROM 指定表（且包含 marker）的第一条查询的执行计划
+    def plan_of(self, fn, table, marker=''):
+        with CaptureQueriesContext(connection) as queries:
+            fn()
+        for query in queries.captured_queries:
+            sql = query['sql']
+            if sql.startswith('SELECT') and f'FROM "{table}"' in sql and marker in sql:
+                return self.plan(query['sql'])
+        self.fail(f'No query on {table}')
+
+    def assertUsesIndex(self, plan, table, index=None):
+        steps = [step for step in plan if f' {table} ' in step + ' ']
+        self.assertTrue(steps, plan)
+        for step in steps:
+            self.assertIn('INDEX' if index is None else f'INDEX {index}', step, plan)
+
+    def test_user_center_summary(self):
+        plan = self.plan_of(lambda: self.client.get('/user/'), 'lib_mgmt_reader')
+        self.assertUsesIndex(plan, 'lib_mgmt_borrowrecord')
+
+    def test_user_borrow_records(self):
+        plan = self.plan_of(lambda: self.client.get('/user/borrowed/'), 'lib_mgmt_borrowrecord')
+        self.assertUsesIndex(plan, 'lib_mgmt_borrowrecord', 'borrow_reader_status_idx')
+
+    def test_user_borrow_inventory(self):
+        plan = self.plan_of(lambda: self.client.get('/user/book/', {'book_id': self.book.id}), 'lib_mgmt_inventory')
+        self.assertUsesIndex(plan, 'lib_mgmt_inventory', 'inventory_book_status_idx')
+
+    def test_add_book_category_lookup(self):
+        form = {'title': '编译原理', 'author': 'Aho', 'publisher': '机械工业出版社', 'publish_date': '2009',
+                'index_number': 'TP314', 'category': 'TP', 'description': ''}
+        plan = self.plan_of(lambda: self.client.post('/admin/books/add/', form), 'lib_mgmt_category')
+        self.assertUsesIndex(plan, 'lib_mgmt_category')
+
+    def test_book_import_index_number_check(self):
+        upload = SimpleUploadedFile('books.csv', '编译原理,Aho,机械工业出版社,2009,TP314,TP,\n'.encode())
+        plan = self.plan_of(lambda: importer.BookImporter(self.admin).run(upload),
+                            'lib_mgmt_book', '"index_number" IN')
+        self.assertUsesIndex(plan, 'lib_mgmt_book')
+
+    def test_operation_log_list(self):
+        plan = self.plan_of(lambda: self.client.post('/admin/operation_logs/', {'keyword': 'admin', 'cursor': ''}),
+                            'lib_mgmt_operationlog', 'ORDER BY')
+        self.assertUsesIndex(plan, 'lib_mgmt_operationlog', 'lib_mgmt_operationlog_timestamp')
+
+    def test_rollup_rebuild_since(self):
+        since = timezone.now().date() - timedelta(days=7)
+        plan = self.plan_of(lambda: rollup.rebuild(since), 'lib_mgmt_borrowrecord')
+        self.assertUsesIndex(plan, 'lib_mgmt_borrowrecord', 'borrow_date_idx')
+
+    def test_overdue_scan(self):
+        today = timezone.now().date()
+        plan = self.plan(*BorrowRecord.objects.filter(status=1, return_date__lte=today).query.sql_with_params())
+        self.assertUsesIndex(plan, 'lib_mgmt_borrowrecord', 'borrow_status_return_idx')
+
+# 借还事务路径的并发压力测试：数百个并发借书请求争抢少量副本，不能出现一本多借或超出借阅上限
+# SQLite 下并发写会直接报锁冲突，视为借书失败；MySQL 下由行锁排队
+@override_settings(OPERATION_LOG_ASYNC=False, IMPORT_JOBS_ASYNC=False)
+class CirculationConcurrencyTests(TransactionTestCase):
+    ATTEMPTS = 300
+    WORKERS = 32
+
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(category_number='TP', name='计算机')
+        self.books = [Book.objects.create(title=f'数据库系统概论{i}', author='王珊', publisher='高等教育出版社',
+                                          publish_date='2014', index_number=f'TP311.{i}', category=category,
+                                          total_copies=2, available_copies=2)
+                      for i in range(5)]
+        self.copies = [Inventory.objects.create(book=book, status=1) for book in self.books for _ in range(2)]
+        self.readers = [Reader.objects.create(user=User.objects.create_user(f'reader{i}', password='reader'), max_borrow_limit=3)
+                        for i in range(20)]
+
+    def attempt(self, reader, inventory):
+        try:
+            circulation.borrow(reader.id, inventory.id)
+        except (circulation.CirculationError, DatabaseError):
+            pass
+        finally:
+            connections.close_all()
+
+    def run_attempts(self, pairs):
+        with ThreadPoolExecutor(max_workers=self.WORKERS) as pool:
+            list(pool.map(lambda pair: self.attempt(*pair), pairs))
+
+    def test_no_double_lend(self):
+        rng = random.Random(14)
+        pairs = [(rng.choice(self.readers), rng.choice(self.copies)) for _ in range(self.ATTEMPTS)]
+        self.run_attempts(pairs)
+
+        # 以库中的结果为准：提交后的日志写入也可能在 SQLite 上报锁冲突
+        lent = BorrowRecord.objects.filter(status=1).count()
+        self.assertGreater(lent, 0)
+        self.assertEqual(Inventory.objects.filter(status=2).count(), lent)
+        # 每个副本至多一条在借记录，且与副本状态一致
+        for inventory in Inventory.objects.all():
+            on_loan = BorrowRecord.objects.filter(inventory=inventory, status=1).count()
+            self.assertLessEqual(on_loan, 1)
+            self.assertEqual(inventory.status, 2 if on_loan else 1)
+        for book in Book.objects.all():
+            self.assertEqual(book.available_copies, Inventory.objects.filter(book=book, status=1).count())
+
+    def test_quota_not_exceeded(self):
+        reader = self.readers[0]
+        pairs = [(reader, inventory) for inventory in self.copies] * (self.ATTEMPTS // len(self.copies))
+        self.run_attempts(pairs)
+
+        lent = BorrowRecord.objects.filter(reader=reader, status=1).count()
+        self.assertGreater(lent, 0)
+        self.assertLessEqual(lent, reader.max_borrow_limit)
+        self.assertEqual(Inventory.objects.filter(status=2).count(), lent)
+
+    def test_return_once(self):
+        record = circulation.borrow(self.readers[0].id, self.copies[0].id)
+        circulation.return_record(record.id, reader_id=self.readers[0].id)
+        with self.assertRaises(circulation.CirculationError):
+            circulation.return_record(record.id, reader_id=self.readers[0].id)
+        self.assertEqual(Inventory.objects.get(id=self.copies[0].id).status, 1)
+        self.assertEqual(Book.objects.get(id=self.books[0].id).available_copies, 2)
+
+# 各视图的查询数预算：严格模式下超出 settings.QUERY_BUDGETS 会抛 QueryBudgetExceeded，测试即失败
+# 数据量足以暴露逐行查询（N+1）
+@override_settings(OPERATION_LOG_ASYNC=False, IMPORT_JOBS_ASYNC=False, QUERY_BUDGETS_STRICT=True)
+class QueryBudgetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.clear()
+        autocomplete.reset()
+        self.admin = User.objects.create_user('admin', password='admin', is_staff=True)
+        self.reader = Reader.objects.create(user=self.admin, max_borrow_limit=20)
+        category = Category.objects.create(category_number='TP', name='计算机')
+        today = timezone.now().date()
+        for i in range(15):
+            book = Book.objects.create(title=f'数据库系统概论{i}', author='王珊', publisher='高等教育出版社',
+                                       publish_date='2014', index_number=f'TP311.{i}', category=category)
+            inventory = Inventory.objects.create(book=book, status=2, location='A1', last_borrowed_by=self.reader)
+            BorrowRecord.objects.create(reader=self.reader, inventory=inventory,
+                                        borrow_date=today, return_date=today + timedelta(days=i))
+            Inventory.objects.create(book=book, status=1, location='A2')
+        self.book = book
+        OperationLog.objects.create(operation_type='create', content='create a Book instance', operator=self.admin)
+        self.client = Client()
+        self.client.force_login(self.admin)
+
+    def test_views_within_budget(self):
+        self.client.get('/user/')
+        self.client.get('/user/borrowed/')
+        self.client.post('/user/search/', {'books_keyword': '数据库'})
+        self.client.get('/user/book/', {'book_id': self.book.id})
+        self.client.post('/admin/books/', {'books_keyword': '数据库'})
+        self.client.post('/admin/categories/', {'categories_keyword': ''})
+        self.client.get('/api/user_borrow_stats/', {'days': 30})
+        self.client.get('/api/top_borrowed_books/')
+        self.client.get('/api/get_categories/')
+        self.client.get('/api/get_books/', {'keyword': '数据库'})
+        self.client.get('/api/autocomplete/', {'q': '数据库'})
+        self.client.get('/admin/export/borrow_records/')
+        self.client.post('/admin/inventory/', {'inventories_keyword': '数据库'})
+        self.client.post('/admin/borrow_records/', {'keyword': ''})
+        self.client.post('/admin/operation_logs/', {'keyword': ''})
+        self.client.post('/admin/readers/', {'readers_keyword': '', 'sort': '-active_loans'})
+        views = {entry['view'] for entry in metrics.recent()}
+        self.assertTrue(set(settings.QUERY_BUDGETS) - {'lib:import_job'} <= views)
+
+    # 列表视图的查询数是常数：会话、用户、总数、本页各一次，与本页行数无关；游标翻页多一次取本页 id
+    def test_list_views_constant_queries(self):
+        OperationLog.objects.create(operation_type='sweep_overdue', content='mark 0 BorrowRecord instances overdue')
+        OperationLog.objects.bulk_create([OperationLog(operation_type='update', content=f'update a Book instance: #{i}',
+                                                       operator=self.admin) for i in range(15)])
+        for url, data, key in [('/admin/inventory/', {'inventories_keyword': ''}, 'inventories'),
+                               ('/admin/borrow_records/', {'keyword': ''}, 'records'),
+                               ('/admin/operation_logs/', {'keyword': ''}, 'logs')]:
+            for page in (1, 2):
+                with self.assertNumQueries(4):
+                    response = self.client.post(url, dict(data, page=page)).json()
+                self.assertTrue(response[key])
+        logs = self.client.post('/admin/operation_logs/', {'keyword': 'sweep'}).json()['logs']
+        self.assertEqual((logs[0]['username'], logs[0]['user_email']), (None, None))
+        inventory = self.client.post('/admin/inventory/', {'inventories_keyword': '', 'cursor': ''}).json()['inventories'][0]
+        self.assertEqual((inventory['book_category_name'], inventory['status']), ('计算机', 'Borrowed'))
+
+    def test_reader_list_sorted_by_active_loans(self):
+        for i in range(12):
+            user = User.objects.create_user(f'reader{i:02d}', email=f'reader{i:02d}@example.com')
+            Reader.objects.create(user=user, max_borrow_limit=5)
+        with self.assertNumQueries(4):
+            readers = self.client.post('/admin/readers/', {'readers_keyword': 'admin reader0', 'sort': '-active_loans'}).json()['readers']
+        self.assertEqual([(r['username'], r['active_loans']) for r in readers[:2]], [('admin', 15), ('reader00', 0)])
+        self.assertEqual(len(readers), 10)
+        # 游标翻页按同一排序键继续
+        response = self.client.post('/admin/readers/', {'readers_keyword': '', 'sort': 'username', 'cursor': ''}).json()
+        response = self.client.post('/admin/readers/', {'readers_keyword': '', 'sort': 'username',
+                                                        'cursor': response['cursor']['next']}).json()
+        self.assertEqual([r['username'] for r in response['readers']], ['reader09', 'reader10', 'reader11'])
+        self.assertFalse(self.client.post('/admin/readers/', {'readers_keyword': '', 'sort': 'password'}).json()['success'])
+
+    def test_over_budget_fails(self):
+        with override_settings(QUERY_BUDGETS={'lib:user_center': 1}):
+            with self.assertRaises(metrics.QueryBudgetExceeded):
+                self.client.get('/user/')
+
+    def test_metrics_endpoint(self):
+        self.client.get('/user/')
+        response = self.client.get('/api/query_metrics/').json()
+        self.assertTrue(response['success'])
+        row = next(row for row in response['views'] if row['view'] == 'lib:user_center')
+        self.assertEqual(row['requests'], 1)
+        self.assertLessEqual(row['queries_max'], settings.QUERY_BUDGETS['lib:user_center'])
+        self.assertIn('lib:user_center', {entry['view'] for entry in self.client.get('/api/query_metrics/', {'recent': 1}).json()['requests']})
+
+    def test_duplicate_fingerprints(self):
+        recorder = metrics.QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            for book in Book.objects.all()[:3]:
+                Category.objects.get(id=book.category_id)
+        self.assertEqual(recorder.duplicates()[0]['count'], 3)
+
+# 基准测试数据生成器与场景的冒烟测试，用最小规模跑通
+@override_settings(OPERATION_LOG_ASYNC=False, IMPORT_JOBS_ASYNC=False)
+class BenchmarkTests(TestCase):
+    def test_generate_and_run(self):
+        cache.clear()
+        counts = data.generate(seed=1, **data.SCALES['tiny'])
+        self.assertEqual(counts['books'], data.SCALES['tiny']['books'])
+        self.assertEqual(counts['borrow_records'], data.SCALES['tiny']['borrows'])
+        self.assertEqual(Inventory.objects.filter(status=2).count(), counts['active_loans'])
+        self.assertEqual(BorrowRecord.objects.filter(status=1).count(), counts['active_loans'])
+        for book in Book.objects.all()[:20]:
+            self.assertEqual(book.available_copies, Inventory.objects.filter(book=book, status=1).count())
+
+        results = scenarios.run(['search', 'dashboard', 'sweep_overdue'], repeat=1)
+        self.assertEqual(set(results), {'search', 'dashboard', 'sweep_overdue'})
+        self.assertGreater(results['search']['single_term']['ms_median'], 0)
+
+# 上传文件校验：一遍读取收集全部出错行，通过的行已转换好类型
+class UploadValidatorTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(category_number='TP', name='计算机')
+        self.book = Book.objects.create(title='数据库系统概论', author='王珊', publisher='高等教育出版社',
+                                        publish_date='2014', index_number='TP311.13', category=category)
+
+    def validate(self, schema, text):
+        batches = list(schema.validate(SimpleUploadedFile('upload.csv', text.encode()), chunk_size=2))
+        rows = [row for batch in batches for row in batch.rows]
+        errors = [error for batch in batches for error in batch.errors]
+        return rows, errors
+
+    def test_collects_every_error(self):
+        text = (f'{self.book.id},1,"A1, 2F"\n'
+                f'{self.book.id},7,A2\n'
+                'x,1,A3\n'
+                '99999,1,A4\n'
+                f'{self.book.id},0,A5,2024-01-02,\n'
+                f'{self.book.id},1\n')
+        rows, errors = self.validate(upload_validator.INVENTORY_SCHEMA, text)
+        self.assertEqual(rows, [
+            (1, {'book_id': self.book.id, 'status': 1, 'location': 'A1, 2F', 'last_borrowed_on': None, 'last_borrowed_by_id': None}),
+            (5, {'book_id': self.book.id, 'status': 0, 'location': 'A5', 'last_borrowed_on': date(2024, 1, 2), 'last_borrowed_by_id': None}),
+        ])
+        self.assertEqual(errors, [(2, 'Invalid status'), (3, 'Invalid book id'), (4, 'Book id not found'),
+                                  (6, 'Invalid number of fields')])
+
+    def test_unique_across_chunks(self):
+        text = 'TP,计算机\nO1,数学\nO2,物理\nO1,重复\n'
+        rows, errors = self.validate(upload_validator.CATEGORY_SCHEMA, text)
+        self.assertEqual([line for line, row in rows], [2, 3])
+        self.assertEqual(errors, [(1, 'Category number already exists'), (4, 'Category number already exists')])
+
+# 输入联想索引：前缀在前、三元组补充中间匹配，随 signal 与批量导入增量更新
+@override_settings(OPERATION_LOG_ASYNC=False, IMPORT_JOBS_ASYNC=False)
+class AutocompleteTests(TestCase):
+    def setUp(self):
+        autocomplete.reset()
+        self.addCleanup(autocomplete.reset)
+        self.category = Category.objects.create(category_number='TP', name='计算机')
+        for i, (title, author) in enumerate([('数据库系统概论', '王珊'), ('数据库系统概论', '萨师煊'),
+                                             ('数据结构', '严蔚敏'), ('分布式数据库', '邵佩英')]):
+            Book.objects.create(title=title, author=author, publisher='高等教育出版社', publish_date='2014',
+                                index_number=f'TP{i}', category=self.category)
+        self.user = User.objects.create_user('alice', password='pw', first_name='Alice', last_name='Liddell')
+        Reader.objects.create(user=self.user, max_borrow_limit=5)
+        self.client.force_login(self.user)
+
+    def complete(self, q, field='title'):
+        return [item['text'] for item in autocomplete.complete(field, q)]
+
+    def test_prefix_then_infix(self):
+        self.assertEqual(autocomplete.complete('title', '数据')[0], {'text': '数据库系统概论', 'count': 2})
+        self.assertEqual(self.complete('数据'), ['数据库系统概论', '数据结构'])
+        self.assertEqual(self.complete('数据库'), ['数据库系统概论', '分布式数据库'])
+        self.assertEqual(self.complete('ALICE l', 'name'), ['Alice Liddell'])
+
+    def test_incremental_updates(self):
+        self.complete('数据')
+        with self.captureOnCommitCallbacks(execute=True):
+            book = Book.objects.get(index_number='TP2')
+            book.title = '数据挖掘'
+            book.save()
+        self.assertEqual(self.complete('数据'), ['数据库系统概论', '数据挖掘'])
+        with self.captureOnCommitCallbacks(execute=True):
+            book.delete()
+        self.assertEqual(self.complete('数据'), ['数据库系统概论'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.first_name = 'Alicia'
+            self.user.save()
+        self.assertEqual(self.complete('ali', 'name'), ['Alicia Liddell'])
+
+    # 预热在后台建立，建立期间的查询不等待，期间提交的修改在替换前补上
+    def test_warm_in_background(self):
+        started, release = threading.Event(), threading.Event()
+        # 建立的结果事先在主线程算好，后台线程不访问测试数据库
+        built = autocomplete.build()
+        def slow_build():
+            started.set()
+            release.wait(5)
+            return built
+        with mock.patch.object(autocomplete, 'build', slow_build), \
+             mock.patch.object(autocomplete, 'close_old_connections'):
+            thread = autocomplete.warm()
+            self.assertTrue(started.wait(5))
+            self.assertIsNone(autocomplete.warm())
+            self.assertEqual(autocomplete.complete('title', '数据'), [])
+            with self.captureOnCommitCallbacks(execute=True):
+                Book.objects.filter(index_number='TP2').delete()
+            release.set()
+            thread.join(5)
+        self.assertEqual(self.complete('数据'), ['数据库系统概论'])
+
+    def test_snapshot(self):
+        path = os.path.join(tempfile.mkdtemp(), 'autocomplete.pickle')
+        autocomplete.save_snapshot(path)
+        Book.objects.create(title='数据挖掘', author='韩家炜', publisher='机械工业出版社', publish_date='2012',
+                            index_number='TP9', category=self.category)
+        indexes = autocomplete.load_snapshot(path)
+        self.assertEqual([item['text'] for item in indexes['title'].complete('数据')],
+                         ['数据库系统概论', '数据挖掘', '数据结构'])
+        # 快照之后删除过对象时不使用快照
+        Book.objects.filter(index_number='TP0').delete()
+        self.assertIsNone(autocomplete.load_snapshot(path))
+
+    def test_api_permissions(self):
+        response = self.client.get('/api/autocomplete/', {'q': '数据', 'limit': 1}).json()
+        self.assertEqual(response['results'], [{'text': '数据库系统概论', 'count': 2}])
+        self.assertFalse(self.client.get('/api/autocomplete/', {'q': 'al', 'field': 'username'}).json()['success'])
+
+# 流式导出：分段读取，每段一条 join 查询，gzip 输出可直接解压
+@override_settings(OPERATION_LOG_ASYNC=False, IMPORT_JOBS_ASYNC=False)
+class ExportTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user('admin', password='admin', is_staff=True)
+        self.reader = Reader.objects.create(user=self.admin, max_borrow_limit=20)
+        category = Category.objects.create(category_number='TP', name='计算机')
+        today = timezone.now().date()
+        for i in range(5):
+            book = Book.objects.create(title=f'数据库, "第{i}版"', author='王珊', publisher='高等教育出版社',
+                                       publish_date='2014', index_number=f'TP311.{i}', category=category)
+            inventory = Inventory.objects.create(book=book, status=2, location='A1')
+            BorrowRecord.objects.create(reader=self.reader, inventory=inventory, borrow_date=today,
+                                        return_date=today + timedelta(days=30))
+        self.client.force_login(self.admin)
+
+    def download(self, url, data=None):
+        response = self.client.get(url, data or {})
+        return b''.join(response.streaming_content)
+
+    def test_csv_in_chunks(self):
+        with mock.patch.object(export, 'CHUNK_SIZE', 2), CaptureQueriesContext(connection) as queries:
+            content = self.download('/admin/export/borrow_records/')
+        rows = list(csv.reader(io.StringIO(content.decode('utf-8-sig'))))
+        self.assertEqual(rows[0][:3], ['id', 'reader_id', 'username'])
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[1][4], '数据库, "第0版"')
+        self.assertEqual(rows[1][-1], 'Borrowed')
+        # 5 行分 3 段，再加一次空段查询，每段一条查询
+        exports = [q for q in queries.captured_queries if 'lib_mgmt_borrowrecord' in q['sql'] and 'LIMIT' in q['sql']]
+        self.assertEqual(len(exports), 4)
+
+    def test_ndjson_gzip(self):
+        response = self.client.get('/admin/export/readers/', {'format': 'ndjson', 'gzip': '1'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual(json.loads(lines[0])['username'], 'admin')
+        self.assertNotIn('password', lines[0])
+        self.assertFalse(self.client.get('/admin/export/users/').json()['success'])
+
+# 批量开户：明文密码在进程池里哈希，password_hash 列校验后原样写入，整批只写一条汇总日志
+@override_settings(OPERATION_LOG_ASYNC=False, IMPORT_JOBS_ASYNC=False, PASSWORD_HASH_WORKERS=2,
+                   PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ReaderProvisioningTests(TestCase):
+    def test_import_readers(self):
+        prehashed = make_password('migrated-secret')
+        text = ''.join(f'student{i},名{i},姓,student{i}@example.com,secret{i},0,5\n' for i in range(6))
+        text += f'migrated,迁移,用户,migrated@example.com,,0,3,{prehashed}\n'
+        # password 列里像哈希的值也按明文处理
+        text += 'lookalike,相似,用户,lookalike@example.com,pbkdf2_sha256$oops,0,3,\n'
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as queries:
+            result = importer.ReaderImporter().run(SimpleUploadedFile('readers.csv', text.encode()))
+        self.assertTrue(result['success'], result)
+        self.assertEqual(result['created'], 8)
+        self.assertTrue(User.objects.get(username='student3').check_password('secret3'))
+        self.assertEqual(User.objects.get(username='migrated').password, prehashed)
+        self.assertTrue(User.objects.get(username='lookalike').check_password('pbkdf2_sha256$oops'))
+        self.assertEqual(Reader.objects.get(user__username='migrated').max_borrow_limit, 3)
+        # User、Reader 各一次 INSERT，汇总日志在提交后写入
+        inserts = [q for q in queries.captured_queries if q['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 2)
+        log = OperationLog.objects.get()
+        self.assertEqual(log.content, 'bulk create 8 Reader instances (1 with pre-hashed passwords)')
+
+    # 无法解析的哈希报告为出错行，不写入库中（否则该读者登录时 check_password 会抛异常）
+    def test_rejects_malformed_hashes(self):
+        text = ''.join(f'user{i},名,姓,user{i}@example.com,,0,3,{value}\n'
+                       for i, value in enumerate(['pbkdf2_sha256$oops', 'bcrypt_sha256$mypass', 'plaintext']))
+        result = importer.ReaderImporter().run(SimpleUploadedFile('readers.csv', text.encode()))
+        self.assertFalse(result['success'])
+        self.assertEqual(result['errors'], [{'line': i, 'error': 'Invalid password hash'} for i in (1, 2, 3)])
+        self.assertFalse(User.objects.filter(username__startswith='user').exists())
+
+    def test_hash_passwords_keeps_order(self):
+        hashed = passwords.hash_passwords(['a', 'b', 'a'])
+        self.assertTrue(all(value.startswith('md5$') for value in hashed))
+        self.assertTrue(check_password('b', hashed[1]))
+        self.assertNotEqual(hashed[0], hashed[2])
+        self.assertIsNotNone(passwords._executor)
+
+# 登录：用户只查一次，last_login 不记日志，旧哈希在 login() 之前同步升级且不影响当前会话
+@override_settings(OPERATION_LOG_ASYNC=False)
+class LoginTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret-pw')
+        Reader.objects.create(user=self.user, max_borrow_limit=5)
+
+    def test_login_loads_user_once_without_log(self):
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/auth/login/', {'username': 'alice', 'password': 'secret-pw'})
+        self.assertRedirects(response, '/user/', fetch_redirect_response=False)
+        selects = [q for q in queries.captured_queries if q['sql'].startswith('SELECT') and 'FROM "auth_user"' in q['sql']]
+        self.assertEqual(len(selects), 1)
+        self.assertFalse(OperationLog.objects.filter(content__contains='User instance').exists())
+        self.assertIsNotNone(User.objects.get(id=self.user.id).last_login)
+
+    def test_rejects_cleanly(self):
+        for username, password in [('nobody', 'secret-pw'), ('alice', 'wrong')]:
+            response = self.client.post('/auth/login/', {'username': username, 'password': password})
+            self.assertContains(response, 'Invalid username or password!')
+        User.objects.filter(id=self.user.id).update(is_active=False)
+        response = self.client.post('/auth/login/', {'username': 'alice', 'password': 'secret-pw'})
+        self.assertContains(response, 'Your account is disabled!')
+
+    # 旧哈希在 login() 之前升级，会话里的密码摘要一开始就是新哈希的，紧接着的请求仍是登录状态
+    def test_stale_hash_upgraded_before_login(self):
+        stale = PBKDF2PasswordHasher().encode('secret-pw', 'staticsalt', iterations=1000)
+        User.objects.filter(id=self.user.id).update(password=stale)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/auth/login/', {'username': 'alice', 'password': 'secret-pw'})
+        self.assertRedirects(response, '/user/', fetch_redirect_response=False)
+        user = User.objects.get(id=self.user.id)
+        self.assertNotEqual(user.password, stale)
+        self.assertTrue(user.check_password('secret-pw'))
+        self.assertEqual(self.client.session[HASH_SESSION_KEY], user.get_session_auth_hash())
+        self.assertEqual(self.client.get('/user/').status_code, 200)
+        self.assertFalse(OperationLog.objects.filter(content__contains='User instance').exists())
+        # 已是当前配置的哈希不再重写
+        self.client.logout()
+        self.client.post('/auth/login/', {'username': 'alice', 'password': 'secret-pw'})
+        self.assertEqual(User.objects.get(id=self.user.id).password, user.password)
+
+    # 迭代次数配置低于默认值时不降级：默认强度的哈希登录后保持不变
+    @override_settings(PASSWORD_HASHERS=['lib_mgmt.hashers.TunablePBKDF2PasswordHasher'], PASSWORD_PBKDF2_ITERATIONS=1000)
+    def test_low_iterations_do_not_downgrade(self):
+        self.assertEqual(TunablePBKDF2PasswordHasher().iterations, PBKDF2PasswordHasher.iterations)
+        password = PBKDF2PasswordHasher().encode('secret-pw', PBKDF2PasswordHasher().salt())
+        User.objects.filter(id=self.user.id).update(password=password)
+        response = self.client.post('/auth/login/', {'username': 'alice', 'password': 'secret-pw'})
+        self.assertRedirects(response, '/user/', fetch_redirect_response=False)
+        self.assertEqual(User.objects.get(id=self.user.id).password, password)
+
+# 图书检索：分词、中文二元组、西文前缀匹配与按字段权重排序
+@override_settings(OPERATION_LOG_ASYNC=False, IMPORT_JOBS_ASYNC=False)
+class SearchTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(category_number='TP', name='计算机')
+        self.python = Book.objects.create(title='Python Cookbook', author='David Beazley', publisher="O'Reilly",
+                                          publish_date='2013', index_number='TP312.8', category=category)
+        self.database = Book.objects.create(title='数据库系统概论', author='王珊', publisher='高等教育出版社',
+                                            publish_date='2014', index_number='TP311.13', category=category)
+        self.press = Book.objects.create(title='Learning SQL', author='Alan Beaulieu', publisher='Python Press',
+                                         publish_date='2009', index_number='TP311.9', category=category)
+
+    def ids(self, *keywords):
+        return list(search.search_books(keywords).values_list('id', flat=True))
+
+    def test_tokenize(self):
+        self.assertEqual(search.tokenize('Python-Cookbook TP312.8'), ['python', 'cookbook', 'tp312', '8'])
+        self.assertEqual(search.tokenize('数据库'), ['数', '据', '库', '数据', '据库'])
+        self.assertEqual(search.query_tokens('数据库 数据'), ['数据', '据库'])
+        self.assertEqual(search.query_tokens('库'), ['库'])
+
+    def test_cjk_bigrams(self):
+        self.assertEqual(self.ids('数据库'), [self.database.id])
+        self.assertEqual(self.ids('库系'), [self.database.id])
+        self.assertEqual(self.ids('库数'), [])
+
+    def test_latin_prefix(self):
+        self.assertEqual(set(self.ids('Pyth')), {self.python.id, self.press.id})
+        self.assertEqual(self.ids('TP312'), [self.python.id])
+        self.assertEqual(self.ids('TP31'), sorted([self.python.id, self.database.id, self.press.id]))
+        # 关键字的每个词项都要命中，同一前缀命中多个词项只算一次
+        self.assertEqual(self.ids('beau learn'), [self.press.id])
+        self.assertEqual(self.ids('ython'), [])
+
+    def test_ranked_by_field_weight(self):
+        # 标题命中（权重 4）排在出版社命中（权重 1）之前
+        self.assertEqual(self.ids('python'), [self.python.id, self.press.id])
+        self.assertEqual(self.ids('sql', 'cookbook'), sorted([self.python.id, self.press.id]))
+
+# 游标分页：前后翻页、排序键相同的行、无效 token
+@override_settings(OPERATION_LOG_ASYNC=False, IMPORT_JOBS_ASYNC=False)
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(category_number='TP', name='计算机')
+        # 出版年只有三种取值，翻页必须靠 id 区分同值的行
+        self.books = [Book.objects.create(title=f'Book {i}', author='A', publisher='P', publish_date=str(2000 + i % 3),
+                                          index_number=f'TP{i}', category=category) for i in range(7)]
+        self.admin = User.objects.create_user('admin', password='admin', is_staff=True)
+        self.client.force_login(self.admin)
+
+    def walk(self, key):
+        expected = list(Book.objects.order_by(key, 'id').values_list('id', flat=True))
+        pages, token = [], ''
+        while token is not None:
+            page, cursor = pagination.paginate_cursor(Book.objects.all(), token, per_page=3, key=key)
+            pages.append((list(page.values_list('id', flat=True)), cursor))
+            token = cursor['next']
+        self.assertEqual([book_id for ids, cursor in pages for book_id in ids], expected)
+        self.assertEqual([len(ids) for ids, cursor in pages], [3, 3, 1])
+        self.assertIsNone(pages[0][1]['prev'])
+        # 从最后一页往回翻，逐页与向后翻的结果一致
+        token = pages[-1][1]['prev']
+        for ids, cursor in reversed(pages[:-1]):
+            page, cursor = pagination.paginate_cursor(Book.objects.all(), token, per_page=3, key=key)
+            self.assertEqual(list(page.values_list('id', flat=True)), ids)
+            token = cursor['prev']
+        self.assertIsNone(token)
+
+    def test_walk_forward_and_back(self):
+        self.walk('id')
+        self.walk('-id')
+
+    def test_equal_sort_keys(self):
+        self.walk('publish_date')
+        self.walk('-publish_date')
+
+    def test_invalid_cursor(self):
+        for token in ['not-a-cursor', pagination.encode_cursor({'x': 1}, 1), pagination.encode_cursor('x', 'y')]:
+            with self.assertRaises(ValueError):
+                pagination.paginate_cursor(Book.objects.all(), token, key='publish_date')
+        # 视图从第一页开始
+        for token in ['not-a-cursor', '!!!']:
+            response = self.client.post('/admin/books/', {'books_keyword': '', 'cursor': token}).json()
+            self.assertEqual(len(response['books']), len(self.books))
+            self.assertIsNone(response['cursor']['prev'])
+        # 排序键是时间字段时，值无法解析同样从第一页开始
+        response = self.client.post('/admin/operation_logs/', {'keyword': '', 'cursor': pagination.encode_cursor('yesterday', 1)})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['success'])
+
+    # 按关联表字段过滤时，总数缓存随关联表的变更失效
+    def test_cached_count_follows_related_models(self):
+        reader = Reader.objects.create(user=User.objects.create_user('zed'), max_borrow_limit=5)
+        inventory = Inventory.objects.create(book=self.books[0], status=2, location='A1')
+        BorrowRecord.objects.create(reader=reader, inventory=inventory, borrow_date=date(2024, 1, 1),
+                                    return_date=date(2024, 1, 31), status=1)
+        def count(url, data):
+            return self.client.post(url, dict(data, cursor='')).json()['count']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(count('/admin/borrow_records/', {'keyword': 'zed'}), 1)
+            self.assertEqual(count('/admin/inventory/', {'inventories_keyword': 'Renamed'}), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            reader.user.username = 'yan'
+            reader.user.save()
+            book = self.books[0]
+            book.title = 'Renamed'
+            book.save()
+        self.assertEqual(count('/admin/borrow_records/', {'keyword': 'zed'}), 0)
+        self.assertEqual(count('/admin/inventory/', {'inventories_keyword': 'Renamed'}), 1)
+        self.assertEqual({model.__name__ for model in pagination.query_models(
+            str(BorrowRecord.objects.filter(reader__user__username='x').query))}, {'BorrowRecord', 'Reader', 'User'})
+
+# 后台导入任务：创建后 Pending，导入时 Running，结束后 Succeeded/Failed，错误行写入任务表
+@override_settings(OPERATION_LOG_ASYNC=False, IMPORT_JOBS_ASYNC=False)
+class ImportJobTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user('admin', password='admin', is_staff=True)
+        self.client.force_login(self.admin)
+
+    def upload(self, text):
+        upload = SimpleUploadedFile('categories.csv', text.encode('utf-8'), content_type='text/csv')
+        response = self.client.post('/admin/categories/add_bulk/', {'categories_file': upload}).json()
+        self.assertTrue(response['success'])
+        return ImportJob.objects.get(id=response['job_id'])
+
+    def status(self, job_id):
+        return self.client.get('/api/import_job/', {'job_id': job_id}).json()
+
+    def test_succeeded(self):
+        seen = []
+        run = importer.CategoryImporter.run
+        def spy(self, *args, **kwargs):
+            seen.append(ImportJob.objects.get(operator__username='admin').status)
+            return run(self, *args, **kwargs)
+        with mock.patch.object(importer.CategoryImporter, 'run', spy):
+            job = self.upload('TP,计算机\nO1,数学\n')
+        self.assertEqual(seen, [1])
+        self.assertFalse(os.path.exists(job.file_path))
+        self.assertEqual(Category.objects.count(), 2)
+        status = self.status(job.id)['job']
+        self.assertEqual((status['status'], status['status_display']), (2, 'Succeeded'))
+        self.assertEqual((status['rows'], status['created'], status['errors'], status['error']), (2, 2, [], None))
+        self.assertIsNotNone(job.started_at)
+        self.assertIsNotNone(job.finished_at)
+
+    def test_row_errors(self):
+        Category.objects.create(category_number='TP', name='计算机')
+        job = self.upload('O1,数学\nTP,计算机\nbad\n')
+        self.assertEqual(Category.objects.count(), 1)
+        status = self.status(job.id)['job']
+        self.assertEqual((status['status'], status['rows'], status['created']), (-1, 3, 0))
+        self.assertEqual(status['errors'], [{'line': 2, 'error': 'Category number already exists'},
+                                            {'line': 3, 'error': 'Invalid number of fields'}])
+        self.assertEqual(status['error'], 'Line 2: Category number already exists')
+
+    def test_exception_marks_failed(self):
+        with mock.patch.object(importer.CategoryImporter, 'run', side_effect=RuntimeError('disk full')):
+            with self.assertRaises(RuntimeError):
+                self.upload('TP,计算机\n')
+        job = ImportJob.objects.get()
+        self.assertEqual(job.status, -1)
+        self.assertEqual(json.loads(job.errors), [{'line': 0, 'error': 'disk full'}])
+        self.assertFalse(os.path.exists(job.file_path))
+
+    # 进程重启后遗留的 Pending/Running 任务在轮询时超时失败
+    def test_stale_jobs_expire(self):
+        long_ago = timezone.now() - timedelta(seconds=jobs.TIMEOUT + 1)
+        pending = ImportJob.objects.create(kind='books', file_path='/nonexistent.csv', created_at=long_ago)
+        running = ImportJob.objects.create(kind='books', file_path='/nonexistent.csv', status=1, started_at=long_ago)
+        recent = ImportJob.objects.create(kind='books', file_path='/nonexistent.csv', status=1, started_at=timezone.now())
+        for job in (pending, running):
+            status = self.status(job.id)['job']
+            self.assertEqual((status['status'], status['error']), (-1, 'Line 0: Import job was interrupted'))
+        self.assertEqual(self.status(recent.id)['job']['status_display'], 'Running')
+
+    def test_status_endpoint(self):
+        job = ImportJob.objects.create(kind='books', file_path='/nonexistent.csv')
+        self.assertEqual(self.status(job.id)['job']['status_display'], 'Pending')
+        self.assertEqual(self.status('x'), {'success': False, 'error': 'Job not found'})
+        self.assertEqual(self.client.get('/api/import_job/').json()['error'], 'Job not found')
+        user = User.objects.create_user('reader', password='reader')
+        self.client.force_login(user)
+        self.assertEqual(self.status(job.id), {'success': False, 'error': 'Permission denied'})
+
+# 借阅统计：日/周/月分桶、汇总表重建与增量累加一致、全馆趋势统计仅管理员可见
+@override_settings(OPERATION_LOG_ASYNC=False, IMPORT_JOBS_ASYNC=False)
+class BorrowStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user('admin', password='admin', is_staff=True)
+        self.user = User.objects.create_user('alice', password='alice')
+        self.reader = Reader.objects.create(user=self.user, max_borrow_limit=20)
+        self.other = Reader.objects.create(user=User.objects.create_user('bob', password='bob'), max_borrow_limit=20)
+        category = Category.objects.create(category_number='TP', name='计算机')
+        self.books = [Book.objects.create(title=f'Book {i}', author='A', publisher='P', publish_date='2020',
+                                          index_number=f'TP{i}', category=category) for i in range(2)]
+        self.inventories = [Inventory.objects.create(book=book, status=1, location='A1') for book in self.books]
+
+    # 借阅记录的 post_save 会增量累加汇总表
+    def borrow(self, reader, inventory, day):
+        BorrowRecord.objects.create(reader=reader, inventory=inventory, borrow_date=day,
+                                    return_date=day + timedelta(days=30), status=1)
+
+    def test_buckets(self):
+        # 2024-01-29 与 2024-02-04 同属一周（周一开始），2024-02-05 是下一周
+        for day in [date(2024, 1, 29), date(2024, 2, 4), date(2024, 2, 4), date(2024, 2, 5), date(2024, 3, 1)]:
+            self.borrow(self.reader, self.inventories[0], day)
+        records = DailyBorrowStat.objects.all()
+        def counts(bucket, start=date(2024, 1, 29), end=date(2024, 3, 3)):
+            return {row['date']: row['count'] for row in stats.borrow_stats(records, start, end, bucket) if row['count']}
+        self.assertEqual(counts('day'), {date(2024, 1, 29): 1, date(2024, 2, 4): 2, date(2024, 2, 5): 1, date(2024, 3, 1): 1})
+        self.assertEqual(counts('week'), {date(2024, 1, 29): 3, date(2024, 2, 5): 1, date(2024, 2, 26): 1})
+        self.assertEqual(counts('month'), {date(2024, 1, 1): 1, date(2024, 2, 1): 3, date(2024, 3, 1): 1})
+        # 区间内没有借阅的桶补 0，区间外的不计
+        rows = stats.borrow_stats(records, date(2024, 2, 1), date(2024, 2, 29), 'week')
+        self.assertEqual([row['date'] for row in rows][:2], [date(2024, 1, 29), date(2024, 2, 5)])
+        self.assertEqual(rows[0]['count'], 2)
+        self.assertEqual(sum(row['count'] for row in rows), 3)
+
+    def test_rebuild_matches_incremental(self):
+        today = timezone.now().date()
+        random.seed(7)
+        for i in range(40):
+            self.borrow(random.choice([self.reader, self.other]), random.choice(self.inventories),
+                        today - timedelta(days=random.randrange(20)))
+        fields = ('date', 'book_id', 'category_id', 'reader_id', 'count')
+        incremental = sorted(DailyBorrowStat.objects.values_list(*fields))
+        self.assertEqual(sum(row[-1] for row in incremental), 40)
+        rollup.rebuild()
+        self.assertEqual(sorted(DailyBorrowStat.objects.values_list(*fields)), incremental)
+        rollup.rebuild(since=today - timedelta(days=5))
+        self.assertEqual(sorted(DailyBorrowStat.objects.values_list(*fields)), incremental)
+
+    def test_library_stats_staff_only(self):
+        today = timezone.localdate()
+        self.borrow(self.reader, self.inventories[0], today)
+        self.borrow(self.other, self.inventories[1], today)
+        self.borrow(self.other, self.inventories[1], today)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get('/api/user_borrow_stats/', {'days': 1}).json()[0]['count'], 1)
+        for params in [{'scope': 'library'}, {'reader_id': self.other.id}]:
+            self.assertEqual(self.client.get('/api/user_borrow_stats/', params).json(),
+                             {'success': False, 'error': 'Permission denied'})
+        # 借阅排行是全馆的，所有登录用户看到同一份（共用一个缓存键）
+        self.assertEqual(self.client.get('/api/top_borrowed_books/').json(),
+                         [{'inventory__book__title': 'Book 1', 'count': 2}, {'inventory__book__title': 'Book 0', 'count': 1}])
+
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.get('/api/user_borrow_stats/', {'days': 1, 'scope': 'library'}).json()[0]['count'], 3)
+        self.assertEqual(self.client.get('/api/user_borrow_stats/', {'days': 1, 'reader_id': self.other.id}).json()[0]['count'], 2)
+        self.assertEqual(self.client.get('/api/top_borrowed_books/').json(),
+                         [{'inventory__book__title': 'Book 1', 'count': 2}, {'inventory__book__title': 'Book 0', 'count': 1}])
+
+# 流通台批量借还：整批检查配额、逐项结果、部分失败、批量上限、计数与汇总表
+@override_settings(OPERATION_LOG_ASYNC=False, IMPORT_JOBS_ASYNC=False)
+class BatchCirculationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user('admin', password='admin', is_staff=True)
+        self.reader = Reader.objects.create(user=User.objects.create_user('alice'), max_borrow_limit=3)
+        category = Category.objects.create(category_number='TP', name='计算机')
+        self.book = Book.objects.create(title='Book', author='A', publisher='P', publish_date='2020',
+                                        index_number='TP1', category=category)
+        self.copies = [Inventory.objects.create(book=self.book, status=1, location='A1') for i in range(4)]
+        self.client.force_login(self.admin)
+
+    def borrow(self, ids, reader_id=None):
+        data = {'inv_ids': ','.join(str(i) for i in ids), 'reader_id': reader_id or self.reader.id}
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/admin/circulation/borrow/', data).json()
+
+    def give_back(self, ids):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/admin/circulation/return/', {'record_ids': [str(i) for i in ids]}).json()
+
+    def available(self):
+        return Book.objects.get(id=self.book.id).available_copies
+
+    def test_partial_borrow_and_return(self):
+        self.copies[1].status = 0
+        self.copies[1].save()
+        before = self.available()
+        logs = OperationLog.objects.count()
+        response = self.borrow([self.copies[0].id, self.copies[1].id, self.copies[2].id, self.copies[0].id])
+        self.assertEqual(response['count'], 2)
+        self.assertEqual([(item['id'], item['success']) for item in response['results']],
+                         [(self.copies[0].id, True), (self.copies[1].id, False), (self.copies[2].id, True)])
+        self.assertEqual(response['results'][1]['error'], '该副本已被借出或不可借！')
+        self.assertEqual(self.available(), before - 2)
+        self.assertEqual(list(Inventory.objects.filter(status=2).values_list('id', flat=True).order_by('id')),
+                         [self.copies[0].id, self.copies[2].id])
+        self.assertEqual(DailyBorrowStat.objects.get(reader=self.reader).count, 2)
+        self.assertEqual(OperationLog.objects.filter(operation_type='bulk_borrow').count(), 1)
+        self.assertEqual(OperationLog.objects.count(), logs + 1)
+
+        records = list(BorrowRecord.objects.order_by('id').values_list('id', flat=True))
+        self.give_back([records[0]])
+        response = self.give_back(records + [999999])
+        self.assertEqual(response['count'], 1)
+        self.assertEqual([item['success'] for item in response['results']], [False, True, False])
+        self.assertEqual(self.available(), before)
+        self.assertFalse(BorrowRecord.objects.filter(status__in=BorrowRecord.ACTIVE_STATUSES).exists())
+        self.assertFalse(Inventory.objects.filter(status=2).exists())
+
+    def test_quota_checked_for_whole_batch(self):
+        self.borrow([self.copies[0].id])
+        before = self.available()
+        # 剩余配额 2，可借副本 3：整批不借
+        response = self.borrow([copy.id for copy in self.copies[1:]])
+        self.assertEqual(response['count'], 0)
+        self.assertEqual({item['error'] for item in response['results']}, {'剩余借阅配额不足！'})
+        self.assertEqual(self.available(), before)
+        self.assertEqual(BorrowRecord.objects.count(), 1)
+        self.assertEqual(self.borrow([copy.id for copy in self.copies[1:3]])['count'], 2)
+
+    def test_rejects_bad_requests(self):
+        post = lambda data: self.client.post('/admin/circulation/borrow/', data).json()
+        self.assertEqual(post({'inv_ids': '1'}), {'success': False, 'error': 'reader_id is required'})
+        self.assertEqual(post({'inv_ids': '1', 'reader_id': 'x'}), {'success': False, 'error': 'Invalid reader_id'})
+        self.assertEqual(post({'inv_ids': '1', 'reader_id': 999999}), {'success': False, 'error': 'Reader not found'})
+        self.assertEqual(post({'reader_id': self.reader.id}), {'success': False, 'error': 'No ids given'})
+        self.assertEqual(post({'inv_ids': '1,a', 'reader_id': self.reader.id}), {'success': False, 'error': 'Invalid id'})
+        too_many = ','.join(str(i) for i in range(circulation.MAX_BATCH + 1))
+        self.assertEqual(post({'inv_ids': too_many, 'reader_id': self.reader.id})['error'],
+                         f'At most {circulation.MAX_BATCH} items per batch')
+        self.assertEqual(self.client.post('/admin/circulation/return/', {'record_ids': too_many}).json()['error'],
+                         f'At most {circulation.MAX_BATCH} items per batch')
+        self.assertFalse(BorrowRecord.objects.exists())
+
+# 管理员编辑/删除副本与借书并发：借书发生在读取副本与写入之间时，不能覆盖借出状态或删掉在借记录
+@override_settings(OPERATION_LOG_ASYNC=False, IMPORT_JOBS_ASYNC=False)
+class InventoryEditRaceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user('admin', password='admin', is_staff=True)
+        self.reader = Reader.objects.create(user=User.objects.create_user('alice'), max_borrow_limit=5)
+        category = Category.objects.create(category_number='TP', name='计算机')
+        self.book = Book.objects.create(title='Book', author='A', publisher='P', publish_date='2020',
+                                        index_number='TP1', category=category, total_copies=1, available_copies=1)
+        self.copy = Inventory.objects.create(book=self.book, status=1, location='A1')
+        self.client.force_login(self.admin)
+
+    # 视图读到副本行之后立刻有一笔借书提交，模拟行锁不生效时的交错
+    def borrow_after_read(self):
+        select_for_update = QuerySet.select_for_update
+        reader_id = self.reader.id
+        def locked(qs, *args, **kwargs):
+            qs = select_for_update(qs, *args, **kwargs)
+            if qs.model is Inventory and not hasattr(self, 'borrowed'):
+                get = qs.get
+                def get_then_borrow(*args, **kwargs):
+                    row = get(*args, **kwargs)
+                    self.borrowed = circulation.borrow(reader_id, row.id)
+                    return row
+                qs.get = get_then_borrow
+            return qs
+        return mock.patch.object(QuerySet, 'select_for_update', locked)
+
+    def assertStillLent(self):
+        copy = Inventory.objects.get(id=self.copy.id)
+        self.assertEqual(copy.status, 2)
+        self.assertTrue(BorrowRecord.objects.filter(id=self.borrowed.id, status=1).exists())
+        self.assertEqual(Book.objects.get(id=self.book.id).available_copies, 0)
+
+    def test_edit(self):
+        with self.borrow_after_read():
+            response = self.client.post('/admin/inventory/edit/', {'inventory_id': self.copy.id, 'status': '0', 'location': 'B2'}).json()
+        self.assertEqual(response, {'success': False, 'error': 'Inventory was changed, please retry'})
+        self.assertStillLent()
+        self.assertEqual(Inventory.objects.get(id=self.copy.id).location, 'A1')
+        # 没有并发时正常修改，可借计数随之变化
+        circulation.return_record(self.borrowed.id)
+        response = self.client.post('/admin/inventory/edit/', {'inventory_id': self.copy.id, 'status': '0', 'location': 'B2'}).json()
+        self.assertTrue(response['success'])
+        self.assertEqual((Inventory.objects.get(id=self.copy.id).status, Book.objects.get(id=self.book.id).available_copies), (0, 0))
+
+    def test_delete(self):
+        with self.borrow_after_read():
+            response = self.client.post('/admin/inventory/delete/', {'inventory_id': self.copy.id}).json()
+        self.assertFalse(response['success'])
+        self.assertStillLent()
+        self.assertEqual(Book.objects.get(id=self.book.id).total_copies, 1)
+        copy = Inventory.objects.create(book=self.book, status=1, location='A2')
+        Book.adjust_copies(self.book.id, total=1, available=1)
+        self.assertTrue(self.client.post('/admin/inventory/delete/', {'inventory_id': copy.id}).json()['success'])
+        book = Book.objects.get(id=self.book.id)
+        self.assertEqual((book.total_copies, book.available_copies), (1, 0))
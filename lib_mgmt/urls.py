@@ -11,6 +11,9 @@ urlpatterns = [
     path('api/top_borrowed_books/', views.TopBorrowedBooksView.as_view(), name='top_borrowed_books'),
     path('api/get_categories/', views.CategoryView.as_view(), name='get_categories'),
     path('api/get_books/', views.BookView.as_view(), name='get_books'),
+    path('api/import_job/', views.ImportJobView.as_view(), name='import_job'),
+    path('api/query_metrics/', views.QueryMetricsView.as_view(), name='query_metrics'),
+    path('api/autocomplete/', views.AutocompleteView.as_view(), name='autocomplete'),
    
     # 登录态
     path('auth/login/', views.user_login, name='user_login'),
@@ -59,6 +62,9 @@ urlpatterns = [
     path('admin/inventory/delete/', views.delete_inventory, name='delete_inventory'),
 
     path('admin/borrow_records/', views.borrow_record_list, name='borrow_record_list'),
+    path('admin/circulation/borrow/', views.batch_borrow, name='batch_borrow'),
+    path('admin/circulation/return/', views.batch_return, name='batch_return'),
     path('admin/operation_logs/', views.operation_log_list, name='operation_log_list'),
+    path('admin/export/<str:kind>/', views.export_data, name='export_data'),
 ]
 
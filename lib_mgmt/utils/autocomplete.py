@@ -0,0 +1,309 @@
+from ..models import Reader, Book
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Max
+import bisect
+import itertools
+import logging
+import os
+import pickle
+import threading
+
+# 输入联想（typeahead）的内存索引
+# 每个字段一个 Index：有序数组做前缀查找（二分），三元组倒排做中间匹配，查询不访问数据库；
+# Web 进程启动时在后台线程预热（wsgi.py，AUTOCOMPLETE_WARM），没有预热时首次使用时建立；
+# 建立不占用查询锁，建好后整体替换，之后由 signal 和批量导入的钩子增量维护。
+# 索引只在本进程内，多进程部署时其他进程的修改要等下次重建（或重新加载快照）才能看到
+GRAM = 3
+# 单次查询参与排序的匹配数与中间匹配最多核对的候选数，保证常见前缀、常见片段也在常数时间内返回
+MAX_SCAN = 1000
+MAX_CANDIDATES = 5000
+MAX_LIMIT = 20
+CHUNK_SIZE = 5000
+
+logger = logging.getLogger(__name__)
+EMPTY = frozenset()
+
+# 图书字段任何登录用户可查，读者字段仅管理员可查
+BOOK_FIELDS = ('title', 'author')
+READER_FIELDS = ('username', 'name')
+FIELDS = BOOK_FIELDS + READER_FIELDS
+
+def normalize(text):
+    return ' '.join(str(text).lower().split())
+
+def trigrams(norm):
+    return {norm[i:i+GRAM] for i in range(len(norm) - GRAM + 1)}
+
+class Index:
+    def __init__(self):
+        self.docs = {}    # 对象 id -> 文本
+        self.counts = {}  # 文本 -> 引用它的对象数，同名图书只出一条联想，按引用数排序
+        self.keys = []    # 有序的 (规范化文本, 文本)
+        self.norms = {}   # 文本 -> 规范化文本
+        self.grams = {}   # 三元组 -> {文本}
+
+    # 批量载入 (id, 文本)，只排序一次，用于全量建立
+    def load(self, pairs):
+        new = []
+        for doc_id, text in pairs:
+            text = (text or '').strip()
+            if not text:
+                continue
+            self.docs[doc_id] = text
+            n = self.counts.get(text, 0)
+            self.counts[text] = n + 1
+            if n == 0:
+                norm = self.norms[text] = normalize(text)
+                new.append((norm, text))
+        self.keys.extend(new)
+        self.keys.sort()
+        for norm, text in new:
+            for gram in trigrams(norm):
+                self.grams.setdefault(gram, set()).add(text)
+
+    def add(self, doc_id, text):
+        text = (text or '').strip()
+        if self.docs.get(doc_id) == text:
+            return
+        self.remove(doc_id)
+        if not text:
+            return
+        self.docs[doc_id] = text
+        n = self.counts.get(text, 0)
+        self.counts[text] = n + 1
+        if n == 0:
+            norm = self.norms[text] = normalize(text)
+            bisect.insort(self.keys, (norm, text))
+            for gram in trigrams(norm):
+                self.grams.setdefault(gram, set()).add(text)
+
+    def remove(self, doc_id):
+        text = self.docs.pop(doc_id, None)
+        if text is None:
+            return
+        n = self.counts[text] - 1
+        if n:
+            self.counts[text] = n
+            return
+        del self.counts[text]
+        norm = self.norms.pop(text)
+        del self.keys[bisect.bisect_left(self.keys, (norm, text))]
+        for gram in trigrams(norm):
+            texts = self.grams[gram]
+            texts.discard(text)
+            if not texts:
+                del self.grams[gram]
+
+    # 前缀匹配在前，不足 limit 条时用三元组补充中间匹配；各自按引用数降序、文本升序
+    def complete(self, query, limit=10):
+        query = normalize(query)
+        if not query:
+            return []
+        start = bisect.bisect_left(self.keys, (query,))
+        prefix = []
+        for norm, text in self.keys[start:start + MAX_SCAN]:
+            if not norm.startswith(query):
+                break
+            prefix.append(text)
+        results = sorted(prefix, key=self.rank)[:limit]
+
+        if len(results) < limit and len(query) >= GRAM:
+            # 取最短的倒排集合的前 MAX_CANDIDATES 个与其余集合求交，再核对片段是否连续出现
+            postings = sorted((self.grams.get(gram, EMPTY) for gram in trigrams(query)), key=len)
+            candidates = set(itertools.islice(postings[0], MAX_CANDIDATES)).intersection(*postings[1:])
+            infix = []
+            for text in candidates:
+                norm = self.norms[text]
+                if query in norm and not norm.startswith(query):
+                    infix.append(text)
+                    if len(infix) >= MAX_SCAN:
+                        break
+            results += sorted(infix, key=self.rank)[:limit - len(results)]
+        return [{'text': text, 'count': self.counts[text]} for text in results]
+
+    def rank(self, text):
+        return (-self.counts[text], text)
+
+_indexes = None
+# 查询与增量维护共用 _lock；建立索引只持有 _build_lock，同一时间只建一份
+_lock = threading.Lock()
+_build_lock = threading.Lock()
+_building = False
+# 建立期间提交的增量更新，建好后在替换前补上
+_pending = []
+
+def reader_name(user):
+    return user.get_full_name()
+
+def book_rows(books):
+    return books.values_list('id', 'title', 'author').order_by('id').iterator(chunk_size=CHUNK_SIZE)
+
+# 读者按 user_id 索引，用户改名时不需要再查读者表
+def reader_rows(readers):
+    rows = readers.values_list('user_id', 'user__username', 'user__first_name', 'user__last_name') \
+                  .order_by('user_id').iterator(chunk_size=CHUNK_SIZE)
+    for user_id, username, first_name, last_name in rows:
+        yield user_id, username, f'{first_name} {last_name}'.strip()
+
+def build():
+    indexes = {field: Index() for field in FIELDS}
+    books = list(book_rows(Book.objects.all()))
+    indexes['title'].load((book_id, title) for book_id, title, author in books)
+    indexes['author'].load((book_id, author) for book_id, title, author in books)
+    readers = list(reader_rows(Reader.objects.all()))
+    indexes['username'].load((user_id, username) for user_id, username, name in readers)
+    indexes['name'].load((user_id, name) for user_id, username, name in readers)
+    return indexes
+
+def snapshot_path():
+    return getattr(settings, 'AUTOCOMPLETE_SNAPSHOT', None)
+
+# 快照记录建立时的最大 id 与对象数：载入后补上更新的对象，
+# 对象数对不上（快照之后有删除）时放弃快照改为重建；快照之后的改名只能靠重新生成快照
+def save_snapshot(path=None):
+    path = path or snapshot_path()
+    state = {
+        'book_max_id': Book.objects.aggregate(Max('id'))['id__max'] or 0,
+        'reader_max_id': Reader.objects.aggregate(Max('user_id'))['user_id__max'] or 0,
+    }
+    state['books'] = Book.objects.filter(id__lte=state['book_max_id']).count()
+    state['readers'] = Reader.objects.filter(user_id__lte=state['reader_max_id']).count()
+    state['indexes'] = build()
+    with open(path + '.tmp', 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + '.tmp', path)
+    return state
+
+def load_snapshot(path):
+    with open(path, 'rb') as f:
+        state = pickle.load(f)
+    indexes = state['indexes']
+    if Book.objects.filter(id__lte=state['book_max_id']).count() != state['books'] or \
+       Reader.objects.filter(user_id__lte=state['reader_max_id']).count() != state['readers']:
+        return None
+    for book_id, title, author in book_rows(Book.objects.filter(id__gt=state['book_max_id'])):
+        indexes['title'].add(book_id, title)
+        indexes['author'].add(book_id, author)
+    for user_id, username, name in reader_rows(Reader.objects.filter(user_id__gt=state['reader_max_id'])):
+        indexes['username'].add(user_id, username)
+        indexes['name'].add(user_id, name)
+    return indexes
+
+def _build():
+    global _indexes, _building
+    with _build_lock:
+        if _indexes is not None:
+            return
+        with _lock:
+            _building = True
+        try:
+            path = snapshot_path()
+            loaded = load_snapshot(path) if path and os.path.exists(path) else None
+            built = loaded if loaded is not None else build()
+            with _lock:
+                for fn in _pending:
+                    fn(built)
+                _indexes = built
+        finally:
+            with _lock:
+                _building = False
+                del _pending[:]
+
+# 取得索引，还没有时在当前线程建立（供命令、基准测试等需要完整索引的调用方）
+def indexes():
+    if _indexes is None:
+        _build()
+    return _indexes
+
+# 在后台线程建立索引，供进程启动时预热；已建立或正在建立时什么都不做
+def warm():
+    if _indexes is not None or _building:
+        return None
+    thread = threading.Thread(target=_warm, name='autocomplete-warm', daemon=True)
+    thread.start()
+    return thread
+
+def _warm():
+    try:
+        _build()
+    except Exception:
+        logger.exception('Failed to build the autocomplete index')
+    finally:
+        close_old_connections()
+
+# 丢弃内存索引，下次使用时重新建立
+def reset():
+    global _indexes
+    with _lock:
+        _indexes = None
+
+# 索引正在建立（如预热中）时直接返回空结果，不让联想请求等待整个建立过程
+def complete(field, query, limit=10):
+    current = _indexes
+    if current is None:
+        if _building:
+            return []
+        current = indexes()
+    with _lock:
+        return current[field].complete(query, min(max(limit, 1), MAX_LIMIT))
+
+# 增量维护：索引还没建立时什么都不做，建立时会从数据库读到最新数据；
+# 正在建立时先记下，建好后补上（建立时可能没读到这次修改）。更新按 id 覆盖，重复执行无害
+# 在事务提交后执行，回滚的修改不会进入索引
+def _apply(fn):
+    def apply():
+        with _lock:
+            if _indexes is not None:
+                fn(_indexes)
+            elif _building:
+                _pending.append(fn)
+    transaction.on_commit(apply)
+
+def index_book(book_id, title, author):
+    def fn(indexes):
+        indexes['title'].add(book_id, title)
+        indexes['author'].add(book_id, author)
+    _apply(fn)
+
+def index_books(books):
+    rows = list(book_rows(books)) if _indexes is not None or _building else []
+    def fn(indexes):
+        for book_id, title, author in rows:
+            indexes['title'].add(book_id, title)
+            indexes['author'].add(book_id, author)
+    _apply(fn)
+
+def remove_book(book_id):
+    def fn(indexes):
+        indexes['title'].remove(book_id)
+        indexes['author'].remove(book_id)
+    _apply(fn)
+
+def index_reader(user):
+    def fn(indexes):
+        indexes['username'].add(user.id, user.username)
+        indexes['name'].add(user.id, reader_name(user))
+    _apply(fn)
+
+def index_readers(readers):
+    rows = list(reader_rows(readers)) if _indexes is not None or _building else []
+    def fn(indexes):
+        for user_id, username, name in rows:
+            indexes['username'].add(user_id, username)
+            indexes['name'].add(user_id, name)
+    _apply(fn)
+
+# 用户资料变更：只更新已是读者的用户
+def update_user(user):
+    if _indexes is not None:
+        if user.id in _indexes['username'].docs:
+            index_reader(user)
+    elif _building and Reader.objects.filter(user_id=user.id).exists():
+        index_reader(user)
+
+def remove_reader(user_id):
+    def fn(indexes):
+        indexes['username'].remove(user_id)
+        indexes['name'].remove(user_id)
+    _apply(fn)
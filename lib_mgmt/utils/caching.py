@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+import time
+
+# 热点读接口的缓存
+# 每个模型有一个版本号，缓存键带上所依赖模型的版本号；
+# 模型变更时（signal 或批量写入后）提升版本号，旧键自然失效，不会读到过期的可借状态
+DEFAULT_TTL = 60
+
+def _version_key(model):
+    return 'cache_version:' + model._meta.label_lower
+
+# 版本号初值取当前毫秒时间，版本键被淘汰后重建也不会与旧版本撞上
+def _initial_version():
+    return int(time.time() * 1000)
+
+def versions(models):
+    keys = [_version_key(model) for model in models]
+    found = cache.get_many(keys)
+    missing = {key: _initial_version() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    return '.'.join(str(found[key]) for key in keys)
+
+# 在事务提交后提升版本号，避免其他请求在提交前把旧数据缓存到新版本下
+def bump(*models):
+    def _bump():
+        for model in models:
+            key = _version_key(model)
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, _initial_version(), None)
+    transaction.on_commit(_bump)
+
+def ttl(name):
+    return getattr(settings, 'CACHE_TTLS', {}).get(name, DEFAULT_TTL)
+
+# 读缓存，未命中时调用 fn 计算并写入；name 对应 settings.CACHE_TTLS 中的超时时间
+def cached(name, models, fn, *parts):
+    key = ':'.join([name, versions(models)] + [str(part) for part in parts])
+    value = cache.get(key)
+    if value is None:
+        value = fn()
+        cache.set(key, value, ttl(name))
+    return value
@@ -0,0 +1,138 @@
+from ..models import Reader, Book, Inventory, BorrowRecord, OperationLog
+from . import caching, rollup
+from django.db import transaction
+from collections import Counter
+from datetime import datetime, timedelta
+
+# 借期
+LOAN_DAYS = 30
+# 批量借还一次最多处理的条目数
+MAX_BATCH = 200
+
+class CirculationError(Exception):
+    pass
+
+# 借阅、归还的事务路径
+# 读者行用 select_for_update 加锁，同一读者的并发借书排队检查配额；
+# 副本用带条件的 UPDATE ... WHERE status=1 抢占，更新 0 行说明已被别人借走，直接失败，不重试
+def borrow(reader_id, inventory_id):
+    today = datetime.now().date()
+    with transaction.atomic():
+        reader = Reader.objects.select_for_update().only('id', 'user_id', 'max_borrow_limit').get(id=reader_id)
+        borrowed = BorrowRecord.objects.filter(reader_id=reader_id, status__in=BorrowRecord.ACTIVE_STATUSES).count()
+        if borrowed >= reader.max_borrow_limit:
+            raise CirculationError("借阅失败，剩余借阅配额不足！")
+        taken = Inventory.objects.filter(id=inventory_id, status=1) \
+                                 .update(status=2, last_borrowed_on=today, last_borrowed_by_id=reader_id)
+        if not taken:
+            raise CirculationError("借阅失败，该副本已被借出或不可借！")
+        # 副本行已被本事务的 UPDATE 锁住，这里不会等待
+        book_id = Inventory.objects.select_for_update().filter(id=inventory_id).values_list('book_id', flat=True).get()
+        record = BorrowRecord.objects.create(reader_id=reader_id, inventory_id=inventory_id, borrow_date=today,
+                                             return_date=today + timedelta(days=LOAN_DAYS), status=1)
+        Book.adjust_copies(book_id, available=-1)
+        # 条件 UPDATE 不触发 signal，手动记录日志并令缓存失效
+        OperationLog.log('update', f'update a Inventory instance: #{inventory_id}', operator_id=reader.user_id)
+        caching.bump(Inventory)
+    return record
+
+# 归还：借阅记录行加锁后用条件 UPDATE 置为已归还，重复提交的归还请求直接失败
+# reader_id 不为空时只允许归还该读者自己的记录
+def return_record(record_id, reader_id=None):
+    with transaction.atomic():
+        records = BorrowRecord.objects.select_for_update().filter(id=record_id, status__in=BorrowRecord.ACTIVE_STATUSES)
+        if reader_id is not None:
+            records = records.filter(reader_id=reader_id)
+        # 只锁借阅记录本身，不 join 其他表，避免连带锁住读者行
+        record = records.only('id', 'inventory_id', 'reader_id').first()
+        if record is None or not BorrowRecord.objects.filter(id=record_id, status__in=BorrowRecord.ACTIVE_STATUSES).update(status=0):
+            raise CirculationError("归还失败，借阅记录不存在或已归还！")
+        # 副本已被管理员改成其他状态时不回到在馆，可借计数也不变
+        if Inventory.objects.filter(id=record.inventory_id, status=2).update(status=1):
+            book_id = Inventory.objects.filter(id=record.inventory_id).values_list('book_id', flat=True).get()
+            Book.adjust_copies(book_id, available=1)
+        user_id = Reader.objects.filter(id=record.reader_id).values_list('user_id', flat=True).get()
+        OperationLog.log('update', f'update a BorrowRecord instance: #{record_id}', operator_id=user_id)
+        OperationLog.log('update', f'update a Inventory instance: #{record.inventory_id}', operator_id=user_id)
+        caching.bump(BorrowRecord, Inventory)
+
+# 流通台批量借书：一个事务内锁住读者行和所有待借副本
+# 配额按整批检查，可借副本数超过剩余配额时整批不借；不可借的副本逐项报错，其余照常借出
+# 副本状态一次 UPDATE，借阅记录一次 bulk_create，只写一条汇总日志
+# 返回与 inventory_ids 顺序一致的逐项结果
+def borrow_many(reader_id, inventory_ids, operator=None):
+    today = datetime.now().date()
+    inventory_ids = list(dict.fromkeys(inventory_ids))
+    with transaction.atomic():
+        reader = Reader.objects.select_for_update().only('id', 'max_borrow_limit').get(id=reader_id)
+        remaining = reader.max_borrow_limit - BorrowRecord.objects.filter(reader_id=reader_id, status__in=BorrowRecord.ACTIVE_STATUSES).count()
+        available = set(Inventory.objects.select_for_update()
+                                         .filter(id__in=inventory_ids, status=1)
+                                         .values_list('id', flat=True))
+        results = [{'id': inv_id, 'success': inv_id in available,
+                    'error': None if inv_id in available else "该副本已被借出或不可借！"}
+                   for inv_id in inventory_ids]
+        if len(available) > remaining:
+            for item in results:
+                if item['success']:
+                    item['success'] = False
+                    item['error'] = "剩余借阅配额不足！"
+            return results
+        if not available:
+            return results
+
+        Inventory.objects.filter(id__in=available, status=1) \
+                         .update(status=2, last_borrowed_on=today, last_borrowed_by_id=reader_id)
+        BorrowRecord.objects.bulk_create([
+            BorrowRecord(reader_id=reader_id, inventory_id=inv_id, borrow_date=today,
+                         return_date=today + timedelta(days=LOAN_DAYS), status=1)
+            for inv_id in inventory_ids if inv_id in available
+        ])
+        # bulk_create 和 update 都不触发 signal，可借计数、借阅日汇总按图书汇总后各更新一次
+        books = Counter(Inventory.objects.filter(id__in=available).values_list('book_id', 'book__category_id'))
+        for (book_id, category_id), n in books.items():
+            Book.adjust_copies(book_id, available=-n)
+            rollup.add_borrows(today, book_id, category_id, reader_id, n)
+        OperationLog.log('bulk_borrow', f'borrow {len(available)} Inventory instances for Reader #{reader_id}: '
+                         + ', '.join(f'#{inv_id}' for inv_id in sorted(available)), operator)
+        caching.bump(BorrowRecord, Inventory)
+    return results
+
+# 流通台批量还书：锁住所有待还借阅记录，一次 UPDATE 置为已归还，对应副本一次 UPDATE 回到在馆
+# 不存在或已归还的记录逐项报错，只写一条汇总日志
+def return_many(record_ids, operator=None):
+    record_ids = list(dict.fromkeys(record_ids))
+    with transaction.atomic():
+        found = dict(BorrowRecord.objects.select_for_update()
+                                         .filter(id__in=record_ids, status__in=BorrowRecord.ACTIVE_STATUSES)
+                                         .values_list('id', 'inventory_id'))
+        results = [{'id': record_id, 'success': record_id in found,
+                    'error': None if record_id in found else "借阅记录不存在或已归还！"}
+                   for record_id in record_ids]
+        if not found:
+            return results
+
+        BorrowRecord.objects.filter(id__in=found.keys(), status__in=BorrowRecord.ACTIVE_STATUSES).update(status=0)
+        # 副本已被管理员改成其他状态时不回到在馆
+        copies = list(Inventory.objects.select_for_update()
+                                       .filter(id__in=found.values(), status=2)
+                                       .values_list('id', 'book_id'))
+        Inventory.objects.filter(id__in=[inv_id for inv_id, book_id in copies]).update(status=1)
+        for book_id, n in Counter(book_id for inv_id, book_id in copies).items():
+            Book.adjust_copies(book_id, available=n)
+        OperationLog.log('bulk_return', f'return {len(found)} BorrowRecord instances: '
+                         + ', '.join(f'#{record_id}' for record_id in sorted(found)), operator)
+        caching.bump(BorrowRecord, Inventory)
+    return results
+
+# 逾期扫描：应还日期已到（含当天）仍未归还的记录一次性置为逾期
+# 走 (status, return_date) 索引的单条 UPDATE，已逾期的不会再次匹配，可以随时重复执行
+# 返回本次翻转的记录数
+def sweep_overdue(today=None):
+    today = today or datetime.now().date()
+    with transaction.atomic():
+        changed = BorrowRecord.objects.filter(status=1, return_date__lte=today).update(status=-1)
+        if changed:
+            OperationLog.log('sweep_overdue', f'mark {changed} BorrowRecord instances overdue (due on or before {today})')
+            caching.bump(BorrowRecord)
+    return changed
@@ -0,0 +1,110 @@
+from ..models import Reader, Book, Inventory, BorrowRecord, OperationLog, INVENTORY_STATUS_LABELS, BORROW_STATUS_LABELS
+from django.utils import timezone
+import csv
+import io
+import json
+import zlib
+
+# 流式导出
+# 按主键分段（WHERE id > 上一段末尾 ORDER BY id LIMIT n）读取 values_list，关联字段在同一条查询里 join 出来，
+# 不构造模型实例；每段编码后立即交给 StreamingHttpResponse 发送，内存占用与总行数无关。
+# 不用 QuerySet.iterator()：MySQL 驱动不支持服务端游标，会把整个结果集读进内存
+CHUNK_SIZE = 2000
+
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'ndjson': ('application/x-ndjson; charset=utf-8', 'ndjson'),
+}
+
+def _localtime(value):
+    return timezone.localtime(value).strftime('%Y-%m-%d %H:%M:%S') if value else None
+
+class Export:
+    # columns 为 (列名, values_list 字段)，第一列必须是本表主键；convert 为 {列名: 转换函数}
+    def __init__(self, model, columns, convert=None):
+        self.model = model
+        self.headers = [header for header, field in columns]
+        self.fields = [field for header, field in columns]
+        convert = convert or {}
+        self.converters = [convert.get(header) for header in self.headers] if convert else None
+
+    def chunks(self):
+        last_id = 0
+        while True:
+            rows = list(self.model.objects.filter(id__gt=last_id).order_by('id').values_list(*self.fields)[:CHUNK_SIZE])
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            if self.converters:
+                rows = [[fn(value) if fn else value for fn, value in zip(self.converters, row)] for row in rows]
+            yield rows
+
+def _status(labels):
+    return lambda status: labels.get(status, 'Unknown')
+
+EXPORTS = {
+    'books': Export(Book, [
+        ('id', 'id'), ('title', 'title'), ('author', 'author'), ('publisher', 'publisher'),
+        ('publish_date', 'publish_date'), ('index_number', 'index_number'),
+        ('category_number', 'category__category_number'), ('category_name', 'category__name'),
+        ('description', 'description'), ('total_copies', 'total_copies'), ('available_copies', 'available_copies'),
+    ]),
+    'inventory': Export(Inventory, [
+        ('id', 'id'), ('book_id', 'book_id'), ('book_title', 'book__title'), ('book_index_number', 'book__index_number'),
+        ('status', 'status'), ('status_label', 'status'), ('location', 'location'),
+        ('last_borrowed_on', 'last_borrowed_on'), ('last_borrowed_by', 'last_borrowed_by__user__username'),
+    ], {'status_label': _status(INVENTORY_STATUS_LABELS)}),
+    # 不导出密码哈希
+    'readers': Export(Reader, [
+        ('id', 'id'), ('username', 'user__username'), ('first_name', 'user__first_name'),
+        ('last_name', 'user__last_name'), ('email', 'user__email'), ('is_active', 'user__is_active'),
+        ('is_staff', 'user__is_staff'), ('max_borrow_limit', 'max_borrow_limit'),
+    ]),
+    'borrow_records': Export(BorrowRecord, [
+        ('id', 'id'), ('reader_id', 'reader_id'), ('username', 'reader__user__username'),
+        ('inventory_id', 'inventory_id'), ('book_title', 'inventory__book__title'),
+        ('book_index_number', 'inventory__book__index_number'), ('borrow_date', 'borrow_date'),
+        ('return_date', 'return_date'), ('status', 'status'), ('status_label', 'status'),
+    ], {'status_label': _status(BORROW_STATUS_LABELS)}),
+    'operation_logs': Export(OperationLog, [
+        ('id', 'id'), ('timestamp', 'timestamp'), ('operation_type', 'operation_type'),
+        ('username', 'operator__username'), ('content', 'content'),
+    ], {'timestamp': _localtime}),
+}
+
+def _encode_csv(export, rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+def _encode_ndjson(export, rows):
+    return ''.join(json.dumps(dict(zip(export.headers, row)), ensure_ascii=False, default=str) + '\n' for row in rows)
+
+ENCODERS = {
+    'csv': _encode_csv,
+    'ndjson': _encode_ndjson,
+}
+
+def filename(kind, fmt, compress=False):
+    name = f"{kind}-{timezone.localtime().strftime('%Y%m%d')}.{FORMATS[fmt][1]}"
+    return name + '.gz' if compress else name
+
+# 逐段产出编码后的字节；CSV 带 BOM 和表头，方便直接用 Excel 打开
+# compress 为 True 时输出 gzip 格式，每段压缩后立即产出
+def stream(kind, fmt, compress=False):
+    export = EXPORTS[kind]
+    encode = ENCODERS[fmt]
+    compressor = zlib.compressobj(wbits=31) if compress else None
+
+    def emit(text):
+        data = text.encode('utf-8')
+        return compressor.compress(data) if compressor else data
+
+    if fmt == 'csv':
+        yield emit('\ufeff' + _encode_csv(export, [export.headers]))
+    for rows in export.chunks():
+        data = emit(encode(export, rows))
+        if data:
+            yield data
+    if compressor:
+        yield compressor.flush()
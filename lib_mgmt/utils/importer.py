@@ -0,0 +1,162 @@
+from ..models import Reader, Book, Category, Inventory, OperationLog
+from . import search, caching, upload_validator, autocomplete, passwords
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Max
+
+# CSV 批量导入引擎
+# 上传文件由 upload_validator 按 Schema 流式读取、逐列校验并转换类型，文件只解析一遍；
+# 导入器拿到每块通过校验的行，解析需要新建的关联数据后 bulk_create，整个导入在一个事务里，
+# 有任意一行出错则整体回滚，并返回所有出错行
+CHUNK_SIZE = upload_validator.CHUNK_SIZE
+# 最多保留的错误条数，保证大文件出错时内存仍然有界
+MAX_ERRORS = 100
+
+class CsvImporter:
+    model = None
+    # upload_validator 中对应实体的 Schema
+    schema = None
+    # 导入时顺带写入的其他模型
+    touches = ()
+
+    def __init__(self, operator=None):
+        self.operator = operator
+
+    # 对一块已校验的行构造待插入的对象
+    def build(self, items):
+        raise NotImplementedError
+
+    # 一块数据写入后调用，用于维护冗余数据
+    def inserted(self, objs):
+        pass
+
+    def before(self):
+        pass
+
+    def after(self, created):
+        pass
+
+    # 导入成功后写入的那一条汇总日志
+    def describe(self, created):
+        return f"bulk create {created} {self.model.__name__} instances"
+
+    def run(self, csv_file, on_progress=None):
+        result = {'rows': 0, 'created': 0, 'errors': []}
+        with transaction.atomic():
+            self.before()
+            for batch in self.schema.validate(csv_file):
+                result['rows'] += batch.size
+                for line, error in batch.errors:
+                    self.add_error(result, line, error)
+                self.flush(batch.rows, result)
+                if on_progress:
+                    on_progress(result)
+
+            if result['errors']:
+                transaction.set_rollback(True)
+                result['created'] = 0
+            else:
+                self.after(result['created'])
+                # bulk_create 不触发 signal，手动令缓存失效
+                caching.bump(self.model, *self.touches)
+                OperationLog.log('bulk_create', self.describe(result['created']), self.operator)
+        result['success'] = not result['errors']
+        if result['errors']:
+            first = result['errors'][0]
+            result['error'] = f"Line {first['line']}: {first['error']}"
+        return result
+
+    def flush(self, items, result):
+        # 已有错误时只继续校验，不再写库
+        if result['errors'] or not items:
+            return
+        objs = self.build(items)
+        self.model.objects.bulk_create(objs, batch_size=CHUNK_SIZE)
+        self.inserted(objs)
+        result['created'] += len(objs)
+
+    def add_error(self, result, line, error):
+        if len(result['errors']) < MAX_ERRORS:
+            result['errors'].append({'line': line, 'error': error})
+
+# 图书：title,author,publisher,publish_date,index_number,category_number,description
+class BookImporter(CsvImporter):
+    model = Book
+    schema = upload_validator.BOOK_SCHEMA
+    touches = (Category,)
+
+    def build(self, items):
+        numbers = {item['category'] for line, item in items}
+        categories = dict(Category.objects.filter(category_number__in=numbers).values_list('category_number', 'id'))
+        # 不存在的分类号先批量建成未命名分类，再查一次拿到 id
+        missing = numbers - categories.keys()
+        if missing:
+            Category.objects.bulk_create([Category(category_number=number, name='未命名分类') for number in missing])
+            categories.update(Category.objects.filter(category_number__in=missing).values_list('category_number', 'id'))
+        return [Book(category_id=categories[item.pop('category')], **item) for line, item in items]
+
+    # bulk_create 不触发 signal，新书的检索索引、联想索引在这里统一建立
+    def before(self):
+        self.last_id = Book.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+
+    def after(self, created):
+        search.index_books(Book.objects.filter(id__gt=self.last_id))
+        autocomplete.index_books(Book.objects.filter(id__gt=self.last_id))
+
+# 分类：category_number,name
+class CategoryImporter(CsvImporter):
+    model = Category
+    schema = upload_validator.CATEGORY_SCHEMA
+
+    def build(self, items):
+        return [Category(**item) for line, item in items]
+
+# 库存：book_id,status,location[,last_borrowed_on,last_borrowed_by]
+class InventoryImporter(CsvImporter):
+    model = Inventory
+    schema = upload_validator.INVENTORY_SCHEMA
+    touches = (Book,)
+
+    def build(self, items):
+        return [Inventory(**item) for line, item in items]
+
+    # 按图书汇总本块新增的副本数，更新图书上的冗余计数
+    def inserted(self, objs):
+        counts = {}
+        for inv in objs:
+            total, available = counts.get(inv.book_id, (0, 0))
+            counts[inv.book_id] = (total + 1, available + int(inv.status == 1))
+        for book_id, (total, available) in counts.items():
+            Book.adjust_copies(book_id, total=total, available=available)
+
+# 读者：username,first_name,last_name,email,password,is_staff,max_borrow_limit[,password_hash]
+class ReaderImporter(CsvImporter):
+    model = Reader
+    schema = upload_validator.READER_SCHEMA
+    touches = (User,)
+
+    def before(self):
+        self.prehashed = 0
+
+    # 一块的明文密码交给进程池并行哈希；填了 password_hash（已通过校验）的原样写入
+    # User 与 Reader 各一次 bulk_create，不逐个触发 signal
+    def build(self, items):
+        users, limits = [], {}
+        plain = [item for line, item in items if item['password_hash'] is None]
+        for item, password in zip(plain, passwords.hash_passwords(item['password'] for item in plain)):
+            item['password_hash'] = password
+        self.prehashed += len(items) - len(plain)
+        for line, item in items:
+            limits[item['username']] = item.pop('max_borrow_limit')
+            item['password'] = item.pop('password_hash')
+            users.append(User(**item))
+        User.objects.bulk_create(users, batch_size=CHUNK_SIZE)
+        ids = User.objects.filter(username__in=limits.keys()).values_list('username', 'id')
+        return [Reader(user_id=user_id, max_borrow_limit=limits[username]) for username, user_id in ids]
+
+    def describe(self, created):
+        return f"bulk create {created} Reader instances ({self.prehashed} with pre-hashed passwords)"
+
+    # bulk_create 不触发 signal，新读者在这里加入联想索引
+    def inserted(self, objs):
+        autocomplete.index_readers(Reader.objects.filter(user_id__in=[reader.user_id for reader in objs]))
@@ -0,0 +1,120 @@
+from ..models import ImportJob
+from . import importer
+from django.conf import settings
+from django.core.files import File
+from django.db import close_old_connections
+from django.utils import timezone
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+# 本地后台任务：任务状态存在 ImportJob 表里，导入在进程内线程池执行，不依赖外部 broker
+IMPORTERS = {
+    'books': importer.BookImporter,
+    'readers': importer.ReaderImporter,
+    'categories': importer.CategoryImporter,
+    'inventories': importer.InventoryImporter,
+}
+WORKERS = getattr(settings, 'IMPORT_JOB_WORKERS', 2)
+JOB_DIR = getattr(settings, 'IMPORT_JOB_DIR', None) or tempfile.gettempdir()
+# 任务在进程内线程中执行，进程重启或线程异常退出后不会再有人更新它；
+# 超过这个时间仍处于 Pending/Running 的任务视为已中断
+TIMEOUT = getattr(settings, 'IMPORT_JOB_TIMEOUT', 3600)
+
+_pool = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='import-job')
+# 导入本身在一个大事务里，进度用另一个线程（另一条连接）写入，轮询时立刻可见
+_progress_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='import-progress')
+
+# 同 oplog.is_async：关闭时在当前请求内直接执行
+def is_async():
+    return getattr(settings, 'IMPORT_JOBS_ASYNC', True)
+
+# 保存上传文件并创建任务，立即返回任务
+def submit(kind, upload, operator=None):
+    fd, path = tempfile.mkstemp(prefix=f'import_{kind}_', suffix='.csv', dir=JOB_DIR)
+    with os.fdopen(fd, 'wb') as f:
+        for chunk in upload.chunks():
+            f.write(chunk)
+    job = ImportJob.objects.create(kind=kind, file_path=path, operator=operator)
+    if is_async():
+        _pool.submit(_run_in_thread, job.id)
+    else:
+        run(job.id)
+        job.refresh_from_db()
+    return job
+
+def _run_in_thread(job_id):
+    try:
+        run(job_id)
+    except Exception:
+        logger.exception('Import job #%s failed', job_id)
+    finally:
+        close_old_connections()
+
+def run(job_id):
+    job = ImportJob.objects.select_related('operator').get(id=job_id)
+    ImportJob.objects.filter(id=job_id).update(status=1, started_at=timezone.now())
+    try:
+        on_progress = None
+        if is_async():
+            on_progress = lambda result: _progress_pool.submit(_save_progress, job_id, result['rows'])
+        with open(job.file_path, 'rb') as f:
+            result = IMPORTERS[job.kind](operator=job.operator).run(File(f), on_progress=on_progress)
+        ImportJob.objects.filter(id=job_id).update(
+            status=2 if result['success'] else -1,
+            rows=result['rows'], created=result['created'],
+            errors=json.dumps(result['errors'], ensure_ascii=False),
+            finished_at=timezone.now(),
+        )
+    except Exception as e:
+        ImportJob.objects.filter(id=job_id).update(
+            status=-1, errors=json.dumps([{'line': 0, 'error': str(e)}], ensure_ascii=False), finished_at=timezone.now(),
+        )
+        raise
+    finally:
+        if os.path.exists(job.file_path):
+            os.remove(job.file_path)
+
+def _save_progress(job_id, rows):
+    try:
+        ImportJob.objects.filter(id=job_id, status=1).update(rows=rows)
+    except Exception:
+        # 进度只是展示用，写失败（如 SQLite 被导入事务锁住）时忽略
+        pass
+    finally:
+        close_old_connections()
+
+# 轮询时把超时的 Pending/Running 任务标记为失败，前端的轮询得以结束
+def expire_stale(job):
+    if job.status not in (0, 1):
+        return job
+    now = timezone.now()
+    if (now - (job.started_at or job.created_at)).total_seconds() < TIMEOUT:
+        return job
+    ImportJob.objects.filter(id=job.id, status=job.status).update(
+        status=-1, errors=json.dumps([{'line': 0, 'error': 'Import job was interrupted'}]), finished_at=now,
+    )
+    job.refresh_from_db()
+    return job
+
+# 供轮询接口返回的任务状态
+def job_status(job):
+    end = job.finished_at or timezone.now()
+    elapsed = (end - job.started_at).total_seconds() if job.started_at else 0
+    errors = json.loads(job.errors) if job.errors else []
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'rows': job.rows,
+        'created': job.created,
+        'elapsed': round(elapsed, 3),
+        'throughput': round(job.rows / elapsed, 1) if elapsed > 0 else 0,
+        'errors': errors,
+        'error': f"Line {errors[0]['line']}: {errors[0]['error']}" if errors else None,
+    }
@@ -0,0 +1,106 @@
+from django.conf import settings
+from collections import Counter, deque
+import re
+import threading
+import time
+
+# 请求级的查询数与耗时统计
+# 每个请求一条记录，放在进程内的环形缓冲区里，只保留最近 QUERY_METRICS_BUFFER 条
+BUFFER_SIZE = getattr(settings, 'QUERY_METRICS_BUFFER', 1000)
+# 每条记录最多保留的重复查询指纹数
+MAX_DUPLICATES = 5
+
+_buffer = deque(maxlen=BUFFER_SIZE)
+_lock = threading.Lock()
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\((?:\s*\?\s*,)+\s*\?\s*\)')
+_TRANSACTION_CONTROL = ('BEGIN', 'SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK')
+
+# 查询指纹：字面量替换成 ?，IN 列表折叠，同一语句不同参数得到同一个指纹
+def fingerprint(sql):
+    sql = _STRING.sub('?', sql.replace('%s', '?'))
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('(...)', sql)
+    return ' '.join(sql.split())
+
+class QueryRecorder:
+    def __init__(self):
+        self.count = 0
+        self.db_time = 0.0
+        self.fingerprints = Counter()
+
+    # 作为 connection.execute_wrapper 使用
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.count += 1
+            # 事务控制语句不参与重复查询统计
+            if not sql.startswith(_TRANSACTION_CONTROL):
+                self.fingerprints[fingerprint(sql)] += 1
+
+    def duplicates(self):
+        return [{'sql': sql, 'count': n} for sql, n in self.fingerprints.most_common(MAX_DUPLICATES) if n > 1]
+
+def record(entry):
+    with _lock:
+        _buffer.append(entry)
+
+def clear():
+    with _lock:
+        _buffer.clear()
+
+def recent():
+    with _lock:
+        return list(_buffer)
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+# 按 URL 名汇总缓冲区中的记录
+def summary():
+    views = {}
+    for entry in recent():
+        views.setdefault(entry['view'], []).append(entry)
+    rows = []
+    for view, entries in views.items():
+        wall = [entry['wall_ms'] for entry in entries]
+        queries = [entry['queries'] for entry in entries]
+        duplicates = Counter()
+        for entry in entries:
+            for item in entry['duplicates']:
+                duplicates[item['sql']] += item['count']
+        rows.append({
+            'view': view,
+            'requests': len(entries),
+            'wall_ms_avg': round(sum(wall) / len(wall), 2),
+            'wall_ms_p95': round(_percentile(wall, 0.95), 2),
+            'wall_ms_max': round(max(wall), 2),
+            'db_ms_avg': round(sum(entry['db_ms'] for entry in entries) / len(entries), 2),
+            'queries_avg': round(sum(queries) / len(queries), 2),
+            'queries_max': max(queries),
+            'budget': budget(view),
+            'over_budget': sum(entry['over_budget'] for entry in entries),
+            'duplicates': [{'sql': sql, 'count': n} for sql, n in duplicates.most_common(MAX_DUPLICATES)],
+        })
+    rows.sort(key=lambda row: row['wall_ms_avg'], reverse=True)
+    return rows
+
+# 各视图的查询数上限，settings.QUERY_BUDGETS 以 URL 名为键，如 'lib:user_center'
+def budget(view):
+    return getattr(settings, 'QUERY_BUDGETS', {}).get(view)
+
+def is_enabled():
+    return getattr(settings, 'QUERY_METRICS_ENABLED', True)
+
+# 严格模式下超出预算直接抛异常，测试里打开
+def is_strict():
+    return getattr(settings, 'QUERY_BUDGETS_STRICT', False)
+
+class QueryBudgetExceeded(Exception):
+    pass
@@ -0,0 +1,93 @@
+from . import caching
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import IntegrityError, close_old_connections, transaction
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# 操作日志异步批量写入
+# 日志在事务提交时（on_commit）进入进程内缓冲区，回滚的事务不会留下日志；
+# 后台线程按条数或时间间隔用 bulk_create 批量落库，进程退出时再刷一次
+BATCH_SIZE = getattr(settings, 'OPERATION_LOG_BATCH_SIZE', 200)
+FLUSH_INTERVAL = getattr(settings, 'OPERATION_LOG_FLUSH_INTERVAL', 1.0)
+
+_buffer = []
+_lock = threading.Lock()
+_wakeup = threading.Event()
+_worker = None
+_admin_id = None
+
+# 关闭异步时在提交后立即写入，便于测试和排查
+def is_async():
+    return getattr(settings, 'OPERATION_LOG_ASYNC', True)
+
+def enqueue(entry):
+    transaction.on_commit(lambda: _push(entry))
+
+def _push(entry):
+    if not is_async():
+        _write([entry])
+        return
+    with _lock:
+        _buffer.append(entry)
+        full = len(_buffer) >= BATCH_SIZE
+    _ensure_worker()
+    if full:
+        _wakeup.set()
+
+def _ensure_worker():
+    global _worker
+    if _worker is not None and _worker.is_alive():
+        return
+    with _lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run, name='operation-log-writer', daemon=True)
+            _worker.start()
+
+def _run():
+    while True:
+        _wakeup.wait(FLUSH_INTERVAL)
+        _wakeup.clear()
+        try:
+            flush()
+        except Exception:
+            logger.exception('Failed to flush operation logs')
+        finally:
+            close_old_connections()
+
+# 把缓冲区中的日志全部写入数据库，返回写入条数
+def flush():
+    with _lock:
+        entries = _buffer[:]
+        del _buffer[:]
+    if entries:
+        _write(entries)
+    return len(entries)
+
+def _write(entries):
+    try:
+        with transaction.atomic():
+            type(entries[0]).objects.bulk_create(entries, batch_size=BATCH_SIZE)
+    except IntegrityError:
+        # 操作者可能在日志落库前已被删除，逐条重试并去掉失效的操作者
+        for entry in entries:
+            try:
+                with transaction.atomic():
+                    entry.save()
+            except IntegrityError:
+                entry.operator_id = None
+                entry.save()
+    # 日志列表的总数缓存随之失效
+    caching.bump(type(entries[0]))
+
+# 图书/分类变更的日志记在 admin 账户名下，id 只查一次
+def admin_operator_id():
+    global _admin_id
+    if _admin_id is None:
+        _admin_id = User.objects.filter(username='admin').values_list('id', flat=True).first()
+    return _admin_id
+
+atexit.register(flush)
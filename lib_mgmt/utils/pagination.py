@@ -0,0 +1,89 @@
+from . import caching
+from django.apps import apps
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import connections
+from django.db.models import Q
+from datetime import date, datetime
+import base64
+import hashlib
+import json
+
+# 游标编码为不透明的 token：[排序键值, id, 是否向前翻页]
+def encode_cursor(value, pk, backward=False):
+    if isinstance(value, (date, datetime)):
+        value = value.isoformat()
+    raw = json.dumps([value, pk, backward]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        value, pk, backward = json.loads(raw)
+        if not isinstance(value, (str, int, float, type(None))):
+            raise ValueError
+        return value, int(pk), bool(backward)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+# 排序键是模型字段时按字段类型转换游标中的值，如日期字符串；注解（score 等）原样使用
+def _cursor_value(model, field, value):
+    try:
+        return model._meta.get_field(field).to_python(value) if value is not None else None
+    except FieldDoesNotExist:
+        return value
+    except ValidationError:
+        raise ValueError('Invalid cursor')
+
+# SQL 中出现的全部模型（join 的表与子查询里的表），按关联字段过滤时关联表变更也要让总数失效
+def query_models(sql, using='default'):
+    quote = connections[using].ops.quote_name
+    return [model for model in apps.get_models() if quote(model._meta.db_table) in sql]
+
+# 总数按 SQL 缓存，深翻页时不再每页 COUNT(*) 一遍，查询涉及的任一模型有变更时随版本号失效
+def cached_count(Obj):
+    sql = str(Obj.query)
+    key = 'paginate:count:' + hashlib.md5(sql.encode()).hexdigest()
+    return caching.cached('paginate_count', query_models(sql, Obj.db), Obj.count, key)
+
+# 游标（keyset）分页
+# token 无法解析时抛出 ValueError
+# 按 (key, id) 稳定排序，key 以 '-' 开头表示降序，id 始终升序作为同值时的次序
+# 每页只走一次索引范围扫描，第一万页与第一页代价相同
+def paginate_cursor(Obj, token, per_page=10, key='id'):
+    desc = key.startswith('-')
+    field = key.lstrip('-')
+    if field == 'id':
+        ordering = (key,)
+    else:
+        ordering = (key, 'id')
+
+    backward = False
+    if token:
+        value, pk, backward = decode_cursor(token)
+        value = _cursor_value(Obj.model, field, value)
+        # 向前翻页时所有比较方向取反
+        after = desc == backward
+        if field == 'id':
+            cond = Q(id__gt=pk) if after else Q(id__lt=pk)
+        else:
+            cond = Q(**{field + ('__gt' if after else '__lt'): value}) | \
+                   Q(**{field: value, 'id__gt' if not backward else 'id__lt': pk})
+        Obj = Obj.filter(cond)
+
+    scan = ordering
+    if backward:
+        scan = tuple(o[1:] if o.startswith('-') else '-' + o for o in ordering)
+    rows = list(Obj.order_by(*scan).values_list(field, 'id')[:per_page+1])
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backward:
+        rows.reverse()
+
+    cursor = {'next': None, 'prev': None}
+    if rows:
+        if has_more or backward:
+            cursor['next'] = encode_cursor(*rows[-1])
+        if token and (has_more or not backward):
+            cursor['prev'] = encode_cursor(*rows[0], backward=True)
+    page = Obj.filter(id__in=[pk for value, pk in rows]).order_by(*ordering)
+    return page, cursor
@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import threading
+
+# 批量开户的密码哈希
+# 每个密码要几百毫秒的纯 CPU 计算，交给进程池并行，不依赖哈希器实现是否释放 GIL。
+# 子进程用 spawn 启动（导入任务跑在线程里，fork 多线程进程不安全），
+# 初始化时只把父进程当前的哈希器配置传进去，不加载整个 Django，也不碰数据库
+HASHER_SETTINGS = ('PASSWORD_HASHERS', 'PASSWORD_PBKDF2_ITERATIONS')
+_executor = None
+_executor_key = None
+_lock = threading.Lock()
+
+def _init_worker(options):
+    if not settings.configured:
+        settings.configure(**options)
+
+# settings.PASSWORD_HASH_WORKERS 为进程数，默认 CPU 核数；1 表示在当前线程内逐个哈希
+def workers():
+    return getattr(settings, 'PASSWORD_HASH_WORKERS', None) or os.cpu_count() or 1
+
+# 进程池常驻复用，进程数或哈希器配置变化时重建
+def _pool(n):
+    global _executor, _executor_key
+    options = {name: getattr(settings, name, None) for name in HASHER_SETTINGS}
+    key = (n, repr(options))
+    with _lock:
+        if _executor_key != key:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            _executor = ProcessPoolExecutor(max_workers=n, mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=_init_worker, initargs=(options,))
+            _executor_key = key
+        return _executor
+
+# 返回与 passwords 顺序一致的哈希值
+def hash_passwords(passwords):
+    passwords = list(passwords)
+    n = min(workers(), len(passwords))
+    if n <= 1:
+        return [make_password(password) for password in passwords]
+    return list(_pool(workers()).map(make_password, passwords, chunksize=max(1, len(passwords) // (n * 4))))
+
+# 登录：校验密码，哈希需要升级（迭代次数或哈希器配置变了）时在登录前同步重新哈希，
+# login() 随后用新哈希计算会话里的密码摘要，当前会话不会因升级失效。每个账号只升级一次
+def check_login(user, raw_password):
+    def upgrade(raw_password):
+        from django.contrib.auth.models import User
+        password = make_password(raw_password)
+        # 只在密码未被修改过时写入，用 UPDATE 而不是 save()，不触发 signal 和操作日志
+        if User.objects.filter(id=user.id, password=user.password).update(password=password):
+            user.password = password
+    return check_password(raw_password, user.password, setter=upgrade)
+
+# 用户不存在时也做一次同样代价的哈希，响应时间不暴露用户名是否存在
+def check_unknown(raw_password):
+    make_password(raw_password)
@@ -0,0 +1,56 @@
+from ..models import Inventory, BorrowRecord, DailyBorrowStat
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from datetime import datetime
+
+CHUNK_SIZE = 1000
+
+# 借出 n 本时累加对应的日汇总行，不存在则新建；并发新建冲突时退回累加
+def add_borrows(day, book_id, category_id, reader_id, n=1):
+    if isinstance(day, datetime):
+        day = day.date()
+    key = {'date': day, 'book_id': book_id, 'category_id': category_id, 'reader_id': reader_id}
+    if DailyBorrowStat.objects.filter(**key).update(count=F('count') + n):
+        return
+    try:
+        with transaction.atomic():
+            DailyBorrowStat.objects.create(count=n, **key)
+    except IntegrityError:
+        DailyBorrowStat.objects.filter(**key).update(count=F('count') + n)
+
+# 新建借阅记录时调用，图书和分类通过一次查询取得
+def record_borrow(record):
+    book_id, category_id = Inventory.objects.filter(id=record.inventory_id) \
+                                            .values_list('book_id', 'book__category_id') \
+                                            .get()
+    add_borrows(record.borrow_date, book_id, category_id, record.reader_id)
+
+# 从借阅记录重建汇总表，since 不为空时只重建该日期之后的部分
+def rebuild(since=None):
+    records = BorrowRecord.objects.all()
+    stats = DailyBorrowStat.objects.all()
+    if since is not None:
+        records = records.filter(borrow_date__gte=since)
+        stats = stats.filter(date__gte=since)
+    rows = records.values('borrow_date', 'inventory__book_id', 'inventory__book__category_id', 'reader_id') \
+                  .annotate(count=Count('id')) \
+                  .order_by()
+    total = 0
+    with transaction.atomic():
+        stats.delete()
+        chunk = []
+        for row in rows.iterator(chunk_size=CHUNK_SIZE):
+            chunk.append(DailyBorrowStat(
+                date=row['borrow_date'],
+                book_id=row['inventory__book_id'],
+                category_id=row['inventory__book__category_id'],
+                reader_id=row['reader_id'],
+                count=row['count'],
+            ))
+            if len(chunk) >= CHUNK_SIZE:
+                DailyBorrowStat.objects.bulk_create(chunk)
+                total += len(chunk)
+                chunk = []
+        DailyBorrowStat.objects.bulk_create(chunk)
+        total += len(chunk)
+    return total
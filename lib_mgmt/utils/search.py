@@ -0,0 +1,136 @@
+from ..models import Book, SearchTerm
+from . import caching
+from django.db import transaction
+from django.db.models import Q, Count, Sum, Value, IntegerField, Case, When
+import re
+
+# 参与检索的字段及其权重，标题命中排在最前
+FIELD_WEIGHTS = (
+    ('title', 4),
+    ('author', 3),
+    ('index_number', 3),
+    ('category__name', 2),
+    ('category__category_number', 2),
+    ('publisher', 1),
+    ('publish_date', 1),
+)
+INDEX_FIELDS = tuple(field for field, weight in FIELD_WEIGHTS)
+TERM_MAX_LENGTH = SearchTerm._meta.get_field('term').max_length
+CHUNK_SIZE = 1000
+
+# 中日韩字符连续成段，其余按字母数字切词
+CJK_RANGES = '぀-ヿ㐀-䶿一-鿿가-힯豈-﫿'
+TOKEN_RE = re.compile('[%s]+|[^\\W_%s]+' % (CJK_RANGES, CJK_RANGES))
+CJK_RE = re.compile('[%s]' % CJK_RANGES)
+
+# 分词：西文按词切分并转小写，中文取单字 + 相邻二元组
+# 单字保证一个字的关键字也能命中，二元组让多字关键字的匹配更精确
+def tokenize(text):
+    tokens = []
+    for run in TOKEN_RE.findall(str(text or '').lower()):
+        if CJK_RE.match(run):
+            tokens.extend(run)
+            tokens.extend(run[i:i+2] for i in range(len(run)-1))
+        else:
+            tokens.append(run[:TERM_MAX_LENGTH])
+    return tokens
+
+# 查询分词：中文段长度大于 1 时只用二元组，避免单字把结果放得过宽
+def query_tokens(keyword):
+    tokens = []
+    for run in TOKEN_RE.findall(keyword.lower()):
+        if CJK_RE.match(run) and len(run) > 1:
+            tokens.extend(run[i:i+2] for i in range(len(run)-1))
+        else:
+            tokens.append(run[:TERM_MAX_LENGTH])
+    return list(dict.fromkeys(tokens))
+
+# 由一行图书字段计算 {词项: 权重}
+def _book_terms(row):
+    terms = {}
+    for field, weight in FIELD_WEIGHTS:
+        for token in set(tokenize(row[field])):
+            terms[token] = terms.get(token, 0) + weight
+    return terms
+
+# 重建一批图书的索引，books 为 Book 的 QuerySet
+def index_books(books):
+    rows = books.values('id', *INDEX_FIELDS).order_by('id')
+    chunk = []
+    for row in rows.iterator(chunk_size=CHUNK_SIZE):
+        chunk.append(row)
+        if len(chunk) >= CHUNK_SIZE:
+            _write_chunk(chunk)
+            chunk = []
+    if chunk:
+        _write_chunk(chunk)
+
+def _write_chunk(rows):
+    terms = [
+        SearchTerm(term=term, book_id=row['id'], weight=weight)
+        for row in rows
+        for term, weight in _book_terms(row).items()
+    ]
+    with transaction.atomic():
+        SearchTerm.objects.filter(book_id__in=[row['id'] for row in rows]).delete()
+        SearchTerm.objects.bulk_create(terms, batch_size=CHUNK_SIZE)
+        caching.bump(SearchTerm)
+
+def index_book(book):
+    index_books(Book.objects.filter(id=book.id))
+
+# 分类改名/改号时，该分类下所有图书都需要重建
+def index_category(category):
+    index_books(Book.objects.filter(category=category))
+
+# 西文、数字词项按前缀匹配（'pyth' 命中 python，'tp31' 命中 tp312），与原来的模糊匹配一致；
+# 中文单字、二元组按整词匹配。前缀条件走 term 列索引的范围扫描
+def _term_q(token, field='term'):
+    if CJK_RE.match(token):
+        return Q(**{field: token})
+    return Q(**{field + '__startswith': token})
+
+def _terms_q(tokens, field='term'):
+    cond = Q()
+    for token in tokens:
+        cond |= _term_q(token, field)
+    return cond
+
+# 单个关键字命中的图书 id 子查询，关键字的全部词项都需命中
+# 一个前缀可能命中同一本书的多个词项，按命中的查询词项去重计数
+# 关键字无有效词项时返回 None，表示不做限制
+def match(keyword):
+    tokens = query_tokens(keyword)
+    if not tokens:
+        return None
+    matched = Case(*[When(_term_q(token), then=Value(i)) for i, token in enumerate(tokens)])
+    return SearchTerm.objects.filter(_terms_q(tokens)) \
+                             .values('book_id') \
+                             .annotate(hits=Count(matched, distinct=True)) \
+                             .filter(hits=len(tokens)) \
+                             .values('book_id')
+
+# 供其他模型的检索使用，field 为指向 Book 的字段路径，如 'inventory__book'
+def book_filter(keyword, field='id'):
+    ids = match(keyword)
+    if ids is None:
+        return Q(**{field + '__isnull': False})
+    return Q(**{field + '__in': ids})
+
+# 图书检索：多个关键字之间为“或”，按命中词项的权重和（score）排序
+# 关键字为空时返回全部图书，score 统一为 0
+def search_books(keywords):
+    matched = Q()
+    tokens = []
+    for keyword in keywords:
+        ids = match(keyword)
+        if ids is None:
+            tokens = []
+            break
+        matched |= Q(id__in=ids)
+        tokens.extend(query_tokens(keyword))
+    if not tokens:
+        return Book.objects.annotate(score=Value(0, output_field=IntegerField())).order_by('id')
+    return Book.objects.filter(matched) \
+                       .annotate(score=Sum('searchterm__weight', filter=_terms_q(set(tokens), 'searchterm__term'))) \
+                       .order_by('-score', 'id')
@@ -0,0 +1,111 @@
+from ..models import Inventory, BorrowRecord, INVENTORY_STATUS_LABELS, BORROW_STATUS_LABELS
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+# 图书行序列化，字段与 model_to_dict(book) 保持一致
+BOOK_FIELDS = ('id', 'title', 'author', 'publisher', 'publish_date', 'index_number', 'category', 'description')
+# 库存、借阅记录、操作日志同理，外键列为关联对象的 id
+INVENTORY_FIELDS = ('id', 'book', 'status', 'location', 'last_borrowed_on', 'last_borrowed_by')
+BORROW_RECORD_FIELDS = ('id', 'reader', 'inventory', 'borrow_date', 'return_date', 'status')
+OPERATION_LOG_FIELDS = ('id', 'operation_type', 'content', 'timestamp', 'operator')
+READER_FIELDS = ('id', 'user', 'max_borrow_limit')
+
+# 参与可借概况统计的库存状态
+AVAILABILITY_KEYS = {1: 'in_library', 2: 'borrowed', 0: 'maintenance'}
+
+# 每本书各状态的副本数，一次 GROUP BY (book, status) 查询
+# 返回 {book_id: {'in_library': n, 'borrowed': n, 'maintenance': n, 'total': n}}
+def availability(book_ids):
+    summary = {book_id: {'in_library': 0, 'borrowed': 0, 'maintenance': 0, 'total': 0} for book_id in book_ids}
+    if not summary:
+        return summary
+    rows = Inventory.objects.filter(book_id__in=summary.keys()) \
+                            .values_list('book_id', 'status') \
+                            .annotate(count=Count('id')) \
+                            .order_by()
+    for book_id, status, count in rows:
+        item = summary[book_id]
+        item['total'] += count
+        if status in AVAILABILITY_KEYS:
+            item[AVAILABILITY_KEYS[status]] += count
+    return summary
+
+# 批量序列化一页图书
+# 分类名通过 join 取得，副本数直接读图书上的冗余计数；
+# breakdown=True 时再用一次 GROUP BY 补充借出、维护中的副本数。查询数与行数无关
+def book_rows(books, breakdown=False):
+    rows = list(books.values(*BOOK_FIELDS, category_name=F('category__name'),
+                             inventory_count=F('total_copies'), in_library=F('available_copies')))
+    if breakdown:
+        summary = availability([row['id'] for row in rows])
+        for row in rows:
+            row['borrowed'] = summary[row['id']]['borrowed']
+            row['maintenance'] = summary[row['id']]['maintenance']
+    return rows
+
+# 某本书的全部副本及状态、应还日期，一次查询
+# 借出副本的应还日期通过子查询取其未归还借阅记录的 return_date
+def copy_rows(book_id):
+    open_record = BorrowRecord.objects.filter(inventory=OuterRef('pk'), status__in=BorrowRecord.ACTIVE_STATUSES).values('return_date')[:1]
+    # 按照status排序，status=1的排在前面
+    rows = list(Inventory.objects.filter(book_id=book_id)
+                                 .order_by('status')
+                                 .annotate(return_date=Subquery(open_record))
+                                 .values('id', 'book__title', 'location', 'status', 'return_date'))
+    for row in rows:
+        row['return_date'] = row['return_date'].strftime('%Y-%m-%d') if row['status'] == 2 and row['return_date'] else '-'
+        row['get_status_display'] = INVENTORY_STATUS_LABELS.get(row['status'], "Unknown")
+    return rows
+
+# 列表页的行序列化：关联对象的字段用 F() 在同一条查询里 join 出来，只取页面需要的列，查询数与行数无关
+
+# 库存列表一页，附带图书与分类信息，status 转为显示名
+def inventory_rows(inventories):
+    rows = list(inventories.values(*INVENTORY_FIELDS,
+                                   book_title=F('book__title'),
+                                   book_author=F('book__author'),
+                                   book_publisher=F('book__publisher'),
+                                   book_publish_date=F('book__publish_date'),
+                                   book_index_number=F('book__index_number'),
+                                   book_category_number=F('book__category__category_number'),
+                                   book_category_name=F('book__category__name')))
+    for row in rows:
+        row['status'] = INVENTORY_STATUS_LABELS.get(row['status'], "Unknown")
+    return rows
+
+# 借阅记录列表一页，附带读者账号与图书信息
+def borrow_record_rows(records):
+    rows = list(records.values(*BORROW_RECORD_FIELDS,
+                               reader_username=F('reader__user__username'),
+                               reader_email=F('reader__user__email'),
+                               book_title=F('inventory__book__title'),
+                               book_index_number=F('inventory__book__index_number')))
+    for row in rows:
+        row['borrow_date'] = row['borrow_date'].strftime('%Y-%m-%d')
+        row['return_date'] = row['return_date'].strftime('%Y-%m-%d')
+        row['status'] = BORROW_STATUS_LABELS.get(row['status'], "Unknown")
+    return rows
+
+# 操作日志列表一页；系统产生的日志（如逾期扫描）没有操作者，用户名与邮箱为 None
+def operation_log_rows(logs):
+    rows = list(logs.values(*OPERATION_LOG_FIELDS, username=F('operator__username'), user_email=F('operator__email')))
+    for row in rows:
+        row['time'] = row['timestamp'].strftime('%Y-%m-%d %H:%M:%S')
+    return rows
+
+# 读者的未归还借阅数（在借 + 逾期），按 (reader, status) 索引分组计数的相关子查询，
+# 作为注解可以参与排序和游标翻页
+def with_active_loans(readers):
+    loans = BorrowRecord.objects.filter(reader=OuterRef('pk'), status__in=BorrowRecord.ACTIVE_STATUSES) \
+                                .order_by().values('reader').annotate(count=Count('id')).values('count')
+    return readers.annotate(active_loans=Coalesce(Subquery(loans, output_field=IntegerField()), 0))
+
+# 读者列表一页，账号字段随读者行一次 join 取出；readers 需先经过 with_active_loans
+def reader_rows(readers):
+    return list(readers.values(*READER_FIELDS, 'active_loans',
+                               username=F('user__username'),
+                               first_name=F('user__first_name'),
+                               last_name=F('user__last_name'),
+                               email=F('user__email'),
+                               is_active=F('user__is_active'),
+                               is_staff=F('user__is_staff')))
@@ -0,0 +1,61 @@
+from django.db.models import Sum
+from django.db.models.functions import TruncDay, TruncWeek, TruncMonth
+from datetime import timedelta
+
+# 借阅统计的时间粒度
+BUCKETS = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+# days 参数上限，防止一次请求扫描过长的区间
+MAX_DAYS = 366
+
+# 某个日期所在桶的起始日期，与数据库中 Trunc* 的结果一致（周从周一开始）
+def bucket_start(day, bucket):
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+# 区间内所有桶的起始日期，用于补零
+def bucket_range(start, end, bucket):
+    keys = []
+    day = bucket_start(start, bucket)
+    while day <= end:
+        keys.append(day)
+        if bucket == 'month':
+            day = (day + timedelta(days=32)).replace(day=1)
+        elif bucket == 'week':
+            day += timedelta(days=7)
+        else:
+            day += timedelta(days=1)
+    return keys
+
+# 一次 GROUP BY 查询得到区间内每个桶的借阅数，没有借阅的桶补 0
+# records 为已按读者等条件过滤的 QuerySet，默认是借阅日汇总表 DailyBorrowStat；
+# 直接统计 BorrowRecord 时传 date_field='borrow_date', count_expr=Count('id')
+# category_field 不为空时额外按分类拆分
+def borrow_stats(records, start, end, bucket='day', category_field=None,
+                 date_field='date', count_expr=None):
+    group = ['bucket'] + ([category_field] if category_field else [])
+    rows = records.filter(**{date_field + '__gte': start, date_field + '__lte': end}) \
+                  .annotate(bucket=BUCKETS[bucket](date_field)) \
+                  .values(*group) \
+                  .annotate(count=count_expr or Sum('count')) \
+                  .order_by()
+
+    stats = {key: {'date': key, 'count': 0} for key in bucket_range(start, end, bucket)}
+    if category_field:
+        for item in stats.values():
+            item['categories'] = {}
+    for row in rows:
+        item = stats.get(row['bucket'])
+        if item is None:
+            continue
+        item['count'] += row['count']
+        if category_field:
+            name = row[category_field]
+            item['categories'][name] = item['categories'].get(name, 0) + row['count']
+    return list(stats.values())
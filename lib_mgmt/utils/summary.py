@@ -0,0 +1,24 @@
+from ..models import Reader, BorrowRecord
+from . import caching
+from django.db.models import Count, Q
+from datetime import datetime, timedelta
+
+# 读者借阅概况：在借（含逾期）、七天内到期、已逾期数量及剩余配额
+# 一次带条件聚合的查询得到全部计数，连同读者的借阅上限，不再单独读取 request.user.reader
+# 逾期直接看 status=-1，由 sweep_overdue 维护
+def _load_summary(user_id):
+    today = datetime.now().date()
+    row = Reader.objects.filter(user_id=user_id).annotate(
+        borrowed=Count('borrowrecord', filter=Q(borrowrecord__status__in=BorrowRecord.ACTIVE_STATUSES)),
+        # 七天之后将过期的，过期的不算
+        soon_overdue=Count('borrowrecord', filter=Q(borrowrecord__status=1, borrowrecord__return_date__lte=today + timedelta(days=7), borrowrecord__return_date__gt=today)),
+        overdue=Count('borrowrecord', filter=Q(borrowrecord__status=-1)),
+    ).values('id', 'max_borrow_limit', 'borrowed', 'soon_overdue', 'overdue').get()
+    row['remaining_quota'] = row['max_borrow_limit'] - row['borrowed']
+    return row
+
+# cached=False 时绕过缓存，借书前的配额检查必须读最新数据
+def reader_summary(user, cached=True):
+    if not cached:
+        return _load_summary(user.id)
+    return caching.cached('user_center', [BorrowRecord, Reader], lambda: _load_summary(user.id), user.id)
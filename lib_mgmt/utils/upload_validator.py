@@ -1,121 +1,195 @@
-def book_validate(file_data):
-    try:
-        lines = file_data.split("\n")
-        for line in lines:
-            # 检查每一行是否有 7 个字段
-            # 检查字段属性和长度是否符合要求
-            # 不符合返回 (False,reason)
-            fields = line.split(",")
-            if len(fields) != 7:
-                return (False, "Invalid number of fields")
-            title = fields[0]
-            author = fields[1]
-            publisher = fields[2]
-            publish_date = fields[3]
-            index_number = fields[4]
-            category = fields[5]
-            description = fields[6]
-            if len(title) > 100:
-                return (False, "Title too long")
-            if len(author) > 100:
-                return (False, "Author too long")
-            if len(publisher) > 100:
-                return (False, "Publisher too long")
-            if len(publish_date) > 100:
-                return (False, "Publish date too long")
-            if len(index_number) > 50:
-                return (False, "Index number too long")
-            if len(category) > 100:
-                return (False, "Category too long")
-            if description is None:
-                description = ""
-    except Exception as e:
-        return (False, str(e))
-    return (True, "good")
-
-def category_validate(file_data):
+from ..models import Reader, Book, Category
+from django.contrib.auth.hashers import identify_hasher
+from django.contrib.auth.models import User
+from django.utils.dateparse import parse_date
+import codecs
+import csv
+import itertools
+
+# 上传文件的校验引擎
+# 每种实体一个 Schema，声明各列的长度、类型、取值范围、外键存在性与唯一性；
+# 文件用 csv 模块流式读取（支持引号），按块把行转成列，逐列整体校验，
+# 外键与唯一性每块每列只查一次库。一遍读取即收集全部出错行，并把转换好类型的行直接交给导入器
+CHUNK_SIZE = 1000
+
+# 列的取值类型：把字符串转换为目标类型，失败返回 INVALID
+INVALID = object()
+
+def _to_int(value):
     try:
-        lines = file_data.split("\n")
-        for line in lines:
-            # 检查每一行是否有 2 个字段
-            # 检查字段属性和长度是否符合要求
-            # 不符合返回 (False,reason)
-            fields = line.split(",")
-            if len(fields) != 2:
-                return (False, "Invalid number of fields")
-            category_number = fields[0]
-            name = fields[1]
-            if len(category_number) > 50:
-                return (False, "Category number too long")
-            if len(name) > 100:
-                return (False, "Name too long")
-    except Exception as e:
-        return (False, str(e))
-    return (True, "good")
-
-def inventory_validate(file_data):
+        return int(value)
+    except ValueError:
+        return INVALID
+
+def _to_bool(value):
+    return {'0': False, '1': True}.get(value, INVALID)
+
+def _to_date(value):
     try:
-        lines = file_data.split("\n")
-        for line in lines:
-            # 检查每一行是否有 5 个字段 或 last_borrowed_on 和 last_borrowed_by 共同为空
-            # 检查字段属性和长度是否符合要求
-            # 不符合返回 (False,reason)
-            fields = line.split(",")
-            length = len(fields)
-            if length != 5 and (fields[3] != "" or fields[4] != ""):
-                return (False, "Invalid number of fields")
-            index_number = fields[0]
-            status = fields[1]
-            location = fields[2]    
-            if length == 5:
-                last_borrowed_on = fields[3]
-                last_borrowed_by = fields[4]
-            if len(index_number) > 50:
-                return (False, "Index number too long")
-            if len(status) > 1:
-                return (False, "Status too long")
-            if len(location) > 100:
-                return (False, "Location too long")
-            if length == 5:
-                if len(last_borrowed_on) > 100:
-                    return (False, "Last borrowed on too long")
-                if len(last_borrowed_by) > 100:
-                    return (False, "Last borrowed by too long")
-    except Exception as e:
-        return (False, str(e))
-    return (True, "good")
-
-def reader_validate(file_data):
+        return parse_date(value) or INVALID
+    except ValueError:
+        return INVALID
+
+# 已哈希的密码：算法前缀要能被已配置的哈希器识别，且整个值能按该哈希器的格式解析
+def _to_password_hash(value):
     try:
-        lines = file_data.split("\n")
-        for line in lines:
-            # 检查每一行是否有 7 个字段
-            # 检查字段属性和长度是否符合要求
-            # 不符合返回 (False,reason)
-            fields = line.split(",")
-            if len(fields) != 7:
-                return (False, "Invalid number of fields")
-            username = fields[0]
-            first_name = fields[1]
-            last_name = fields[2]
-            email = fields[3]
-            password = fields[4]
-            is_staff = fields[5]
-            max_borrow_limit = fields[6]
-            if len(username) > 20:
-                return (False, "Username too long")
-            if len(first_name) > 30:
-                return (False, "First name too long")
-            if len(last_name) > 30:
-                return (False, "Last name too long")
-            if len(email) > 100:
-                return (False, "Email too long")
-            if len(password) > 25:
-                return (False, "Password too long")
-            if len(is_staff) > 1:
-                return (False, "Is staff too long")
-            if len(max_borrow_limit) > 10:
-                return (False, "Max borrow limit too long")
-    except Exception as e:
-        return (False, str(e))
-    return (True, "good")
\ No newline at end of file
+        identify_hasher(value).decode(value)
+    except (ValueError, TypeError, IndexError, NotImplementedError):
+        return INVALID
+    return value
+
+CONVERTERS = {
+    'str': None,
+    'int': _to_int,
+    'bool': _to_bool,
+    'date': _to_date,
+    'password_hash': _to_password_hash,
+}
+
+class Column:
+    # exists / unique 为 (模型, 字段)：值必须已存在于库中 / 不能与库中或文件中之前的行重复
+    # optional 的列只能出现在末尾，整列缺省或为空时取 None
+    def __init__(self, name, label, type='str', max_length=None, choices=None, exists=None, unique=None, optional=False):
+        self.name = name
+        self.label = label
+        self.convert = CONVERTERS[type]
+        self.max_length = max_length
+        self.choices = choices
+        self.exists = exists
+        self.unique = unique
+        self.optional = optional
+
+    # 整列校验，返回转换后的值和 {行下标: 错误}
+    # 长度、类型、取值范围先在内存中逐列完成，通过的值再一起查库
+    def check(self, values, seen):
+        errors = {}
+        if self.max_length is not None:
+            errors.update((i, f'{self.label} too long') for i, value in enumerate(values) if len(value) > self.max_length)
+        if self.optional:
+            values = [value if value != '' else None for value in values]
+        if self.convert is not None:
+            values = [self.convert(value) if value is not None else None for value in values]
+            errors.update((i, f'Invalid {self.label.lower()}') for i, value in enumerate(values)
+                          if value is INVALID and i not in errors)
+        if self.choices is not None:
+            errors.update((i, f'Invalid {self.label.lower()}') for i, value in enumerate(values)
+                          if value not in self.choices and value is not None and i not in errors)
+
+        candidates = {value for i, value in enumerate(values) if i not in errors and value is not None}
+        if self.exists and candidates:
+            model, field = self.exists
+            found = set(model.objects.filter(**{field + '__in': candidates}).values_list(field, flat=True))
+            errors.update((i, f'{self.label} not found') for i, value in enumerate(values)
+                          if value is not None and i not in errors and value not in found)
+        if self.unique and candidates:
+            model, field = self.unique
+            taken = set(model.objects.filter(**{field + '__in': candidates}).values_list(field, flat=True))
+            for i, value in enumerate(values):
+                if value is None or i in errors:
+                    continue
+                if value in taken or value in seen:
+                    errors[i] = f'{self.label} already exists'
+                else:
+                    seen.add(value)
+        return values, errors
+
+class Batch:
+    def __init__(self, size, rows, errors):
+        # 本块的原始行数、通过校验的 (行号, 字典) 列表、(行号, 错误) 列表
+        self.size = size
+        self.rows = rows
+        self.errors = errors
+
+class Schema:
+    def __init__(self, *columns):
+        self.columns = columns
+        required = sum(not column.optional for column in columns)
+        self.widths = set(range(required, len(columns) + 1))
+
+    # 逐块校验上传文件，每块产出一个 Batch；文件只读取一遍
+    def validate(self, csv_file, chunk_size=CHUNK_SIZE):
+        seen = {column.name: set() for column in self.columns if column.unique}
+        rows = enumerate(read_rows(csv_file), start=1)
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                return
+            yield self.check_chunk(chunk, seen)
+
+    def check_chunk(self, chunk, seen):
+        errors = []
+        lines, records = [], []
+        for line, row in chunk:
+            if len(row) not in self.widths:
+                errors.append((line, 'Invalid number of fields'))
+            else:
+                lines.append(line)
+                records.append(row)
+
+        # 行转列，缺省的可选列补空
+        width = len(self.columns)
+        columns = list(zip(*(row + [''] * (width - len(row)) for row in records))) or [()] * width
+        values, failed = {}, {}
+        for column, raw in zip(self.columns, columns):
+            values[column.name], column_errors = column.check(list(raw), seen.get(column.name))
+            for i, error in column_errors.items():
+                failed.setdefault(i, []).append(error)
+
+        valid = []
+        for i, line in enumerate(lines):
+            if i in failed:
+                errors.extend((line, error) for error in failed[i])
+            else:
+                valid.append((line, {name: column[i] for name, column in values.items()}))
+        errors.sort(key=lambda error: error[0])
+        return Batch(len(chunk), valid, errors)
+
+def read_rows(csv_file):
+    # 文件对象按行迭代，底层按 64KB 分块读取，不会整体载入内存
+    csv_file.seek(0)
+    for row in csv.reader(codecs.iterdecode(csv_file, 'utf-8-sig')):
+        # 跳过空行（如文件末尾的换行）
+        if not row or row == ['']:
+            continue
+        yield row
+
+# 图书：title,author,publisher,publish_date,index_number,category_number,description
+# 分类号不存在时由导入器自动创建，这里只校验长度
+BOOK_SCHEMA = Schema(
+    Column('title', 'Title', max_length=100),
+    Column('author', 'Author', max_length=100),
+    Column('publisher', 'Publisher', max_length=100),
+    Column('publish_date', 'Publish date', max_length=100),
+    Column('index_number', 'Index number', max_length=50, unique=(Book, 'index_number')),
+    Column('category', 'Category', max_length=50),
+    Column('description', 'Description'),
+)
+
+# 分类：category_number,name
+CATEGORY_SCHEMA = Schema(
+    Column('category_number', 'Category number', max_length=50, unique=(Category, 'category_number')),
+    Column('name', 'Name', max_length=100),
+)
+
+# 库存：book_id,status,location[,last_borrowed_on,last_borrowed_by]
+INVENTORY_SCHEMA = Schema(
+    Column('book_id', 'Book id', type='int', exists=(Book, 'id')),
+    Column('status', 'Status', type='int', choices=(-1, 0, 1)),
+    Column('location', 'Location', max_length=100),
+    Column('last_borrowed_on', 'Last borrowed on', type='date', optional=True),
+    Column('last_borrowed_by_id', 'Last borrowed by', type='int', exists=(Reader, 'id'), optional=True),
+)
+
+# 读者：username,first_name,last_name,email,password,is_staff,max_borrow_limit[,password_hash]
+# password 一律按明文哈希；从其他系统迁移的账号把已哈希的值填在末尾的 password_hash 列（password 留空），
+# 原样写入前校验格式，无法解析的作为出错行报告
+READER_SCHEMA = Schema(
+    Column('username', 'Username', max_length=150, unique=(User, 'username')),
+    Column('first_name', 'First name', max_length=30),
+    Column('last_name', 'Last name', max_length=30),
+    Column('email', 'Email', max_length=100),
+    Column('password', 'Password', max_length=128),
+    Column('is_staff', 'Is staff', type='bool'),
+    Column('max_borrow_limit', 'Max borrow limit', type='int'),
+    Column('password_hash', 'Password hash', type='password_hash', max_length=128, optional=True),
+)
@@ -1,28 +1,51 @@
-from .models import Reader, Book, Category, BorrowRecord, Inventory, OperationLog
-from .utils import upload_validator
-from django.contrib.auth import authenticate, login, logout, update_session_auth_hash
+from .models import Reader, Book, Category, BorrowRecord, Inventory, OperationLog, ImportJob, DailyBorrowStat
+from .utils import search, pagination, oplog, jobs, stats, rollup, caching, summary, circulation, metrics, autocomplete, export, passwords
+from .utils.serializers import book_rows, copy_rows, inventory_rows, borrow_record_rows, operation_log_rows, reader_rows, with_active_loans
+from django.contrib.auth import login, logout, update_session_auth_hash
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm, UserChangeForm, PasswordChangeForm
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
 from django.views import View
 from django.views.decorators.http import require_POST
 from django.core.exceptions import ObjectDoesNotExist
 from django import forms
-from django.forms.models import model_to_dict
-from django.db.models import Q, Count
+from django.db import transaction
+from django.db.models import Q, F, Sum
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.shortcuts import get_object_or_404, render, redirect
 from datetime import datetime, timedelta
 
 # 分页逻辑封装
-def paginate(request, Obj, page=10):
+# 默认按页码分页；请求带 cursor 参数时改用游标分页（空字符串为第一页），
+# 按 (key, id) 排序并返回 next/prev token，总数走缓存，with_count=0 时不统计；
+# token 无效（被篡改或已过时）时从第一页开始
+def paginate(request, Obj, per_page=10, key='id'):
+    if 'cursor' in request.POST:
+        count = page_count = None
+        if request.POST.get('with_count', '1') != '0':
+            count = pagination.cached_count(Obj)
+            page_count = int((count-1)/per_page) + 1
+        try:
+            Obj, cursor = pagination.paginate_cursor(Obj, request.POST['cursor'], per_page, key)
+        except ValueError:
+            Obj, cursor = pagination.paginate_cursor(Obj, '', per_page, key)
+        return Obj, count, page_count, cursor
     page = request.POST.get('page', 1)
     count = Obj.count()
-    page_count = int((Obj.count()-1)/10) + 1
-    Obj = Obj[(int(page)-1)*10:int(page)*10]
-    return Obj, count, page_count
+    page_count = int((count-1)/per_page) + 1
+    Obj = Obj[(int(page)-1)*per_page:int(page)*per_page]
+    return Obj, count, page_count, None
+
+# 图书检索的可借筛选与排序，直接使用图书上的冗余计数，不需要 join 库存表
+# available_only=1 只返回有在馆副本的图书，sort=available 按在馆副本数降序
+def filter_by_availability(request, books):
+    if request.POST.get('available_only') == '1':
+        books = books.filter(available_copies__gt=0)
+    if request.POST.get('sort') == 'available':
+        return books.order_by('-available_copies', 'id'), '-available_copies'
+    return books, '-score'
 
 # 检查用户是否为管理员的函数
 def is_admin(user):
@@ -39,40 +62,102 @@ def index(request):
 # ----[API]----
 
 # 用户借阅统计，for chart.js
+# days: 统计天数（1~366），bucket: day/week/month，by=category 时按分类拆分
+# 读者只能看自己的统计；管理员可用 scope=library 统计全馆，或用 reader_id 查看指定读者
+# 无论区间多长都只有一次 GROUP BY 查询
 class UserBorrowStatsView(View):
     def get(self, request, *args, **kwargs):
         if request.user.is_authenticated:
-            days = int(request.GET.get('days', 7))  # 默认为7天
+            try:
+                days = int(request.GET.get('days', 7))  # 默认为7天
+            except ValueError:
+                return JsonResponse({'success': False, 'error': 'Invalid days'})
+            days = min(max(days, 1), stats.MAX_DAYS)
+            bucket = request.GET.get('bucket', 'day')
+            if bucket not in stats.BUCKETS:
+                return JsonResponse({'success': False, 'error': 'Invalid bucket'})
             end_date = datetime.now().date()
             start_date = end_date - timedelta(days=days-1)
 
-            stats = []
-            for i in range(days):
-                date = start_date + timedelta(days=i)
-                count = BorrowRecord.objects.filter(reader=request.user.reader, borrow_date=date).count()
-                stats.append({'date': date, 'count': count})
-
-            return JsonResponse(stats, safe=False)
+            # 读借阅日汇总表，不扫描借阅记录
+            records = DailyBorrowStat.objects.all()
+            if request.GET.get('scope') == 'library' or 'reader_id' in request.GET:
+                if not request.user.is_staff:
+                    return JsonResponse({'success': False, 'error': 'Permission denied'})
+                if request.GET.get('scope') != 'library':
+                    try:
+                        records = records.filter(reader_id=int(request.GET['reader_id']))
+                    except ValueError:
+                        return JsonResponse({'success': False, 'error': 'Invalid reader_id'})
+            else:
+                records = records.filter(reader__user=request.user)
+            category_field = 'category__name' if request.GET.get('by') == 'category' else None
+            data = stats.borrow_stats(records, start_date, end_date, bucket, category_field)
+            return JsonResponse(data, safe=False)
         else:
             return JsonResponse({'success': False, 'error': 'Permission denied'})
 
 class TopBorrowedBooksView(View):
     def get(self, request, *args, **kwargs):
         if request.user.is_authenticated:
-            #筛选近一个月的记录
-            top_books = BorrowRecord.objects.filter(borrow_date__gte=datetime.now() - timedelta(days=30)) \
-                                            .values('inventory__book__title') \
-                                            .annotate(count=Count('inventory__book')) \
-                                            .order_by('-count')[:5]
-            return JsonResponse(list(top_books), safe=False)
+            #筛选近一个月的记录，从借阅日汇总表中累加
+            top_books = caching.cached('top_borrowed_books', [BorrowRecord, Book], lambda: list(
+                DailyBorrowStat.objects.filter(date__gte=datetime.now().date() - timedelta(days=30))
+                                       .values('book_id')
+                                       .annotate(inventory__book__title=F('book__title'), count=Sum('count'))
+                                       .values('inventory__book__title', 'count')
+                                       .order_by('-count')[:5]
+            ))
+            return JsonResponse(top_books, safe=False)
         else:
             return JsonResponse({'success': False, 'error': 'Permission denied'})
 
 class CategoryView(View):
     def get(self, request, *args, **kwargs):
         if request.user.is_authenticated and request.user.is_staff:
-            categories = Category.objects.values('category_number', 'name')
-            return JsonResponse(list(categories), safe=False)
+            categories = caching.cached('categories', [Category], lambda: list(Category.objects.values('category_number', 'name')))
+            return JsonResponse(categories, safe=False)
+        else:
+            return JsonResponse({'success': False, 'error': 'Permission denied'})
+
+# 后台导入任务进度，供批量上传页面轮询
+class ImportJobView(View):
+    def get(self, request, *args, **kwargs):
+        if request.user.is_authenticated and request.user.is_staff:
+            try:
+                job = ImportJob.objects.get(id=request.GET['job_id'])
+            except (KeyError, ValueError, ObjectDoesNotExist):
+                return JsonResponse({'success': False, 'error': 'Job not found'})
+            return JsonResponse({'success': True, 'job': jobs.job_status(jobs.expire_stale(job))})
+        else:
+            return JsonResponse({'success': False, 'error': 'Permission denied'})
+
+class QueryMetricsView(View):
+    # 按 URL 名汇总最近请求的耗时、查询数和重复查询；recent=1 时返回原始记录
+    def get(self, request, *args, **kwargs):
+        if request.user.is_authenticated and request.user.is_staff:
+            if request.GET.get('recent') == '1':
+                return JsonResponse({'success': True, 'requests': metrics.recent()})
+            return JsonResponse({'success': True, 'views': metrics.summary()})
+        else:
+            return JsonResponse({'success': False, 'error': 'Permission denied'})
+
+# 输入联想：q 为已输入的前缀或片段，field 为 title/author/username/name，limit 最多 20
+# 查内存索引，不访问业务表；读者字段仅管理员可查
+class AutocompleteView(View):
+    def get(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            field = request.GET.get('field', 'title')
+            if field not in autocomplete.FIELDS:
+                return JsonResponse({'success': False, 'error': 'Invalid field'})
+            if field in autocomplete.READER_FIELDS and not request.user.is_staff:
+                return JsonResponse({'success': False, 'error': 'Permission denied'})
+            try:
+                limit = int(request.GET.get('limit', 10))
+            except ValueError:
+                return JsonResponse({'success': False, 'error': 'Invalid limit'})
+            results = autocomplete.complete(field, request.GET.get('q', ''), limit)
+            return JsonResponse({'success': True, 'field': field, 'results': results})
         else:
             return JsonResponse({'success': False, 'error': 'Permission denied'})
 
@@ -82,13 +167,7 @@ class BookView(View):
         if request.user.is_authenticated:
             keyword = request.GET.get('keyword', '')
             books = Book.objects.filter(title__contains=keyword)
-            book_list = []
-            for book in books:
-                book_dict = model_to_dict(book)
-                book_dict['category_name'] = book.category.name
-                book_dict['inventory_count'] = Inventory.objects.filter(book=book).count()
-                book_list.append(book_dict)
-            return JsonResponse(book_list, safe=False)
+            return JsonResponse(book_rows(books), safe=False)
         else:
             return JsonResponse({'success': False, 'error': 'Permission denied'})   
 # ----[用户视图]----
@@ -203,16 +282,18 @@ def user_login(request):
     if request.method == 'POST':
         username = request.POST['username']
         password = request.POST['password']
-        user = User.objects.get(username=username)
+        # 用户只查一次，校验密码后直接登录，不再经 authenticate() 重复查询
+        user = User.objects.filter(username=username).first()
         # 多层特判
         if user is None:
+            passwords.check_unknown(password)
+            return render(request, 'auth/login.html', {'error': 'Invalid username or password!'})
+        # 旧哈希在登录前升级
+        if not passwords.check_login(user, password):
             return render(request, 'auth/login.html', {'error': 'Invalid username or password!'})
         if not user.is_active:
             return render(request, 'auth/login.html', {'error': 'Your account is disabled!'})
-        user = authenticate(username=username, password=password)
-        if user is None:
-            return render(request, 'auth/login.html', {'error': 'Invalid username or password!'})
-        login(request, user)
+        login(request, user, backend='django.contrib.auth.backends.ModelBackend')
         return redirect('lib:user_center')
     else:
         return render(request, 'auth/login.html')
@@ -226,72 +307,49 @@ def user_logout(request):
 # 用户中心视图
 @login_required(login_url='')  # 未登录用户将重定向到首页（假设首页的 URL 是 '/'）
 def user_center(request):
-    number = dict()
-    number['borrowed'] = BorrowRecord.objects.filter(reader=request.user.reader, status=1).count()
-    # 七天之后将过期的，过期的不算
-    number['soon_overdue'] = BorrowRecord.objects.filter(reader=request.user.reader, status=1, return_date__lte=datetime.now() + timedelta(days=7), return_date__gt=datetime.now()).count()
-    number['overdue'] = BorrowRecord.objects.filter(reader=request.user.reader, status=1, return_date__lte=datetime.now()).count()
-    number['remaining_quota'] = request.user.reader.max_borrow_limit - number['borrowed']
+    # 全部计数来自一次聚合查询，并按用户缓存
+    number = summary.reader_summary(request.user)
     return render(request, 'user/user_center.html', {'user': request.user, 'number': number})
 
 # 借阅记录查询视图
 @login_required(login_url='')
 def user_borrow_records(request):
-    records = BorrowRecord.objects.filter(reader=request.user.reader, status=1)
-    count = records.count()
-    maxBorrow = request.user.reader.max_borrow_limit
-    remaining = maxBorrow - count
+    records = BorrowRecord.objects.filter(reader__user=request.user, status__in=BorrowRecord.ACTIVE_STATUSES).select_related('inventory__book')
+    number = summary.reader_summary(request.user)
+    count = number['borrowed']
+    remaining = number['remaining_quota']
     return render(request, 'user/borrow_records.html', {'records': records, 'count': count, 'remaining': remaining})
 
 # 借阅图书检索视图
 # 检索后点击对应图书，返回该图书的 book_id
 @login_required(login_url='')
 def user_borrow_search(request):
-    books = Book.objects.none()  # 初始化一个空的 QuerySets
     if request.method == 'POST':
         if 'books_keyword' in request.POST:
             keyword = request.POST['books_keyword']
             # 拆解关键字，按空格分开，分别匹配
             keywords = keyword.split(' ')
-            # 任意字段匹配搜索
-            for keyword in keywords:
-                categories = Category.objects.filter(name__contains=keyword)
-                books = books | Book.objects.filter(
-                    Q(title__contains=keyword) |
-                    Q(author__contains=keyword) |
-                    Q(publisher__contains=keyword) |
-                    Q(publish_date__contains=keyword) |
-                    Q(index_number__contains=keyword) |
-                    Q(category__in=categories)
-                )
-            books, count, page_count = paginate(request, books)
+            # 任意字段匹配搜索，走倒排索引并按相关度排序
+            books = search.search_books(keywords)
+            books, key = filter_by_availability(request, books)
+            books, count, page_count, cursor = paginate(request, books, key=key)
             # 添加分类号解析成名字的字段
             # 添加库存记录数字段
-            book_list = []
-            for book in books:
-                book_dict = model_to_dict(book)
-                book_dict['category_name'] = book.category.name
-                book_dict['inventory_count'] = Inventory.objects.filter(book=book).count()
-                book_list.append(book_dict)
-
-            return JsonResponse({'success': True, 'keyword': keywords, 'books': book_list, 'page_count': page_count, 'count': count}, status=200)      
+            book_list = book_rows(books, breakdown=True)
+
+            return JsonResponse({'success': True, 'keyword': keywords, 'books': book_list, 'page_count': page_count, 'count': count, 'cursor': cursor}, status=200)
     else:
         return render(request, 'user/borrow_search.html')
 
 # 某图书库存查看视图，返回图书信息+库存记录
 @login_required(login_url='')
 def user_borrow_inv(request):
-    book = Book.objects.get(id=request.GET['book_id'])
-    # 按照status排序，status=1的排在前面
-    inv_records = Inventory.objects.filter(book=book).order_by('status').values('id', 'book__title', 'location', 'status')
-    inv_list = list(inv_records)
-    # 找到该inv的借阅记录的最新应归还时间，不用first，status=1的只有一条
-    for inv in inv_list:
-        if inv['status'] == 2:
-            inv['return_date'] = BorrowRecord.objects.filter(inventory=inv['id'], status=1).first().return_date.strftime('%Y-%m-%d')
-        else:
-            inv['return_date'] = '-'
-        inv['get_status_display'] = Inventory.objects.get(id=inv['id']).get_status_display()
+    def load():
+        book = Book.objects.get(id=request.GET['book_id'])
+        # 副本、状态名和应还日期一次查出
+        return book, copy_rows(book.id)
+    # 副本状态按图书缓存，借还书、库存变更时随版本失效
+    book, inv_list = caching.cached('borrow_inv', [Book, Inventory, BorrowRecord], load, request.GET['book_id'])
     return render(request, 'user/shard_borrow_inv.html', {'book': book, 'inventory': inv_list})
 
 # 借阅图书
@@ -299,20 +357,12 @@ def user_borrow_inv(request):
 @require_POST
 def user_borrow_book(request):
     inventory_id = request.POST['inv_id']
-    inv = Inventory.objects.get(id=inventory_id, status=1)
-    maxBorrow = request.user.reader.max_borrow_limit
-    quota = maxBorrow - BorrowRecord.objects.filter(reader=request.user.reader, status=1).count()
-    if quota <= 0:
-        return JsonResponse({'success': False, 'error': "借阅失败，剩余借阅配额不足！"}, status=200)
-    if (inv is not None):
-        inv.status = 2
-        inv.last_borrowed_on = datetime.now()
-        inv.last_borrowed_by = request.user.reader
-        inv.save()
-        new_record = BorrowRecord(reader=request.user.reader, inventory=inv, borrow_date=datetime.now(), return_date=datetime.now() + timedelta(days=30), status=1)
-        new_record.save()
-        return JsonResponse({'success': True}, status=200)
-    return JsonResponse({'success': False}, status=400)
+    # 配额检查、抢占副本、写借阅记录在同一个加锁的事务里完成
+    try:
+        circulation.borrow(request.user.reader.id, inventory_id)
+    except circulation.CirculationError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=200)
+    return JsonResponse({'success': True}, status=200)
 
 
 # 归还图书
@@ -320,15 +370,11 @@ def user_borrow_book(request):
 @require_POST
 def user_return_book(request):
     record_id = request.POST['record_id']
-    record = BorrowRecord.objects.get(id=record_id, status=1, reader=request.user.reader)
-    if record is not None:
-        record.status = 0
-        record.save()
-        inv = record.inventory
-        inv.status = 1
-        inv.save()
-        return JsonResponse({'success': True}, status=200)
-    return JsonResponse({'success': False}, status=400)
+    try:
+        circulation.return_record(record_id, reader_id=request.user.reader.id)
+    except circulation.CirculationError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    return JsonResponse({'success': True}, status=200)
 
 # 查看个人信息视图
 @login_required(login_url='')
@@ -370,6 +416,14 @@ def admin_center(request):
     return render(request, 'admin/admin_center.html')
 
 # 读者信息视图
+# 读者列表可排序的列，sort 参数加 - 前缀为降序，默认按 id
+READER_SORT_KEYS = {
+    'id': 'id',
+    'username': 'user__username',
+    'max_borrow_limit': 'max_borrow_limit',
+    'active_loans': 'active_loans',
+}
+
 @admin_only
 def reader_list(request):
     # 搜索功能
@@ -377,30 +431,23 @@ def reader_list(request):
         keyword = request.POST['readers_keyword']
         # 拆解关键字，按空格分开，分别匹配
         keywords = keyword.split(' ')
-        # 任意字段匹配搜索
-        readers = Reader.objects.none()
+        # 任意字段匹配搜索，所有关键字合并成一个 WHERE
+        matched = Q()
         for keyword in keywords:
-            readers = readers | Reader.objects.filter(
-                Q(user__username__contains=keyword) |
-                Q(user__first_name__contains=keyword) |
-                Q(user__last_name__contains=keyword) |
-                Q(user__email__contains=keyword)
-            )
-        readers, count, page_count = paginate(request, readers)
-        # 添加分类号解析成名字的字段
-        # 添加库存记录数字段
-        reader_list = []
-        for reader in readers:
-            reader_dict = model_to_dict(reader)
-            reader_dict['username'] = reader.user.username
-            reader_dict['first_name'] = reader.user.first_name
-            reader_dict['last_name'] = reader.user.last_name
-            reader_dict['email'] = reader.user.email
-            reader_dict['is_active'] = reader.user.is_active
-            reader_dict['is_staff'] = reader.user.is_staff
-            reader_dict['max_borrow_limit'] = reader.max_borrow_limit
-            reader_list.append(reader_dict)
-        return JsonResponse({'success': True, 'keyword': keywords, 'readers': reader_list, 'page_count': page_count, 'count': count}, status=200)
+            matched |= Q(user__username__contains=keyword) | \
+                       Q(user__first_name__contains=keyword) | \
+                       Q(user__last_name__contains=keyword) | \
+                       Q(user__email__contains=keyword)
+        readers = with_active_loans(Reader.objects.filter(matched))
+        sort = request.POST.get('sort', 'id')
+        if sort.lstrip('-') not in READER_SORT_KEYS:
+            return JsonResponse({'success': False, 'error': 'Invalid sort'})
+        key = ('-' if sort.startswith('-') else '') + READER_SORT_KEYS[sort.lstrip('-')]
+        readers = readers.order_by(key, 'id')
+        readers, count, page_count, cursor = paginate(request, readers, key=key)
+        # 账号字段与未归还借阅数随读者行一次查询取出
+        reader_list = reader_rows(readers)
+        return JsonResponse({'success': True, 'keyword': keywords, 'sort': sort, 'readers': reader_list, 'page_count': page_count, 'count': count, 'cursor': cursor}, status=200)
     else:
         return render(request, 'admin/reader_list.html')
 
@@ -424,17 +471,9 @@ def add_readers_bulk(request):
         csv_file = request.FILES['readers_file']
         if not csv_file.name.endswith('.csv'):
             return JsonResponse({'success': False, 'error': 'File type error'})
-        file_data = csv_file.read().decode("utf-8")
-        valid, reason = upload_validator.reader_validate(file_data)
-        if not valid:
-            return JsonResponse({'success': False, 'error': reason})
-        lines = file_data.split("\n")
-        for line in lines:
-            fields = line.split(",")
-            user = User.objects.create_user(username=fields[0], first_name=fields[1], last_name=fields[2], email=fields[3], password=fields[4], is_staff=fields[5])
-            readerRecord = Reader(user=user, max_borrow_limit=fields[6])
-            readerRecord.save()
-        return JsonResponse({'success': True})
+        # 交给后台任务导入，前端凭 job_id 轮询进度
+        job = jobs.submit('readers', csv_file, request.user)
+        return JsonResponse({'success': True, 'job_id': job.id})
     else:
         return render(request, 'admin/shard/reader/add_bulk.html')
 
@@ -483,28 +522,14 @@ def book_list(request):
         keyword = request.POST['books_keyword']
         # 拆解关键字，按空格分开，分别匹配
         keywords = keyword.split(' ')
-        # 任意字段匹配搜索
-        books = Book.objects.none()
-        for keyword in keywords:
-            categories = Category.objects.filter(name__contains=keyword)
-            books = books | Book.objects.filter(
-                Q(title__contains=keyword) |
-                Q(author__contains=keyword) |
-                Q(publisher__contains=keyword) |
-                Q(publish_date__contains=keyword) |
-                Q(index_number__contains=keyword) |
-                Q(category__in=categories)
-            )
-        books, count, page_count = paginate(request, books)
+        # 任意字段匹配搜索，走倒排索引并按相关度排序
+        books = search.search_books(keywords)
+        books, key = filter_by_availability(request, books)
+        books, count, page_count, cursor = paginate(request, books, key=key)
         # 添加分类号解析成名字的字段
         # 添加库存记录数字段
-        book_list = []
-        for book in books:
-            book_dict = model_to_dict(book)
-            book_dict['category_name'] = book.category.name
-            book_dict['inventory_count'] = Inventory.objects.filter(book=book).count()
-            book_list.append(book_dict)
-        return JsonResponse({'success': True, 'keyword': keywords, 'books': book_list, 'page_count': page_count, 'count': count}, status=200)
+        book_list = book_rows(books, breakdown=True)
+        return JsonResponse({'success': True, 'keyword': keywords, 'books': book_list, 'page_count': page_count, 'count': count, 'cursor': cursor}, status=200)
     else:
         return render(request, 'admin/book_list.html')
             
@@ -535,20 +560,9 @@ def add_books_bulk(request):
         csv_file = request.FILES['books_file']
         if not csv_file.name.endswith('.csv'):
             return JsonResponse({'success': False, 'error': 'File type error'})
-        file_data = csv_file.read().decode("utf-8")
-        valid, reason = upload_validator.book_validate(file_data)
-        if not valid:
-            return JsonResponse({'success': False, 'error': reason})
-        lines = file_data.split("\n")
-        for line in lines:
-            fields = line.split(",")
-            catagory= Category.objects.get_or_create(category_number=fields[5], defaults={'name': '未命名分类'})[0]
-            try:
-                Book.objects.create(title=fields[0], author=fields[1], publisher=fields[2], publish_date=fields[3], 
-                                    index_number=fields[4], category=catagory, description=fields[6])
-            except Exception as e:
-                return JsonResponse({'success': False, 'error': str(e)})
-        return JsonResponse({'success': True})
+        # 交给后台任务导入，前端凭 job_id 轮询进度
+        job = jobs.submit('books', csv_file, request.user)
+        return JsonResponse({'success': True, 'job_id': job.id})
     else:
         return render(request, 'admin/shard/book/add_bulk.html')
 
@@ -564,7 +578,7 @@ def edit_book(request):
             book.index_number = request.POST['index_number']
             book.category = Category.objects.get_or_create(category_number=request.POST['category'], defaults={'name': '未命名分类'})[0]
             book.description = request.POST['description']
-            book.save()
+            book.save(update_fields=Book.EDITABLE_FIELDS)
             return JsonResponse({'success': True})
         except ObjectDoesNotExist:
             return JsonResponse({'success': False, 'error': 'Book not found'})
@@ -609,8 +623,8 @@ def category_list(request):
                 Q(category_number__contains=keyword) |
                 Q(name__contains=keyword)
             )
-        categories, count, page_count = paginate(request, categories)
-        return JsonResponse({'success': True, 'keyword': keywords, 'categories': list(categories.values()), 'page_count': page_count, 'count': count}, status=200)
+        categories, count, page_count, cursor = paginate(request, categories)
+        return JsonResponse({'success': True, 'keyword': keywords, 'categories': list(categories.values()), 'page_count': page_count, 'count': count, 'cursor': cursor}, status=200)
     else:
         return render(request, 'admin/category_list.html')
 
@@ -633,18 +647,9 @@ def add_categories_bulk(request):
         csv_file = request.FILES['categories_file']
         if not csv_file.name.endswith('.csv'):
             return JsonResponse({'success': False, 'error': 'File type error'})
-        file_data = csv_file.read().decode("utf-8")
-        valid, reason = upload_validator.category_validate(file_data)
-        if not valid:
-            return JsonResponse({'success': False, 'error': reason})
-        lines = file_data.split("\n")
-        for line in lines:
-            fields = line.split(",")
-            try:
-                Category.objects.create(category_number=fields[0], name=fields[1])
-            except Exception as e:
-                return JsonResponse({'success': False, 'error': str(e)})
-        return JsonResponse({'success': True})
+        # 交给后台任务导入，前端凭 job_id 轮询进度
+        job = jobs.submit('categories', csv_file, request.user)
+        return JsonResponse({'success': True, 'job_id': job.id})
     else:
         return render(request, 'admin/shard/category/add_bulk.html')
 
@@ -695,33 +700,16 @@ def inventory_list(request):
         # 任意字段匹配搜索
         inventories = Inventory.objects.none()
         for keyword in keywords:
+            # 图书相关字段走倒排索引
             inventories = inventories | Inventory.objects.filter(
-                Q(book__title__contains=keyword) |
-                Q(book__author__contains=keyword) |
-                Q(book__publisher__contains=keyword) |
-                Q(book__publish_date__contains=keyword) |
-                Q(book__index_number__contains=keyword) |
-                Q(book__category__category_number__contains=keyword) |
-                Q(book__category__name__contains=keyword) |
+                search.book_filter(keyword, 'book') |
                 Q(status__contains=keyword) |
                 Q(location__contains=keyword)
             )
-        inventories, count, page_count = paginate(request, inventories)
-        # 添加分类号解析成名字的字段
-        # 添加库存记录数字段
-        inventory_list = []
-        for inventory in inventories:
-            inventory_dict = model_to_dict(inventory)
-            inventory_dict['book_title'] = inventory.book.title
-            inventory_dict['book_author'] = inventory.book.author
-            inventory_dict['book_publisher'] = inventory.book.publisher
-            inventory_dict['book_publish_date'] = inventory.book.publish_date
-            inventory_dict['book_index_number'] = inventory.book.index_number
-            inventory_dict['book_category_number'] = inventory.book.category.category_number
-            inventory_dict['book_category_name'] = inventory.book.category.name
-            inventory_dict['status'] = inventory.get_status_display()
-            inventory_list.append(inventory_dict)
-        return JsonResponse({'success': True, 'keyword': keywords, 'inventories': inventory_list, 'page_count': page_count, 'count': count}, status=200)
+        inventories, count, page_count, cursor = paginate(request, inventories)
+        # 图书、分类字段随库存行一次 join 取出
+        inventory_list = inventory_rows(inventories)
+        return JsonResponse({'success': True, 'keyword': keywords, 'inventories': inventory_list, 'page_count': page_count, 'count': count, 'cursor': cursor}, status=200)
     else:
         return render(request, 'admin/inventory_list.html')
 
@@ -734,7 +722,9 @@ def add_inventory(request):
             return JsonResponse({'success': False, 'error': 'Invalid status'})
         location = request.POST['location']
         try:
-            Inventory.objects.create(book=book, status=status, location=location)
+            with transaction.atomic():
+                Inventory.objects.create(book=book, status=status, location=location)
+                Book.adjust_copies(book.id, total=1, available=int(status == '1'))
         except Exception as e:
             return JsonResponse({'success': False, 'error': str(e)})
         return JsonResponse({'success': True})
@@ -747,19 +737,9 @@ def add_inventories_bulk(request):
         csv_file = request.FILES['inventories_file']
         if not csv_file.name.endswith('.csv'):
             return JsonResponse({'success': False, 'error': 'File type error'})
-        file_data = csv_file.read().decode("utf-8")
-        valid, reason = upload_validator.inventory_validate(file_data)
-        if not valid:
-            return JsonResponse({'success': False, 'error': reason})
-        lines = file_data.split("\n")
-        for line in lines:
-            fields = line.split(",")
-            book = Book.objects.get(id=fields[0])
-            try:
-                Inventory.objects.create(book=book, status=fields[1], location=fields[2])
-            except Exception as e:
-                return JsonResponse({'success': False, 'error': str(e)})
-        return JsonResponse({'success': True})
+        # 交给后台任务导入，前端凭 job_id 轮询进度
+        job = jobs.submit('inventories', csv_file, request.user)
+        return JsonResponse({'success': True, 'job_id': job.id})
     else:
         return render(request, 'admin/shard/inventory/add_bulk.html')
     
@@ -767,18 +747,27 @@ def add_inventories_bulk(request):
 def edit_inventory(request):
     if request.method == 'POST':
         try:
-            inventory = Inventory.objects.get(id=request.POST['inventory_id'])
             status = request.POST['status']
-            # status处理：borrow=2时不可修改status，borrow!=2时只可在-1,0,1之间修改
-            if inventory.status == 2 and status != '2':
-                return JsonResponse({'success': False, 'error': 'Invalid status'})
-            elif inventory.status != 2:
-                if status not in ['-1','0', '1']:
+            # 副本行加锁后再检查状态，与借还事务互斥；写入用带原状态条件的 UPDATE，
+            # 即使行锁不生效（SQLite）也不会覆盖期间借出的状态，可借计数按锁定时的状态计算
+            with transaction.atomic():
+                inventory = Inventory.objects.select_for_update().get(id=request.POST['inventory_id'])
+                old_status = inventory.status
+                # status处理：borrow=2时不可修改status，borrow!=2时只可在-1,0,1之间修改
+                if old_status == 2 and status != '2':
                     return JsonResponse({'success': False, 'error': 'Invalid status'})
-                inventory.status = status
-            
-            inventory.location = request.POST['location']
-            inventory.save()
+                elif old_status != 2:
+                    if status not in ['-1','0', '1']:
+                        return JsonResponse({'success': False, 'error': 'Invalid status'})
+                    inventory.status = int(status)
+
+                if not Inventory.objects.filter(id=inventory.id, status=old_status) \
+                                        .update(status=inventory.status, location=request.POST['location']):
+                    return JsonResponse({'success': False, 'error': 'Inventory was changed, please retry'})
+                Book.adjust_copies(inventory.book_id, available=int(inventory.status == 1) - int(old_status == 1))
+                # 条件 UPDATE 不触发 signal，手动记录日志并令缓存失效
+                OperationLog.log('update', f'update a Inventory instance: #{inventory.id}', request.user)
+                caching.bump(Inventory)
             return JsonResponse({'success': True})
         except ObjectDoesNotExist:
             return JsonResponse({'success': False, 'error': 'Inventory not found'})
@@ -796,11 +785,16 @@ def edit_inventory(request):
 @admin_only
 def delete_inventory(request):
     try:
-        inventory = Inventory.objects.get(id=request.POST['inventory_id'])
-        # 删除库存记录前需要检查是否有借阅记录
-        if BorrowRecord.objects.filter(inventory=inventory).count() > 0:
-            return JsonResponse({'success': False, 'error': 'There are borrow records for this inventory'})
-        inventory.delete()
+        with transaction.atomic():
+            inventory = Inventory.objects.select_for_update().get(id=request.POST['inventory_id'])
+            # 删除库存记录前需要检查是否有借阅记录
+            if BorrowRecord.objects.filter(inventory=inventory).exists():
+                return JsonResponse({'success': False, 'error': 'There are borrow records for this inventory'})
+            # 借阅记录随副本级联删除，删除条件里再确认状态未变、仍无借阅记录
+            deleted, _ = Inventory.objects.filter(id=inventory.id, status=inventory.status, borrowrecord__isnull=True).delete()
+            if not deleted:
+                return JsonResponse({'success': False, 'error': 'Inventory was changed, please retry'})
+            Book.adjust_copies(inventory.book_id, total=-1, available=-int(inventory.status == 1))
         return JsonResponse({'success': True})
     except ObjectDoesNotExist:
         return JsonResponse({'success': False, 'error': 'Inventory not found'})
@@ -821,30 +815,59 @@ def borrow_record_list(request):
             records = records | BorrowRecord.objects.filter(
                 Q(reader__user__username__contains=keyword) |
                 Q(reader__user__email__contains=keyword) |
-                Q(inventory__book__title__contains=keyword) |
-                Q(inventory__book__index_number__contains=keyword) |
+                search.book_filter(keyword, 'inventory__book') |
                 Q(borrow_date__contains=keyword) |
                 Q(return_date__contains=keyword) |
                 Q(status__contains=keyword)
             )
-        records, count, page_count = paginate(request, records)
-        # 添加分类号解析成名字的字段
-        # 添加库存记录数字段
-        record_list = []
-        for record in records:
-            record_dict = model_to_dict(record)
-            record_dict['reader_username'] = record.reader.user.username
-            record_dict['reader_email'] = record.reader.user.email
-            record_dict['book_title'] = record.inventory.book.title
-            record_dict['book_index_number'] = record.inventory.book.index_number
-            record_dict['borrow_date'] = record.borrow_date.strftime('%Y-%m-%d')
-            record_dict['return_date'] = record.return_date.strftime('%Y-%m-%d')
-            record_dict['status'] = record.get_status_display()
-            record_list.append(record_dict)
-        return JsonResponse({'success': True, 'keyword': keywords, 'records': record_list, 'page_count': page_count, 'count': count}, status=200)
+        records, count, page_count, cursor = paginate(request, records, key='-id')
+        # 读者账号、图书字段随借阅记录一次 join 取出
+        record_list = borrow_record_rows(records)
+        return JsonResponse({'success': True, 'keyword': keywords, 'records': record_list, 'page_count': page_count, 'count': count, 'cursor': cursor}, status=200)
     else:
         return render(request, 'admin/borrow_record_list.html')
 
+# 流通台批量借还，id 列表可以重复传参，也可以用逗号分隔
+def parse_ids(values):
+    try:
+        ids = [int(item) for value in values for item in value.split(',') if item.strip()]
+    except ValueError:
+        raise ValueError('Invalid id')
+    if not ids:
+        raise ValueError('No ids given')
+    if len(ids) > circulation.MAX_BATCH:
+        raise ValueError(f'At most {circulation.MAX_BATCH} items per batch')
+    return ids
+
+@admin_only
+@require_POST
+def batch_borrow(request):
+    try:
+        reader_id = int(request.POST['reader_id'])
+    except KeyError:
+        return JsonResponse({'success': False, 'error': 'reader_id is required'})
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid reader_id'})
+    try:
+        inventory_ids = parse_ids(request.POST.getlist('inv_ids'))
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+    try:
+        results = circulation.borrow_many(reader_id, inventory_ids, operator=request.user)
+    except ObjectDoesNotExist:
+        return JsonResponse({'success': False, 'error': 'Reader not found'})
+    return JsonResponse({'success': True, 'count': sum(item['success'] for item in results), 'results': results})
+
+@admin_only
+@require_POST
+def batch_return(request):
+    try:
+        record_ids = parse_ids(request.POST.getlist('record_ids'))
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+    results = circulation.return_many(record_ids, operator=request.user)
+    return JsonResponse({'success': True, 'count': sum(item['success'] for item in results), 'results': results})
+
 # 操作日志视图
 @admin_only
 def operation_log_list(request):
@@ -863,20 +886,31 @@ def operation_log_list(request):
                 Q(operation_type__contains=keyword) |
                 Q(timestamp__contains=keyword)
             )
-        logs, count, page_count = paginate(request, logs)
-        # 添加分类号解析成名字的字段
-        # 添加库存记录数字段
-        log_list = []
-        for log in logs:
-            log_dict = model_to_dict(log)
-            log_dict['username'] = log.operator.username
-            log_dict['user_email'] = log.operator.email
-            log_dict['time'] = log.timestamp.strftime('%Y-%m-%d %H:%M:%S')
-            log_list.append(log_dict)
-        return JsonResponse({'success': True, 'keyword': keywords, 'logs': log_list, 'page_count': page_count, 'count': count}, status=200)
+        # 日志异步批量落库，id 不一定与产生时间同序，按 timestamp 索引倒序翻页
+        logs = logs.order_by('-timestamp', 'id')
+        logs, count, page_count, cursor = paginate(request, logs, key='-timestamp')
+        # 操作者用 LEFT JOIN 取出，没有操作者的日志也能显示
+        log_list = operation_log_rows(logs)
+        return JsonResponse({'success': True, 'keyword': keywords, 'logs': log_list, 'page_count': page_count, 'count': count, 'cursor': cursor}, status=200)
     else:
         return render(request, 'admin/operation_log_list.html')
 
+# 数据导出：kind 为 books/inventory/readers/borrow_records/operation_logs，
+# format 为 csv（默认）或 ndjson，gzip=1 时下载压缩文件；边查边发送，不受数据量限制
+@admin_only
+def export_data(request, kind):
+    if kind not in export.EXPORTS:
+        return JsonResponse({'success': False, 'error': 'Invalid export'})
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in export.FORMATS:
+        return JsonResponse({'success': False, 'error': 'Invalid format'})
+    compress = request.GET.get('gzip') == '1'
+    OperationLog.log('export', f'export {kind} as {fmt}', request.user)
+    content_type = 'application/gzip' if compress else export.FORMATS[fmt][0]
+    response = StreamingHttpResponse(export.stream(kind, fmt, compress), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{export.filename(kind, fmt, compress)}"'
+    return response
+
 # ----[触发器/signal]----
 
 # 主要是借阅记录状态变化时，记录操作日志
@@ -884,84 +918,116 @@ def operation_log_list(request):
 def log_borrow_record_save(sender, instance, created, **kwargs):
     operation_type = 'create' if created else 'update'
     content = f'{operation_type} a BorrowRecord instance: #{instance.id}'
-    operator = instance.reader.user  # 假设Reader模型有一个user字段记录操作者
-    OperationLog.log(operation_type, content, operator)
+    operator_id = instance.reader.user_id  # 借阅记录的操作者即读者本人
+    OperationLog.log(operation_type, content, operator_id=operator_id)
+    caching.bump(BorrowRecord)
+    # 新借出时累加借阅日汇总
+    if created:
+        rollup.record_borrow(instance)
 
 # 虽然正常情况下不会删除借阅记录，但是确保一下
 @receiver(post_delete, sender=BorrowRecord)
 def log_borrow_record_delete(sender, instance, **kwargs):
     operation_type = 'delete'
     content = f'{operation_type} a BorrowRecord instance'
-    operator = instance.reader.user  # 假设Reader模型有一个user字段记录操作者
-    OperationLog.log(operation_type, content, operator)
+    operator_id = instance.reader.user_id  # 借阅记录的操作者即读者本人
+    OperationLog.log(operation_type, content, operator_id=operator_id)
+    caching.bump(BorrowRecord)
 
 @receiver(post_save, sender=Inventory)
 def log_inventory_save(sender, instance, created, **kwargs):
     operation_type = 'create' if created else 'update'
     content = f'{operation_type} a Inventory instance: #{instance.id}'
-    operator = instance.last_borrowed_by.user
-    OperationLog.log(operation_type, content, operator)
+    # 新入库的副本还没有借阅人
+    operator_id = instance.last_borrowed_by.user_id if instance.last_borrowed_by_id else None
+    OperationLog.log(operation_type, content, operator_id=operator_id)
+    caching.bump(Inventory)
 
 @receiver(post_delete, sender=Inventory)
 def log_inventory_delete(sender, instance, **kwargs):
     operation_type = 'delete'
     content = f'{operation_type} a Inventory instance'
-    operator = instance.last_borrowed_by.user
-    OperationLog.log(operation_type, content, operator)
+    # 新入库的副本还没有借阅人
+    operator_id = instance.last_borrowed_by.user_id if instance.last_borrowed_by_id else None
+    OperationLog.log(operation_type, content, operator_id=operator_id)
+    caching.bump(Inventory)
 
 @receiver(post_save, sender=Book)
 def log_book_save(sender, instance, created, **kwargs):
     operation_type = 'create' if created else 'update'
     content = f'{operation_type} a Book instance: #{instance.id}'
-    operator = User.objects.get(username='admin')
-    OperationLog.log(operation_type, content, operator)
+    operator_id = oplog.admin_operator_id()
+    OperationLog.log(operation_type, content, operator_id=operator_id)
+    caching.bump(Book)
+    # 同步检索索引，删除时随外键级联清理
+    search.index_book(instance)
+    autocomplete.index_book(instance.id, instance.title, instance.author)
 
 @receiver(post_delete, sender=Book)
 def log_book_delete(sender, instance, **kwargs):
     operation_type = 'delete'
     content = f'{operation_type} a Book instance'
-    operator = User.objects.get(username='admin')
-    OperationLog.log(operation_type, content, operator)
+    operator_id = oplog.admin_operator_id()
+    OperationLog.log(operation_type, content, operator_id=operator_id)
+    caching.bump(Book)
+    autocomplete.remove_book(instance.id)
 
 @receiver(post_save, sender=Category)
 def log_category_save(sender, instance, created, **kwargs):
     operation_type = 'create' if created else 'update'
     content = f'{operation_type} a Category instance: #{instance.id}'
-    operator = User.objects.get(username='admin')
-    OperationLog.log(operation_type, content, operator)
+    operator_id = oplog.admin_operator_id()
+    OperationLog.log(operation_type, content, operator_id=operator_id)
+    caching.bump(Category)
+    # 分类名/号参与图书检索，修改后重建该分类下图书的索引
+    if not created:
+        search.index_category(instance)
 
 @receiver(post_delete, sender=Category)
 def log_category_delete(sender, instance, **kwargs):
     operation_type = 'delete'
     content = f'{operation_type} a Category instance'
-    operator = User.objects.get(username='admin')
-    OperationLog.log(operation_type, content, operator)
+    operator_id = oplog.admin_operator_id()
+    OperationLog.log(operation_type, content, operator_id=operator_id)
+    caching.bump(Category)
 
 @receiver(post_save, sender=Reader)
 def log_reader_save(sender, instance, created, **kwargs):
     operation_type = 'create' if created else 'update'
     content = f'{operation_type} a Reader instance: #{instance.id}'
-    operator = instance.user
-    OperationLog.log(operation_type, content, operator)
+    operator_id = instance.user_id
+    OperationLog.log(operation_type, content, operator_id=operator_id)
+    caching.bump(Reader)
+    if created:
+        autocomplete.index_reader(instance.user)
 
 @receiver(post_delete, sender=Reader)
 def log_reader_delete(sender, instance, **kwargs):
     operation_type = 'delete'
     content = f'{operation_type} a Reader instance'
-    operator = instance.user
-    OperationLog.log(operation_type, content, operator)
+    operator_id = instance.user_id
+    OperationLog.log(operation_type, content, operator_id=operator_id)
+    caching.bump(Reader)
+    autocomplete.remove_reader(instance.user_id)
 
 @receiver(post_save, sender=User)
-def log_user_save(sender, instance, created, **kwargs):
+def log_user_save(sender, instance, created, update_fields=None, **kwargs):
+    # 登录时只更新 last_login，不记日志
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
     operation_type = 'create' if created else 'update'
     content = f'{operation_type} a User instance: #{instance.id}'
-    operator = instance
-    OperationLog.log(operation_type, content, operator)
+    operator_id = instance.id
+    OperationLog.log(operation_type, content, operator_id=operator_id)
+    caching.bump(User)
+    # 读者的用户名、姓名在 User 上
+    autocomplete.update_user(instance)
 
 @receiver(post_delete, sender=User)
 def log_user_delete(sender, instance, **kwargs):
     operation_type = 'delete'
     content = f'{operation_type} a User instance'
-    operator = instance
-    OperationLog.log(operation_type, content, operator)
+    operator_id = instance.id
+    OperationLog.log(operation_type, content, operator_id=operator_id)
+    caching.bump(User)
     
\ No newline at end of file